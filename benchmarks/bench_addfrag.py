@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+"""
+Measure pisaContext.addFrag for the text nodes of a paragraph: ordinary
+text, text with NBSP and whitespace to collapse, and preformatted text
+with one line per text node, as a long <pre> block gives them.
+
+    python benchmarks/bench_addfrag.py --nodes 20000
+"""
+import os
+import sys
+import timeit
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from xhtml2pdf.context import pisaContext
+
+TEXTS = {
+    "plain": "Some words of ordinary text in a paragraph, %d of them. ",
+    "special": "Some words\n  of text   to\tcollapse, %d of them. ",
+    "pre": "    line %d of a preformatted block\n",
+}
+
+
+def add_frags(context, text, nodes):
+    context.clearFrag()
+    for i in range(nodes):
+        context.addFrag(text % i)
+    return context.text
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("--nodes", type="int", default=20000,
+                      help="text nodes of the paragraph")
+    parser.add_option("--repeat", type="int", default=3)
+    options, _ = parser.parse_args()
+
+    print("%-10s %10s %10s" % ("text", "frags", "time [s]"))
+    for label, text in sorted(TEXTS.items()):
+        context = pisaContext(".")
+        if label == "pre":
+            context.frag.whiteSpace = "pre"
+        elapsed = min(timeit.repeat(lambda: add_frags(context, text, options.nodes),
+                                    number=1, repeat=options.repeat))
+        print("%-10s %10d %10.3f" % (label, len(context.fragList), elapsed))
+
+
+if __name__ == "__main__":
+    main()
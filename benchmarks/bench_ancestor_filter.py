@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""
+Measure the time needed to compute the styles of all elements of a deeply
+nested document, with and without the ancestor filter rejecting descendant
+selectors whose ancestors are missing.
+
+    python benchmarks/bench_ancestor_filter.py --depths 10,20,40
+"""
+import os
+import sys
+import timeit
+from optparse import OptionParser
+
+import html5lib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from xhtml2pdf.w3c.css import CSSAncestorFilter, CSSBuilder, CSSCascadeStrategy, CSSParser
+from xhtml2pdf.w3c.cssDOMElementInterface import CSSDOMElementInterface
+
+
+def make_css(count):
+    rules = []
+    for i in range(count):
+        kind = i % 3
+        if kind == 0:
+            rules.append(".invoice%d table td span { color: red; }" % i)
+        elif kind == 1:
+            rules.append(".report%d div > span { color: blue; }" % i)
+        else:
+            rules.append("#page%d div span { font-weight: bold; }" % i)
+    rules.append(".invoice0 span { color: black; }")
+    return "\n".join(rules)
+
+
+def make_html(depth, width):
+    opening = "<div class='invoice0'>" + "".join("<div class='level%d'>" % i for i in range(depth))
+    closing = "</div>" * (depth + 1)
+    return "<html><body>%s%s%s</body></html>" % (
+        opening, "<span>x</span>" * width, closing)
+
+
+def walk(cascade, node, ancestorFilter):
+    if node.nodeType == node.ELEMENT_NODE:
+        element = CSSDOMElementInterface(node)
+        if ancestorFilter is not None:
+            element.ancestorBits = ancestorFilter.getAncestorBits(node)
+            ancestorFilter.push(node)
+        cascade.findStylesFor(element)
+    for child in node.childNodes:
+        walk(cascade, child, ancestorFilter)
+    if node.nodeType == node.ELEMENT_NODE and ancestorFilter is not None:
+        ancestorFilter.pop()
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("--depths", default="10,20,40",
+                      help="comma separated list of document depths")
+    parser.add_option("--rules", type="int", default=300)
+    parser.add_option("--width", type="int", default=50,
+                      help="number of elements at the deepest level")
+    parser.add_option("--repeat", type="int", default=3)
+    options, _ = parser.parse_args()
+
+    cssParser = CSSParser(CSSBuilder(mediumSet=["all"]))
+    cascade = CSSCascadeStrategy(user=cssParser.parse(make_css(options.rules)))
+
+    print("%8s %14s %14s %8s" % ("depth", "no filter [ms]", "filter [ms]", "speedup"))
+    for depth in [int(x) for x in options.depths.split(",")]:
+        document = html5lib.parse(make_html(depth, options.width), treebuilder="dom")
+
+        def unfiltered():
+            walk(cascade, document, None)
+
+        def filtered():
+            walk(cascade, document, CSSAncestorFilter())
+
+        t_unfiltered = min(timeit.repeat(unfiltered, number=1, repeat=options.repeat)) * 1000
+        t_filtered = min(timeit.repeat(filtered, number=1, repeat=options.repeat)) * 1000
+        print("%8d %14.2f %14.2f %7.1fx" % (depth, t_unfiltered, t_filtered, t_unfiltered / t_filtered))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+"""
+Compare the contexts of pisaContextFactory to new contexts for many small
+documents: the time to get a context and the time of pisaStory and of
+pisaDocument per document.
+
+    python benchmarks/bench_context.py --documents 500
+"""
+import io
+import os
+import sys
+import timeit
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from xhtml2pdf.context import pisaContext, pisaContextFactory
+from xhtml2pdf.document import pisaDocument, pisaStory
+
+SOURCE = """<html><head><title>Invoice %d</title></head><body>
+<h1>Invoice %d</h1><p>Dear customer, <b>thank you</b> for your order.</p>
+<table><tr><td>Item</td><td align="right">%d.00</td></tr></table>
+</body></html>"""
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("--documents", type="int", default=500)
+    parser.add_option("--repeat", type="int", default=3)
+    options, _ = parser.parse_args()
+
+    sources = [(SOURCE % (i, i, i)).encode("utf-8") for i in range(options.documents)]
+    factory = pisaContextFactory(".")
+    contexts = (("new", lambda: pisaContext(".", capacity=100 * 1024)),
+                ("factory", factory.getContext))
+
+    print("%-8s %14s %14s %14s" % ("context", "context [us]", "story [us]", "document [us]"))
+    for label, getContext in contexts:
+        results = []
+        for render in ((lambda src: getContext()),
+                       (lambda src: pisaStory(src, context=getContext())),
+                       (lambda src: pisaDocument(src, io.BytesIO(), context=getContext()))):
+            elapsed = min(timeit.repeat(lambda: [render(src) for src in sources],
+                                        number=1, repeat=options.repeat))
+            results.append(elapsed / len(sources) * 1e6)
+        print("%-8s %14.1f %14.1f %14.1f" % tuple([label] + results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""
+Measure how the time needed to parse a stylesheet scales with its size.
+
+Pass a git revision with --baseline to compare against the parser of that
+revision (e.g. one from before the parser worked on source positions):
+
+    python benchmarks/bench_css_parser.py --sizes 64,256,1024 --baseline <rev>
+"""
+import os
+import subprocess
+import sys
+import timeit
+import types
+from optparse import OptionParser
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+from xhtml2pdf.w3c import css
+
+RULES = [
+    ".c%d { color: red; margin: 0 auto; }",
+    "div.c%d > p, .c%d td { font: 12px/1.2 Arial, sans-serif !important; }",
+    "#id%d { background: url(image.png) no-repeat; padding: 1px 2px 3px 4px; }",
+    "a[href~='c%d']:hover { border: 1px solid #ccc; }",
+]
+
+
+def make_css(size):
+    rules = []
+    length = i = 0
+    while length < size:
+        rule = RULES[i % len(RULES)].replace("%d", str(i))
+        rules.append(rule)
+        length += len(rule) + 1
+        i += 1
+    return "\n".join(rules)
+
+
+def load_baseline(rev):
+    """Returns a CSSParser class built on cssParser.py of a git revision"""
+    source = subprocess.check_output(
+        ["git", "show", "%s:xhtml2pdf/w3c/cssParser.py" % rev], cwd=ROOT)
+    module = types.ModuleType("xhtml2pdf.w3c._baselineCssParser")
+    module.__package__ = "xhtml2pdf.w3c"
+    exec(compile(source, "cssParser.py@%s" % rev, "exec"), module.__dict__)
+
+    class BaselineCSSParser(module.CSSParser):
+        ParseError = css.CSSParseError
+
+    return BaselineCSSParser
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("--sizes", default="16,64,256,1024",
+                      help="comma separated list of stylesheet sizes in KB")
+    parser.add_option("--baseline", default=None,
+                      help="git revision of the parser to compare against")
+    parser.add_option("--repeat", type="int", default=3)
+    options, _ = parser.parse_args()
+
+    parsers = [("current", css.CSSParser)]
+    if options.baseline:
+        parsers.append((options.baseline, load_baseline(options.baseline)))
+
+    print("%8s " % "KB" + " ".join("%14s" % ("%s [s]" % name[:10]) for name, _ in parsers))
+    for size in [int(x) for x in options.sizes.split(",")]:
+        src = make_css(size * 1024)
+        timings = []
+        for name, factory in parsers:
+            def parse():
+                factory(css.CSSBuilder(mediumSet=["all"])).parse(src)
+
+            timings.append(min(timeit.repeat(parse, number=1, repeat=options.repeat)))
+        print("%8d " % size + " ".join("%14.3f" % t for t in timings))
+
+
+if __name__ == "__main__":
+    main()
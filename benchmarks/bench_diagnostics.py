@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""
+Measure what the warnings cost pisaParser on a document of nested
+sections which start with an attribute of a wrong value: the warning is
+given while the context is still at the section, which holds all the
+sections after it.  The warnings are logged to a handler which drops them
+(formatted) and not logged at all, compared to the same document with a
+valid attribute value.
+
+    python benchmarks/bench_diagnostics.py --sections 500 --paragraphs 5
+"""
+import logging
+import os
+import sys
+import timeit
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from xhtml2pdf.context import pisaContext
+from xhtml2pdf.parser import pisaParser
+
+SECTION = """<div class="section"><p align="%s">Section %d</p>
+%s
+"""
+
+
+def make_document(sections, paragraphs, align):
+    text = "".join("<p>Paragraph %d of the section, with <b>some</b> text.</p>\n" % i
+                   for i in range(paragraphs))
+    return ("<html><body>%s%s</body></html>" % (
+        "".join(SECTION % (align, i, text) for i in range(sections)),
+        "</div>" * sections)).encode("utf-8")
+
+
+class DroppingHandler(logging.Handler):
+
+    def emit(self, record):
+        self.format(record)
+
+
+def convert(src):
+    context = pisaParser(src, pisaContext("."))
+    return context.warn
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("--sections", type="int", default=500)
+    parser.add_option("--paragraphs", type="int", default=5,
+                      help="paragraphs of a section before the next section")
+    parser.add_option("--repeat", type="int", default=3)
+    options, _ = parser.parse_args()
+
+    logger = logging.getLogger("xhtml2pdf")
+    logger.propagate = False
+    logger.addHandler(DroppingHandler())
+
+    print("%-10s %10s %10s" % ("warnings", "count", "time [s]"))
+    for label, align, level in (("none", "center", logging.WARNING),
+                                ("logged", "middle", logging.WARNING),
+                                ("not logged", "middle", logging.ERROR)):
+        src = make_document(options.sections, options.paragraphs, align)
+        logger.setLevel(level)
+        count = convert(src)
+        elapsed = min(timeit.repeat(lambda: convert(src), number=1, repeat=options.repeat))
+        print("%-10s %10d %10.3f" % (label, count, elapsed))
+
+
+if __name__ == "__main__":
+    main()
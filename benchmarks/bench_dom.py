@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""
+Compare the documents html5lib builds with the compact DOM of xhtml2pdf.dom
+(pisaParseHTML5Lib) to the miniDOM documents it built before: the memory
+per node, also with the styles stored on the elements, and the time of
+the parse, of matching the selectors against all elements and of pisaLoop.
+
+    python benchmarks/bench_dom.py --rows 2000
+"""
+import os
+import sys
+import timeit
+import tracemalloc
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import html5lib
+from html5lib import treebuilders
+
+from xhtml2pdf.context import pisaContext
+from xhtml2pdf.parser import pisaCollectCSS, pisaLoop, pisaParseHTML5Lib
+from xhtml2pdf.w3c.css import prepareCSSNode
+from xhtml2pdf.w3c.cssDOMElementInterface import CSSDOMElementInterface
+
+HEAD = """<html><head><style>
+tr.odd td, p.odd { background-color: #eee; }
+td[align=right], span.amount { font-weight: bold; }
+a[href] { color: blue; }
+</style></head><body><h1>Ledger</h1>
+"""
+
+
+def make_document(rows):
+    return (HEAD + "<table>%s</table>%s</body></html>" % (
+        "".join("<tr class='%s' id='r%d'><td>%d</td><td>Booking &amp; fee %d</td>"
+                "<td align='right'>%d.00</td></tr>\n" % ("odd" if i % 2 else "even", i, i, i, i)
+                for i in range(rows)),
+        "".join("<p class='%s'>%d <a href='#r%d'>Booking</a> <span class='amount'>%d.00</span></p>\n"
+                % ("odd" if i % 2 else "even", i, i, i) for i in range(rows)))).encode("utf-8")
+
+
+def parse_minidom(src):
+    return html5lib.HTMLParser(tree=treebuilders.getTreeBuilder("dom")).parse(src)
+
+
+def count_nodes(document):
+    count, stack = 0, [document]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.childNodes)
+    return count
+
+
+def match_all(document, context):
+    # What CSSCollect does for every element, without sharing the styles
+    for node in document.getElementsByTagName("*"):
+        prepareCSSNode(node)
+        context.cssCascade.findStylesFor(CSSDOMElementInterface(node))
+
+
+def convert(document):
+    context = pisaContext(".")
+    pisaCollectCSS(document, context)
+    context.parseCSS()
+    pisaLoop(document, context)
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("--rows", type="int", default=2000,
+                      help="number of table rows and paragraphs")
+    parser.add_option("--repeat", type="int", default=3)
+    options, _ = parser.parse_args()
+
+    src = make_document(options.rows)
+    context = pisaContext(".")
+    pisaCollectCSS(pisaParseHTML5Lib(src), context)
+    context.parseCSS()
+
+    print("%-10s %8s %10s %14s %10s %10s %10s" % (
+        "dom", "nodes", "B/node", "styled B/node", "parse [s]", "match [s]", "loop [s]"))
+    for label, parse in (("minidom", parse_minidom), ("compact", pisaParseHTML5Lib)):
+        tracemalloc.start()
+        document = parse(src)
+        memory = tracemalloc.get_traced_memory()[0]
+        # With the values the CSS code stores on the elements
+        convert(document)
+        styled = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        nodes = count_nodes(document)
+
+        parse_time = min(timeit.repeat(lambda: parse(src), number=1, repeat=options.repeat))
+        match_time = min(timeit.repeat(lambda: match_all(parse(src), context),
+                                       number=1, repeat=options.repeat)) - parse_time
+        loop_time = min(timeit.repeat(lambda: convert(parse(src)),
+                                      number=1, repeat=options.repeat)) - parse_time
+        print("%-10s %8d %10d %14d %10.3f %10.3f %10.3f" % (
+            label, nodes, memory // nodes, styled // nodes, parse_time, match_time, loop_time))
+
+
+if __name__ == "__main__":
+    main()
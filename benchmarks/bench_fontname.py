@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+"""
+Measure getFontName on the CJK sample of testrender: the calls a document
+makes, the time they take and the time of pisaStory per document.  The
+body of the sample can be repeated for longer documents.
+
+    python benchmarks/bench_fontname.py --documents 50 --copies 100
+"""
+import os
+import sys
+import timeit
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from xhtml2pdf.context import pisaContext
+from xhtml2pdf.document import pisaStory
+
+SAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "testrender", "data", "source",
+                      "adobe_asian_lenguage_pack.html")
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("--documents", type="int", default=50)
+    parser.add_option("--copies", type="int", default=1,
+                      help="copies of the body of the sample")
+    parser.add_option("--repeat", type="int", default=3)
+    options, _ = parser.parse_args()
+
+    with open(SAMPLE, "rb") as f:
+        src = f.read()
+    head, body = src.split(b"<body>")
+    body, tail = body.split(b"</body>")
+    src = head + b"<body>" + body * options.copies + b"</body>" + tail
+    path = os.path.abspath(SAMPLE)
+    pisaStory(src, path)
+
+    calls = [0, 0.0]
+    getFontName = pisaContext.getFontName
+
+    def timedGetFontName(self, *args, **kw):
+        start = timeit.default_timer()
+        try:
+            return getFontName(self, *args, **kw)
+        finally:
+            calls[0] += 1
+            calls[1] += timeit.default_timer() - start
+
+    pisaContext.getFontName = timedGetFontName
+    pisaStory(src, path)
+    pisaContext.getFontName = getFontName
+
+    elapsed = min(timeit.repeat(lambda: pisaStory(src, path),
+                                number=options.documents, repeat=options.repeat))
+    print("%8s %18s %16s" % ("calls", "getFontName [ms]", "story [ms]"))
+    print("%8d %18.3f %16.2f" % (calls[0], calls[1] * 1000, elapsed / options.documents * 1000))
+
+
+if __name__ == "__main__":
+    main()
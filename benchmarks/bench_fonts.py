@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+"""
+Measure what the TrueType fonts of @font-face cost the documents which
+declare them: the time per document for documents using the given fonts,
+after the first, and the memory of the font cache.
+
+    python benchmarks/bench_fonts.py --documents 20 font.ttf [font.ttf ...]
+"""
+import io
+import os
+import sys
+import timeit
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from xhtml2pdf import context
+from xhtml2pdf.document import pisaDocument
+
+FONT_FACE = "@font-face { font-family: font%d; src: url('%s'); }\n.font%d { font-family: font%d; }\n"
+SOURCE = """<html><head><style>%s</style></head><body>%s</body></html>"""
+
+FONTS = [os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests", "samples", "font",
+                      "Noto_Sans", "NotoSans-%s.ttf" % style)
+         for style in ("Regular", "Bold", "Italic", "BoldItalic")]
+
+
+def make_document(fonts):
+    return SOURCE % (
+        "".join(FONT_FACE % (i, os.path.abspath(font), i, i) for i, font in enumerate(fonts)),
+        "".join("<p class='font%d'>Text in font %d, with some words.</p>" % (i, i) for i in range(len(fonts))))
+
+
+def main():
+    parser = OptionParser(usage="%prog [options] [font.ttf ...]")
+    parser.add_option("--documents", type="int", default=20)
+    parser.add_option("--repeat", type="int", default=3)
+    options, fonts = parser.parse_args()
+
+    src = make_document(fonts or FONTS)
+    pisaDocument(src, io.BytesIO())
+    elapsed = min(timeit.repeat(lambda: pisaDocument(src, io.BytesIO()),
+                                number=options.documents, repeat=options.repeat))
+    info = getattr(context, "fontCache", None)
+    info = info.info() if info is not None else {"size": 0, "bytes": 0}
+    print("%10s %16s %14s %14s" % ("fonts", "document [ms]", "cached fonts", "cache [KiB]"))
+    print("%10d %16.2f %14d %14d" % (len(fonts or FONTS), elapsed / options.documents * 1000,
+                                     info["size"], info["bytes"] // 1024))
+
+
+if __name__ == "__main__":
+    main()
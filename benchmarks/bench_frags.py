@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+"""
+Measure the fragment styles pisaParser creates for a text heavy document:
+the attributes a frag of the story stores itself, the memory of the story,
+the peak memory and the time of the conversion into the story.
+
+    python benchmarks/bench_frags.py --paragraphs 2000
+"""
+import os
+import sys
+import timeit
+import tracemalloc
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from xhtml2pdf.context import pisaContext
+from xhtml2pdf.default import DEFAULT_CSS
+from xhtml2pdf.parser import pisaParser
+
+PARAGRAPH = """<p class="%s">Paragraph %d has <b>bold</b>, <i>italic</i> and
+<span class="note">noted</span> words, a <a href="#p%d">link</a> and some
+plain text after them&nbsp;to fill the line, <em>emphasis <b>nested</b></em>.</p>
+"""
+
+
+def make_document(paragraphs):
+    return ("""<html><head><style>
+.odd { color: #333; } .note { background-color: #ffe; font-size: 9pt; }
+</style></head><body><h1>Text</h1>%s<ul>%s</ul></body></html>""" % (
+        "".join(PARAGRAPH % ("odd" if i % 2 else "even", i, i) for i in range(paragraphs)),
+        "".join("<li>Item <b>%d</b></li>" % i for i in range(paragraphs // 4)))).encode("utf-8")
+
+
+def convert(src):
+    return pisaParser(src, pisaContext("."), default_css=DEFAULT_CSS)
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("--paragraphs", type="int", default=2000)
+    parser.add_option("--repeat", type="int", default=3)
+    options, _ = parser.parse_args()
+
+    src = make_document(options.paragraphs)
+    tracemalloc.start()
+    context = convert(src)
+    story, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    frags = [frag for para in context.story for frag in getattr(para, "frags", ())]
+    stored = sum(len(frag.__dict__) for frag in frags)
+    elapsed = min(timeit.repeat(lambda: convert(src), number=1, repeat=options.repeat))
+
+    print("%8s %14s %14s %14s %10s" % ("frags", "attrs/frag", "story [KiB]", "peak [KiB]", "time [s]"))
+    print("%8d %14.1f %14d %14d %10.3f" % (len(frags), float(stored) / len(frags),
+                                          story // 1024, peak // 1024, elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+Compare the HTML parser backends of pisaParser: the time and the peak memory
+needed to build the miniDOM document of the testrender corpus and of a
+synthetic large table.  Backends which are not installed are skipped.
+
+    python benchmarks/bench_html_parsers.py --rows 10000
+"""
+import glob
+import os
+import sys
+import timeit
+import tracemalloc
+from optparse import OptionParser
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+from xhtml2pdf.parser import HTML_PARSERS
+
+TABLE = """
+<html><head><style>td.amount { text-align: right; }</style></head>
+<body><table>%s</table></body></html>
+"""
+
+
+def make_table(rows):
+    return (TABLE % "".join(
+        "<tr><td>%d</td><td>Item &amp; %d</td><td class='amount'>%d.00</td></tr>"
+        % (i, i, i) for i in range(rows))).encode("utf-8")
+
+
+def measure_memory(parse, src):
+    tracemalloc.start()
+    parse(src)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("--rows", type="int", default=10000,
+                      help="number of rows of the synthetic table")
+    parser.add_option("--repeat", type="int", default=3)
+    options, _ = parser.parse_args()
+
+    corpus = []
+    for name in sorted(glob.glob(os.path.join(ROOT, "testrender", "data", "source", "*.html"))):
+        with open(name, "rb") as f:
+            corpus.append(f.read())
+    documents = [
+        ("corpus (%d files)" % len(corpus), corpus),
+        ("table-%d-rows" % options.rows, [make_table(options.rows)]),
+    ]
+
+    print("%-24s %-10s %10s %12s" % ("document", "parser", "time [ms]", "peak [KiB]"))
+    for label, sources in documents:
+        for name, parse in sorted(HTML_PARSERS.items()):
+            try:
+                parse(b"<p></p>")
+            except ImportError:
+                print("%-24s %-10s %10s" % (label, name, "n/a"))
+                continue
+
+            def run():
+                for src in sources:
+                    parse(src)
+
+            elapsed = min(timeit.repeat(run, number=1, repeat=options.repeat)) * 1000
+            peak = max(measure_memory(parse, src) for src in sources)
+            print("%-24s %-10s %10.1f %12d" % (label, name, elapsed, peak // 1024))
+
+
+if __name__ == "__main__":
+    main()
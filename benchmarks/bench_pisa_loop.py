@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+Measure the document walk of pisaLoop on a deeply nested and on a wide
+document, comparing it with a recursive walk copying the path and the
+margins at every element like pisaLoop did before it kept its own stack.
+
+    python benchmarks/bench_pisa_loop.py --depth 1000 --width 100000
+"""
+import copy
+import os
+import sys
+import timeit
+from optparse import OptionParser
+from xml.dom import Node
+
+import html5lib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from xhtml2pdf.context import pisaContext
+from xhtml2pdf.parser import pisaLoop, pisaLoopEnd, pisaLoopStart, pisaPreLoop
+
+CSS = "<style>div { margin-left: 1px } span.odd { color: red }</style>"
+
+
+def make_deep(depth):
+    return "<html><head>%s</head><body>%s%s</body></html>" % (
+        CSS, "<div>x " * depth, "</div>" * depth)
+
+
+def make_wide(width):
+    return "<html><head>%s</head><body><div>%s</div></body></html>" % (
+        CSS, "".join("<span class='%s'>%d</span> " % ("odd" if i % 2 else "even", i)
+                     for i in range(width)))
+
+
+def recursive_loop(node, context, path=None, **kw):
+    """The walk as done before pisaLoop kept its own stack"""
+    path = copy.copy(path or [])
+    kw = copy.copy(kw) if kw else {
+        "margin-top": 0, "margin-bottom": 0, "margin-left": 0, "margin-right": 0}
+    if node.nodeType == Node.TEXT_NODE:
+        context.addFrag(node.data)
+    elif node.nodeType == Node.ELEMENT_NODE:
+        state = pisaLoopStart(node, context, path, kw)
+        if state is not None:
+            path = path + [node.tagName]
+            for child in node.childNodes:
+                recursive_loop(child, context, path, **state.kw)
+            pisaLoopEnd(context, state)
+    else:
+        for child in node.childNodes:
+            recursive_loop(child, context, path, **kw)
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("--depth", type="int", default=1000,
+                      help="nesting depth of the deep document")
+    parser.add_option("--width", type="int", default=100000,
+                      help="number of siblings of the wide document")
+    parser.add_option("--repeat", type="int", default=3)
+    options, _ = parser.parse_args()
+
+    documents = [
+        ("depth %d" % options.depth, make_deep(options.depth)),
+        ("width %d" % options.width, make_wide(options.width)),
+    ]
+    walks = [("recursive", recursive_loop), ("pisaLoop", pisaLoop)]
+
+    print("%-14s " % "document" + " ".join("%14s" % ("%s [s]" % name) for name, _ in walks))
+    for label, src in documents:
+        document = html5lib.parse(src, treebuilder="dom")
+        timings = []
+        for name, walk in walks:
+            def run():
+                context = pisaContext(".")
+                pisaPreLoop(document, context)
+                context.parseCSS()
+                walk(document, context)
+
+            try:
+                timings.append("%14.3f" % min(timeit.repeat(run, number=1, repeat=options.repeat)))
+            except RecursionError:
+                timings.append("%14s" % "RecursionError")
+        print("%-14s " % label + " ".join(timings))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""
+Measure the resident memory of pisaDocument during the layout of a long
+document, with the document tree released before the layout
+(pisaContext.releaseDocument) and kept as before.  Every run is done in a
+process of its own; on Linux the peak is reset before the layout starts, so
+it is the peak of the layout alone.
+
+    python benchmarks/bench_release.py --rows 2000,5000
+"""
+import os
+import resource
+import subprocess
+import sys
+import time
+from optparse import SUPPRESS_HELP, OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+HEAD = """<html><head><style>
+tr.odd td, p.odd { background-color: #eee; }
+td.amount, span.amount { text-align: right; font-weight: bold; }
+</style></head><body><h1>Ledger</h1>
+"""
+
+
+def make_document(rows):
+    return (HEAD + "<table>%s</table>%s</body></html>" % (
+        "".join("<tr class='%s'><td>%d</td><td>Booking &amp; fee %d</td>"
+                "<td class='amount'>%d.00</td></tr>\n" % ("odd" if i % 2 else "even", i, i, i)
+                for i in range(rows)),
+        "".join("<p class='%s'>%d Booking &amp; fee <span class='amount'>%d.00</span></p>\n"
+                % ("odd" if i % 2 else "even", i, i) for i in range(rows)))).encode("utf-8")
+
+
+def read_status(name):
+    """Value of name in /proc/self/status in KiB, or None"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(name + ":"):
+                    return int(line.split()[1])
+    except IOError:
+        pass
+    return None
+
+
+def reset_peak():
+    """Reset the peak resident memory of the process, Linux only"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except IOError:
+        return False
+
+
+def child(rows, release):
+    import logging
+    logging.disable(logging.CRITICAL)
+    from xhtml2pdf import pisa
+    from xhtml2pdf.context import pisaContext
+    from xhtml2pdf.xhtml2pdf_reportlab import PmlBaseDoc
+
+    if not release:
+        pisaContext.releaseDocument = lambda self: None
+
+    measures = {}
+    build = PmlBaseDoc.build
+
+    def measured_build(self, *args, **kw):
+        measures["start"] = read_status("VmRSS")
+        measures["reset"] = reset_peak()
+        result = build(self, *args, **kw)
+        measures["peak"] = read_status("VmHWM") if measures["reset"] else \
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return result
+
+    PmlBaseDoc.build = measured_build
+    src = make_document(rows)
+    start = time.time()
+    pisa.pisaDocument(src, open(os.devnull, "wb"))
+    print("%d %d %.2f %d" % (measures["start"] or 0, measures["peak"], time.time() - start,
+                             measures["reset"]))
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("--rows", default="2000,5000",
+                      help="comma separated list of table rows and paragraphs")
+    parser.add_option("--child", action="store_true", help=SUPPRESS_HELP)
+    parser.add_option("--release", action="store_true", help=SUPPRESS_HELP)
+    options, _ = parser.parse_args()
+
+    if options.child:
+        child(int(options.rows), options.release)
+        return
+
+    print("%8s %-10s %16s %16s %10s" % ("rows", "document", "RSS at build", "peak in build",
+                                        "time [s]"))
+    for rows in [int(x) for x in options.rows.split(",")]:
+        for label, release in (("kept", False), ("released", True)):
+            args = [sys.executable, __file__, "--child", "--rows", str(rows)]
+            if release:
+                args.append("--release")
+            start, peak, elapsed, reset = subprocess.check_output(args).split()
+            print("%8d %-10s %12d KiB %12d KiB %10s%s" % (
+                rows, label, int(start), int(peak), elapsed.decode(),
+                "" if int(reset) else " (peak of the whole run)"))
+
+
+if __name__ == "__main__":
+    main()
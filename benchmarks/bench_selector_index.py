@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""
+Measure how the cost of looking up the rules for an element scales with the
+number of rules in a stylesheet, with and without the selector index of
+CSSRuleset.
+
+    python benchmarks/bench_selector_index.py --rules 100,1000,10000
+"""
+import os
+import sys
+import timeit
+from optparse import OptionParser
+
+import html5lib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from xhtml2pdf.w3c.css import CSSBuilder, CSSParser
+from xhtml2pdf.w3c.cssDOMElementInterface import CSSDOMElementInterface
+
+HTML = b"""
+<div class="container">
+  <table class="table table-striped">
+    %s
+  </table>
+</div>
+"""
+
+
+def make_css(count):
+    rules = []
+    for i in range(count):
+        kind = i % 4
+        if kind == 0:
+            rules.append(".c%d { color: red; }" % i)
+        elif kind == 1:
+            rules.append(".container .c%d td { margin-left: 1px; }" % i)
+        elif kind == 2:
+            rules.append("#id%d { color: blue; }" % i)
+        else:
+            rules.append("div.c%d > p { font-size: 10pt; }" % i)
+    rules.append("td { color: black; }")
+    rules.append(".table td { padding: 1px; }")
+    return "\n".join(rules)
+
+
+def full_scan(ruleset, element, attrName):
+    result = [(s, d) for s, d in ruleset.items()
+              if attrName in d and s.matches(element)]
+    result.sort()
+    return result
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("--rules", default="100,1000,5000,20000",
+                      help="comma separated list of stylesheet sizes")
+    parser.add_option("--cells", type="int", default=50,
+                      help="number of table cells looked up per run")
+    parser.add_option("--repeat", type="int", default=3)
+    options, _ = parser.parse_args()
+
+    rows = "".join("<tr><td class='c%d'>x</td></tr>" % i for i in range(options.cells))
+    document = html5lib.parse(HTML % rows.encode(), treebuilder="dom")
+    elements = [CSSDOMElementInterface(node) for node in document.getElementsByTagName("td")]
+
+    print("%8s %12s %12s %8s" % ("rules", "scan [ms]", "index [ms]", "speedup"))
+    for count in [int(x) for x in options.rules.split(",")]:
+        ruleset = CSSParser(CSSBuilder(mediumSet=["all"])).parse(make_css(count))[0]
+        ruleset.getIndex()
+
+        def scan():
+            for element in elements:
+                full_scan(ruleset, element, "color")
+
+        def indexed():
+            for element in elements:
+                ruleset.findCSSRulesFor(element, "color")
+
+        t_scan = min(timeit.repeat(scan, number=1, repeat=options.repeat)) * 1000
+        t_index = min(timeit.repeat(indexed, number=1, repeat=options.repeat)) * 1000
+        print("%8d %12.2f %12.2f %7.1fx" % (count, t_scan, t_index, t_scan / t_index))
+
+
+if __name__ == "__main__":
+    main()
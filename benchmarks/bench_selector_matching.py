@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""
+Measure selector matching with descendant selector heavy CSS against deep
+documents, comparing the compiled matchers of the selectors with matching
+through the qualifier objects and element interfaces.
+
+    python benchmarks/bench_selector_matching.py --depths 5,10,20
+"""
+import os
+import sys
+import timeit
+from optparse import OptionParser
+
+import html5lib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from xhtml2pdf.w3c.css import CSSBuilder, CSSParser
+from xhtml2pdf.w3c.cssDOMElementInterface import CSSDOMElementInterface
+
+
+def make_css(count):
+    rules = []
+    for i in range(count):
+        kind = i % 4
+        if kind == 0:
+            rules.append(".c%d div span { color: red; }" % i)
+        elif kind == 1:
+            rules.append("body .c%d > div span.x { color: red; }" % i)
+        elif kind == 2:
+            rules.append("#id%d div div span { color: red; }" % i)
+        else:
+            rules.append("div.c%d + div span { color: red; }" % i)
+    return "\n".join(rules)
+
+
+def make_html(depth, leaves):
+    opening = "".join("<div class='c%d'>" % i for i in range(depth))
+    closing = "</div>" * depth
+    return "<html><body>%s%s%s</body></html>" % (
+        opening, "<span class='x'>x</span>" * leaves, closing)
+
+
+def object_graph_matches(selector, element):
+    """Matching as done before selectors were compiled"""
+    if selector.fullName[1] not in ('*', element.domElement.tagName):
+        return False
+    for qualifier in selector.qualifiers:
+        if qualifier.isCombiner():
+            if qualifier.op == ' ':
+                if not any(object_graph_matches(qualifier.selector, parent)
+                           for parent in element.iterXMLParents()):
+                    return False
+            elif qualifier.op == '>':
+                parent = next(element.iterXMLParents(), None)
+                if parent is None or not object_graph_matches(qualifier.selector, parent):
+                    return False
+            else:
+                sibling = element.getPreviousSibling()
+                if sibling is None or not object_graph_matches(
+                        qualifier.selector, element.__class__(sibling)):
+                    return False
+        elif not qualifier.matches(element):
+            return False
+    return True
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("--depths", default="5,10,20",
+                      help="comma separated list of document depths")
+    parser.add_option("--rules", type="int", default=400)
+    parser.add_option("--leaves", type="int", default=20,
+                      help="number of elements matched at the deepest level")
+    parser.add_option("--repeat", type="int", default=3)
+    options, _ = parser.parse_args()
+
+    selectors = list(CSSParser(CSSBuilder(mediumSet=["all"])).parse(make_css(options.rules))[0])
+
+    print("%8s %14s %14s %8s" % ("depth", "objects [ms]", "compiled [ms]", "speedup"))
+    for depth in [int(x) for x in options.depths.split(",")]:
+        document = html5lib.parse(make_html(depth, options.leaves), treebuilder="dom")
+        elements = [CSSDOMElementInterface(node) for node in document.getElementsByTagName("span")]
+
+        def objects():
+            for element in elements:
+                for selector in selectors:
+                    object_graph_matches(selector, element)
+
+        def compiled():
+            for element in elements:
+                for selector in selectors:
+                    selector.matches(element)
+
+        t_objects = min(timeit.repeat(objects, number=1, repeat=options.repeat)) * 1000
+        t_compiled = min(timeit.repeat(compiled, number=1, repeat=options.repeat)) * 1000
+        print("%8d %14.2f %14.2f %7.1fx" % (depth, t_objects, t_compiled, t_objects / t_compiled))
+
+
+if __name__ == "__main__":
+    main()
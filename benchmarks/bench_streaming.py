@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""
+Compare the peak memory and the time needed to convert a long ledger of
+well-formed XHTML with pisaParser building the document tree and in
+streaming mode.  The ledger is either one long table or a sequence of
+paragraphs.
+
+    python benchmarks/bench_streaming.py --rows 2000,8000 --layout table
+"""
+import os
+import sys
+import time
+import tracemalloc
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from xhtml2pdf.context import pisaContext
+from xhtml2pdf.files import pisaTempFile
+from xhtml2pdf.parser import pisaParser
+
+HEAD = """<?xml version="1.0" encoding="utf-8"?>
+<html xmlns="http://www.w3.org/1999/xhtml"><head><style>
+tr.odd td, p.odd { background-color: #eee; }
+td.amount, span.amount { text-align: right; font-weight: bold; }
+</style></head><body><h1>Ledger</h1>
+"""
+
+ROWS = {
+    "table": ("<table>", "<tr class='%s'><td>%d</td><td>Booking &amp; fee %d</td>"
+              "<td class='amount'>%d.00</td></tr>\n", "</table>"),
+    "paragraphs": ("<div>", "<p class='%s'>%d Booking &amp; fee %d "
+                   "<span class='amount'>%d.00</span></p>\n", "</div>"),
+}
+
+
+def write_ledger(f, rows, layout):
+    opening, row, closing = ROWS[layout]
+    f.write((HEAD + opening).encode("utf-8"))
+    for i in range(rows):
+        f.write((row % ("odd" if i % 2 else "even", i, i, i)).encode("utf-8"))
+    f.write((closing + "</body></html>").encode("utf-8"))
+    f.seek(0)
+
+
+def measure(f, streaming):
+    f.seek(0)
+    tracemalloc.start()
+    start = time.time()
+    pisaParser(f, pisaContext("."), streaming=streaming)
+    elapsed = time.time() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("--rows", default="2000,8000",
+                      help="comma separated list of ledger lengths")
+    parser.add_option("--layout", default="paragraphs",
+                      help="table or paragraphs")
+    options, _ = parser.parse_args()
+
+    print("%8s %-10s %10s %12s" % ("rows", "mode", "time [s]", "peak [KiB]"))
+    for rows in [int(x) for x in options.rows.split(",")]:
+        f = pisaTempFile(capacity=-1)
+        write_ledger(f, rows, options.layout)
+        for label, streaming in (("tree", False), ("streaming", True)):
+            elapsed, peak = measure(f, streaming)
+            print("%8d %-10s %10.2f %12d" % (rows, label, elapsed, peak // 1024))
+
+
+if __name__ == "__main__":
+    main()
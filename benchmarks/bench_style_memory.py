@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""
+Report the peak memory used to parse and style the documents of the
+testrender corpus and a synthetic large table, together with the number of
+elements and of distinct computed style objects.
+
+    python benchmarks/bench_style_memory.py --rows 10000
+
+Run the copy of this script in another checkout to compare revisions.
+"""
+import glob
+import os
+import sys
+import tracemalloc
+from optparse import OptionParser
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+from xhtml2pdf.context import pisaContext
+from xhtml2pdf.parser import pisaParser
+
+TABLE = """
+<html><head><style>
+tr.odd td { background-color: #eee; }
+td.amount { text-align: right; }
+</style></head><body><table>%s</table></body></html>
+"""
+
+
+def make_table(rows):
+    return TABLE % "".join(
+        "<tr class='%s'><td>%d</td><td>Item %d</td><td class='amount'>%d.00</td></tr>"
+        % ("odd" if i % 2 else "even", i, i, i) for i in range(rows))
+
+
+def measure(path, src):
+    tracemalloc.start()
+    context = pisaContext(path)
+    pisaParser(src, context)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak, context
+
+
+def count_styles(document_root):
+    elements = 0
+    styles = set()
+    stack = [document_root]
+    while stack:
+        node = stack.pop()
+        if hasattr(node, "cssAttrs"):
+            elements += 1
+            styles.add(id(node.cssAttrs))
+        stack.extend(node.childNodes)
+    return elements, len(styles)
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("--rows", type="int", default=10000,
+                      help="number of rows of the synthetic table")
+    options, _ = parser.parse_args()
+
+    documents = []
+    for name in sorted(glob.glob(os.path.join(ROOT, "testrender", "data", "source", "*.html"))):
+        with open(name, "rb") as f:
+            documents.append((os.path.basename(name), name, f.read()))
+    documents.append(("table-%d-rows" % options.rows, ".", make_table(options.rows)))
+
+    print("%-36s %12s %10s %10s" % ("document", "peak [KiB]", "elements", "styles"))
+    total = 0
+    for label, path, src in documents:
+        peak, context = measure(path, src)
+        root = context.node
+        while root is not None and root.parentNode is not None:
+            root = root.parentNode
+        elements, styles = count_styles(root) if root is not None else (0, 0)
+        total += peak
+        print("%-36s %12d %10d %10d" % (label, peak // 1024, elements, styles))
+    print("%-36s %12d" % ("total", total // 1024))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+Count the fragments pisaLoop creates and measure its time on the
+testrender corpus and on an indented table, with and without removing the
+insignificant whitespace recorded by pisaNormalizeWhitespace first.
+
+    python benchmarks/bench_whitespace.py --rows 2000
+"""
+import glob
+import os
+import sys
+import timeit
+from optparse import OptionParser
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+from xhtml2pdf.context import pisaContext
+from xhtml2pdf.parser import pisaCollectCSS, pisaLoop, pisaNormalizeWhitespace, pisaParseHTML5Lib
+
+TABLE = """<html>
+  <head>
+    <style>td.amount { text-align: right; }</style>
+  </head>
+  <body>
+    <table>
+%s
+    </table>
+  </body>
+</html>
+"""
+
+ROW = """      <tr>
+        <td>%d</td>
+        <td>Item &amp; %d</td>
+        <td class="amount">%d.00</td>
+      </tr>"""
+
+
+class CountingContext(pisaContext):
+
+    frags = 0
+
+    def _appendFrag(self, frag):
+        self.frags += 1
+        pisaContext._appendFrag(self, frag)
+
+
+def convert(sources, normalize):
+    frags = 0
+    for path, src in sources:
+        document = pisaParseHTML5Lib(src)
+        context = CountingContext(path)
+        pisaCollectCSS(document, context)
+        context.parseCSS()
+        if normalize:
+            pisaNormalizeWhitespace(document, context)
+        pisaLoop(document, context)
+        frags += context.frags
+    return frags
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("--rows", type="int", default=2000,
+                      help="number of rows of the indented table")
+    parser.add_option("--repeat", type="int", default=3)
+    options, _ = parser.parse_args()
+
+    corpus = []
+    for name in sorted(glob.glob(os.path.join(ROOT, "testrender", "data", "source", "*.html"))):
+        with open(name, "rb") as f:
+            corpus.append((name, f.read()))
+    table = TABLE % "\n".join(ROW % (i, i, i) for i in range(options.rows))
+    documents = [
+        ("corpus (%d files)" % len(corpus), corpus),
+        ("table-%d-rows" % options.rows, [(ROOT, table.encode("utf-8"))]),
+    ]
+
+    print("%-24s %-10s %10s %10s" % ("document", "whitespace", "frags", "time [s]"))
+    for label, sources in documents:
+        for mode, normalize in (("kept", False), ("ignored", True)):
+            frags = convert(sources, normalize)
+            elapsed = min(timeit.repeat(lambda: convert(sources, normalize),
+                                        number=1, repeat=options.repeat))
+            print("%-24s %-10s %10d %10.3f" % (label, mode, frags, elapsed))
+
+
+if __name__ == "__main__":
+    main()
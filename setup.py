@@ -38,6 +38,10 @@ setup(
                       "python-bidi>=0.4.2", "arabic-reshaper>=2.1.0",
                       "pyHanko>=0.12.1",
                       "pyhanko-certvalidator>=0.19.5"],
+    extras_require={
+        # The optional lxml HTML parser backend, see xhtml2pdf.parser
+        "lxml": ["lxml"],
+    },
     include_package_data=True,
     packages=find_packages(exclude=["tests", "tests.*", "manual_test", "manual_test.*"]),
     #    test_suite = "tests", They're not even working yet
@@ -1,10 +1,12 @@
 # -*- coding: utf-8 -*-
 import io
-from unittest import TestCase
+from unittest import TestCase, mock
 
 from PyPDF3 import PdfFileReader
 from reportlab.pdfbase import _cidfontdata
 
+from xhtml2pdf import util
+from xhtml2pdf.context import pisaContext
 from xhtml2pdf.document import pisaDocument
 from xhtml2pdf.util import get_default_asian_font
 
@@ -149,6 +151,27 @@ class AsianFontSupportTests(TestCase):
         # Test if equal to reference
         self.assertEqual(reference, reportlab_fonts, 'New asian fonts added or changed by ReportLab !')
 
+    def test_asian_fonts_registered_once(self):
+        """ Tests that a CID font is registered once, for all documents and elements using it """
+
+        with mock.patch.object(util.pdfmetrics, "registerFont", wraps=util.pdfmetrics.registerFont) as registerFont, \
+                mock.patch.object(util, "registered_asian_fonts", set()):
+            for i in range(2):
+                context = pisaContext(".")
+                self.assertEqual(context.getFontName("STSong-Light"), "STSong-Light")
+                self.assertEqual(context.getFontName("stsong-light, serif"), "STSong-Light")
+        self.assertEqual(registerFont.call_count, 1)
+
+    def test_font_names_after_register_font(self):
+        """ Tests that the font names looked up are looked up again once a font is registered """
+
+        context = pisaContext(".")
+        self.assertEqual(context.getFontName("MyFont, Courier"), "Courier")
+        self.assertEqual(context.getFontName(["MyFont", "Courier"]), "Courier")
+        context.registerFont("MyFont")
+        self.assertEqual(context.getFontName("MyFont, Courier"), "MyFont")
+        self.assertEqual(context.getFontName(["MyFont", "Courier"]), "MyFont")
+
 
 def get_fonts_from_page(obj, fnt):
     for k in obj:
@@ -0,0 +1,47 @@
+from unittest import TestCase
+
+from xhtml2pdf.w3c.css import CSSBuilder, CSSParser
+
+
+class CssParserTest(TestCase):
+
+    def setUp(self):
+        self.parser = CSSParser(CSSBuilder(mediumSet=["all"]))
+
+    def _declarations(self, src, important=False):
+        ruleset = self.parser.parse(src)[int(important)]
+        return dict((selector.asString(), dict(declarations))
+                    for selector, declarations in ruleset.items())
+
+    def test_rulesets(self):
+        result = self._declarations("""
+            p { color: red; margin-left: 1cm }
+            div.box > p, #main { font-weight: bold }
+        """)
+        self.assertEqual(result["p"], {"color": "red", "margin-left": ("1", "cm")})
+        self.assertEqual(result["div.box>p"], {"font-weight": "bold"})
+        self.assertEqual(result["*#main"], {"font-weight": "bold"})
+
+    def test_important(self):
+        result = self._declarations("p { color: red !important; margin-left: 0 }", important=True)
+        self.assertEqual(result, {"p": {"color": "red"}})
+
+    def test_star_property_hack(self):
+        result = self._declarations("p { *zoom: 1; color: red }")
+        self.assertEqual(result["p"], {"-nothing-zoom": "1", "color": "red"})
+
+    def test_unknown_at_rules_are_skipped(self):
+        result = self._declarations("""
+            @foo bar;
+            @foo { color: red }
+            p { color: blue }
+        """)
+        self.assertEqual(result, {"p": {"color": "blue"}})
+
+    def test_large_stylesheet(self):
+        src = "\n".join(".c%d { color: red; }" % i for i in range(5000))
+        self.assertEqual(len(self.parser.parse(src)[0]), 5000)
+
+    def test_inline(self):
+        result = self.parser.parseInline("color: red; *zoom: 1")
+        self.assertEqual(dict(result[0]), {"color": "red", "-nothing-zoom": "1"})
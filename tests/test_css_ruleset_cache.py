@@ -0,0 +1,104 @@
+from unittest import TestCase
+
+from xhtml2pdf import context as pisa_context
+from xhtml2pdf.context import pisaContext
+from xhtml2pdf.default import DEFAULT_CSS
+from xhtml2pdf.w3c.css import CSSRuleset, CSSRulesetCache
+
+
+class CSSRulesetCacheTest(TestCase):
+
+    def test_hits_and_misses(self):
+        cache = CSSRulesetCache(maxsize=2)
+        key = cache.makeKey("p { color: red }", ["pdf"])
+        self.assertIsNone(cache.get(key))
+        cache.put(key, "parsed")
+        self.assertEqual(cache.get(key), "parsed")
+        self.assertEqual(cache.info()["hits"], 1)
+        self.assertEqual(cache.info()["misses"], 1)
+
+    def test_key_depends_on_medium(self):
+        self.assertNotEqual(CSSRulesetCache.makeKey("p {}", ["pdf"]),
+                            CSSRulesetCache.makeKey("p {}", ["screen"]))
+
+    def test_lru_eviction(self):
+        cache = CSSRulesetCache(maxsize=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertIn("c", cache)
+        self.assertEqual(len(cache), 2)
+
+
+class ContextCSSCacheTest(TestCase):
+
+    def setUp(self):
+        pisa_context.cssRulesetCache.clear()
+
+    def _parse(self, author_css):
+        c = pisaContext(".")
+        c.addDefaultCSS(DEFAULT_CSS)
+        c.addCSS(author_css)
+        c.parseCSS()
+        return c
+
+    def test_stylesheets_are_shared(self):
+        first = self._parse("p { color: red }")
+        second = self._parse("p { color: red }")
+        self.assertIs(first.cssDefault, second.cssDefault)
+        self.assertIs(first.css, second.css)
+        self.assertEqual(pisa_context.cssRulesetCache.hits, 2)
+
+    def test_page_rules_are_not_cached(self):
+        css = "@page { size: a5; } p { color: red }"
+        first = self._parse(css)
+        second = self._parse(css)
+        self.assertIsNot(first.css, second.css)
+        self.assertEqual(second.pageSize, first.pageSize)
+        self.assertIn("body", second.templateList)
+
+
+class InlineCSSCacheTest(TestCase):
+
+    def setUp(self):
+        pisa_context.cssInlineCache.clear()
+        self.context = pisaContext(".")
+        self.context.parseCSS()
+
+    def test_inline_styles_are_shared(self):
+        first = self.context.cssParser.parseInline("text-align: right")
+        second = self.context.cssParser.parseInline("text-align: right")
+        self.assertIs(first, second)
+        self.assertEqual(dict(first[0]), {"text-align": "right"})
+        self.assertEqual(pisa_context.cssInlineCache.info()["hits"], 1)
+        self.assertEqual(pisa_context.cssInlineCache.info()["misses"], 1)
+
+    def test_shorthands_are_expanded(self):
+        style = self.context.cssParser.parseInline("margin: 0")[0]
+        self.assertEqual(style["margin-left"], "0")
+        self.assertNotIn("margin", style)
+
+
+class RulesetIndexTest(TestCase):
+
+    def test_index_is_published_last(self):
+        assigned = []
+
+        class RecordingRuleset(CSSRuleset):
+            def __setattr__(self, name, value):
+                assigned.append((name, value is not None))
+                CSSRuleset.__setattr__(self, name, value)
+
+        c = pisaContext(".")
+        c.addCSS("p.note { color: red } p { color: blue }")
+        c.parseCSS()
+        ruleset = RecordingRuleset(c.css[0])
+        del assigned[:]
+        index = ruleset.getIndex()
+        self.assertEqual(assigned[-1], ("_index", True))
+        self.assertEqual([name for name, isSet in assigned[:-1]], ["_sourceOrder", "_selectorFeatures"])
+        self.assertIs(ruleset.getIndex(), index)
+        self.assertEqual(len(ruleset._sourceOrder), 2)
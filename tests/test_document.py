@@ -3,11 +3,15 @@ from __future__ import unicode_literals
 import io
 import os
 import tempfile
-from unittest import TestCase, skipIf
+import weakref
+from unittest import TestCase, mock, skipIf
 
 from PyPDF3 import PdfFileReader
 
+from xhtml2pdf import parser
+from xhtml2pdf.context import pisaContext, pisaContextFactory
 from xhtml2pdf.document import pisaDocument
+from xhtml2pdf.xhtml2pdf_reportlab import PmlBaseDoc
 
 HTML_CONTENT = """<!DOCTYPE html>
 <html>
@@ -216,3 +220,54 @@ class DocumentTest(TestCase):
         with io.BytesIO() as in_memory_file:
             pisaDocument(io.StringIO(HTML_CONTENT.format(head="", extra_html="")), dest=in_memory_file)
             self.assertGreater(len(in_memory_file.getvalue()), 0)
+
+    def test_document_released_before_layout(self):
+        elements = []
+        collectCSS = parser.pisaCollectCSS
+        build = PmlBaseDoc.build
+
+        def recordingCollectCSS(document, context):
+            elements.append(weakref.ref(document.getElementsByTagName("td")[0]))
+            collectCSS(document, context)
+
+        def checkingBuild(doc, *args, **kw):
+            self.assertEqual(len(elements), 1)
+            self.assertIsNone(elements[0]())
+            return build(doc, *args, **kw)
+
+        with mock.patch.object(parser, "pisaCollectCSS", recordingCollectCSS), \
+                mock.patch.object(PmlBaseDoc, "build", checkingBuild):
+            context = pisaDocument(HTML_CONTENT.format(head="", extra_html="<table><tr><td>x</td></tr></table>"))
+        self.assertIsNone(context.node)
+        self.assertGreater(len(context.dest.getvalue()), 0)
+
+    def test_context_factory(self):
+        factory = pisaContextFactory(link_callback=lambda uri, rel: uri)
+        first = factory.getContext()
+        pisaDocument(HTML_CONTENT.format(head="<title>First</title>" + "".join(CSS_TESTS), extra_html=""),
+                     context=first)
+        first.registerFont("FactoryTestFont")
+        second = pisaDocument(HTML_CONTENT.format(head="", extra_html=""), context=factory.getContext())
+
+        self.assertEqual(first.meta["title"], "First")
+        self.assertEqual(second.meta["title"], "")
+        self.assertIn("two", first.templateList)
+        self.assertEqual(list(second.templateList), [])
+        self.assertIn("factorytestfont", first.fontList)
+        self.assertNotIn("factorytestfont", second.fontList)
+        self.assertNotIn("factorytestfont", factory.template.fontList)
+        self.assertIs(second.pathCallback, factory.template.pathCallback)
+        self.assertGreater(len(second.dest.getvalue()), 0)
+
+    def test_context_factory_shares_no_state(self):
+        factory = pisaContextFactory()
+        fresh = vars(pisaContext(None, capacity=100 * 1024))
+        first, second = vars(factory.getContext()), vars(factory.getContext())
+        self.assertEqual(sorted(first), sorted(fresh))
+        for name, value in fresh.items():
+            if name == "asianFontList":
+                self.assertIs(first[name], second[name])
+            elif isinstance(value, (str, int, float, tuple, type(None))):
+                self.assertEqual(first[name], value, name)
+            else:
+                self.assertIsNot(first[name], second[name], name)
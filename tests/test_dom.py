@@ -0,0 +1,77 @@
+import sys
+from unittest import TestCase
+
+import html5lib
+from html5lib import treebuilders
+
+from xhtml2pdf import dom
+from xhtml2pdf.parser import pisaParseHTML5Lib
+
+HTML = (b"<!DOCTYPE html><html><head><title>a &amp; b</title></head>"
+        b"<body><!-- note --><p class='x' id=\"a\">one<b>two</b> three</p>"
+        b"<table><tr><td align=right>1 &lt; 2</td></tr></table><br></body></html>")
+
+
+class DOMTest(TestCase):
+
+    def test_nodes_have_slots(self):
+        document = pisaParseHTML5Lib(HTML)
+        for node in [document] + document.getElementsByTagName("*") + \
+                document.getElementsByTagName("p")[0].childNodes:
+            self.assertFalse(hasattr(node, "__dict__"), node)
+
+    def test_interned_names(self):
+        first, second = [pisaParseHTML5Lib(HTML).getElementsByTagName("td")[0]
+                         for i in range(2)]
+        self.assertIs(first.tagName, second.tagName)
+        self.assertIs(first.attributes.item(0).name, second.attributes.item(0).name)
+        self.assertIs(first.tagName, sys.intern("td"))
+
+    def test_attributes(self):
+        p = pisaParseHTML5Lib(HTML).getElementsByTagName("p")[0]
+        self.assertEqual(p.attributes.items(), [("class", "x"), ("id", "a")])
+        self.assertEqual(p.getAttribute("id"), "a")
+        self.assertEqual(p.getAttribute("title"), "")
+        self.assertEqual(p.getAttributeNode("class").value, "x")
+        self.assertIsNone(p.attributes.get("title"))
+        self.assertEqual(dict(p.attributes)["class"].nodeValue, "x")
+
+        p.attributes["class"] = "y"
+        p.setAttribute("title", "z")
+        self.assertEqual(p.attributes.items(), [("class", "y"), ("id", "a"), ("title", "z")])
+        del p.attributes["id"]
+        self.assertEqual(p.attributes.keys(), ["class", "title"])
+        self.assertRaises(KeyError, lambda: p.attributes["id"])
+
+    def test_siblings(self):
+        document = dom.Document()
+        parent = document.createElement("div")
+        a, b, c = [document.createTextNode(data) for data in "abc"]
+        parent.appendChild(a)
+        parent.appendChild(c)
+        parent.insertBefore(b, c)
+        self.assertEqual(parent.childNodes, [a, b, c])
+        self.assertEqual((a.nextSibling, b.nextSibling, c.nextSibling), (b, c, None))
+        self.assertEqual((a.previousSibling, b.previousSibling, c.previousSibling), (None, a, b))
+
+        parent.removeChild(b)
+        self.assertEqual((a.nextSibling, c.previousSibling), (c, a))
+        self.assertIsNone(b.parentNode)
+        parent.insertBefore(c, a)
+        self.assertEqual(parent.childNodes, [c, a])
+        self.assertEqual((parent.firstChild, parent.lastChild), (c, a))
+        self.assertEqual((c.previousSibling, c.nextSibling, a.nextSibling), (None, a, None))
+
+    def test_serialization_like_minidom(self):
+        expected = html5lib.HTMLParser(tree=treebuilders.getTreeBuilder("dom")).parse(HTML)
+        document = pisaParseHTML5Lib(HTML)
+        self.assertEqual(document.toxml(), expected.toxml())
+        self.assertEqual(document.toprettyxml(encoding="utf8"), expected.toprettyxml(encoding="utf8"))
+
+    def test_deep_document(self):
+        depth = sys.getrecursionlimit() * 2
+        document = pisaParseHTML5Lib(b"<div>" * depth + b"x")
+        self.assertEqual(document.toxml().count("<div>"), depth)
+        self.assertEqual(len(document.getElementsByTagName("div")), depth)
+        document.normalize()
+        document.unlink()
@@ -0,0 +1,94 @@
+import io
+import os
+from unittest import TestCase
+
+from reportlab.pdfbase import pdfmetrics
+
+from xhtml2pdf import context
+from xhtml2pdf.context import pisaFontCache
+from xhtml2pdf.document import pisaDocument
+
+FONT_FOLDER = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'samples', 'font', 'Noto_Sans')
+REGULAR = os.path.join(FONT_FOLDER, 'NotoSans-Regular.ttf')
+BOLD = os.path.join(FONT_FOLDER, 'NotoSans-Bold.ttf')
+
+HTML_CONTENT = """<html><head><style>
+@font-face {{font-family: {name}; src: url('{ttf}');}}
+p {{font-family: {name};}}
+</style></head><body><p>Hello, world!</p></body></html>"""
+
+
+class FontCacheTest(TestCase):
+
+    def _read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def test_font_parsed_once_for_all_documents(self):
+        key = pisaFontCache.makeKey(self._read(REGULAR))
+        context.fontCache.evict(key)
+        misses = context.fontCache.misses
+        for name in ('CacheTestFont', 'CacheTestFont', 'CacheTestOther'):
+            result = pisaDocument(HTML_CONTENT.format(name=name, ttf=REGULAR), io.BytesIO())
+            self.assertFalse(result.err)
+        self.assertEqual(context.fontCache.misses, misses + 1)
+        self.assertIn(key, context.fontCache)
+
+        first = pdfmetrics.getFont('cachetestfont_00')
+        other = pdfmetrics.getFont('cachetestother_00')
+        self.assertIs(first.face, other.face)
+
+        context.fontCache.evict(key)
+        self.assertNotIn(key, context.fontCache)
+        self.assertNotIn('cachetestfont_00', pdfmetrics.getRegisteredFontNames())
+        self.assertNotIn('cachetestother_00', pdfmetrics.getRegisteredFontNames())
+
+    def test_renamed_font_shares_face(self):
+        cache = pisaFontCache()
+        data = self._read(REGULAR)
+        first = cache.getFont('first', data, REGULAR)
+        second = cache.getFont('second', data, REGULAR)
+        self.assertEqual((first.fontName, second.fontName), ('first', 'second'))
+        self.assertIs(first.face, second.face)
+        self.assertIsNot(first.state, second.state)
+        self.assertEqual(cache.info()['hits'], 1)
+        self.assertEqual(cache.info()['misses'], 1)
+
+    def test_memory_accounting_and_eviction(self):
+        regular, bold = self._read(REGULAR), self._read(BOLD)
+        cache = pisaFontCache()
+        cache.getFont('regular', regular)
+        self.assertGreater(cache.bytes, len(regular))
+        size = cache.bytes
+        cache.getFont('bold', bold)
+        self.assertEqual(len(cache), 2)
+        self.assertGreater(cache.bytes, size)
+
+        cache = pisaFontCache(maxbytes=size)
+        cache.getFont('regular', regular)
+        cache.getFont('bold', bold)
+        self.assertEqual(len(cache), 1)
+        self.assertIn(pisaFontCache.makeKey(bold), cache)
+        cache.clear()
+        self.assertEqual(cache.info(), {'hits': 0, 'misses': 0, 'size': 0, 'bytes': 0, 'maxbytes': size})
+
+    def test_document_with_more_font_bytes_than_maxbytes(self):
+        fonts = (REGULAR, BOLD)
+        src = """<html><head><style>%s</style></head><body>%s</body></html>""" % (
+            "".join("@font-face {font-family: cachetestsmall%d; src: url('%s');}\n" % (i, ttf)
+                    for i, ttf in enumerate(fonts)),
+            "".join("<p style='font-family: cachetestsmall%d'>Hello, world!</p>" % i
+                    for i in range(len(fonts))))
+        keys = [pisaFontCache.makeKey(self._read(ttf)) for ttf in fonts]
+        for key in keys:
+            context.fontCache.evict(key)
+        maxbytes = context.fontCache.maxbytes
+        context.fontCache.maxbytes = 1
+        try:
+            result = pisaDocument(src, io.BytesIO())
+        finally:
+            context.fontCache.maxbytes = maxbytes
+        self.assertFalse(result.err)
+        self.assertGreater(len(result.dest.getvalue()), 0)
+        self.assertEqual([key in context.fontCache for key in keys], [False, True])
+        self.assertIn('cachetestsmall0_00', pdfmetrics.getRegisteredFontNames())
@@ -1,8 +1,21 @@
+import copy
+import mmap
 import os
-from unittest import TestCase
+import sys
+import tempfile
+import tracemalloc
+from io import BytesIO
+from unittest import TestCase, mock, skipIf
 
-from xhtml2pdf.context import pisaContext
-from xhtml2pdf.parser import pisaParser
+import html5lib
+from reportlab.platypus.paraparser import ParaFrag
+
+from xhtml2pdf.context import getFragment, pisaContext
+from xhtml2pdf.default import DEFAULT_CSS
+from xhtml2pdf.parser import (getHTMLParser, lxml_etree, pisaCollectCSS, pisaLoop,
+                               pisaNormalizeWhitespace, pisaParseHTML5Lib, pisaParseLXML, pisaParser, pisaPreLoop,
+                               pisaStreamLoop)
+from xhtml2pdf.w3c.css import CSSComputedStyle
 
 _data = b"""
 <!doctype html>
@@ -50,8 +63,421 @@ class ParserTest(TestCase):
         self.assertEqual(r.err, 0)
         self.assertEqual(r.warn, 0)
 
+    def test_deep_nesting(self):
+        """Nesting deeper than the recursion limit is walked without recursion"""
+        depth = sys.getrecursionlimit() + 100
+        data = ("<div>x" * depth + "</div>" * depth).encode("utf-8")
+        for html_parser in (None, "lxml") if lxml_etree is not None else (None,):
+            c = pisaContext(".")
+            r = pisaParser(data, c, html_parser=html_parser)
+            self.assertEqual(r.err, 0)
+            c.addPara()
+            self.assertEqual("".join(frag.text for frag in c.story[0].frags), "x" * depth)
+
+    def test_style_elements_recorded(self):
+        data = (b"<html><head><style>p { color: red }</style><link rel='stylesheet' href='x.css'>"
+                b"</head><body><p>x</p><style>p { color: blue }</style></body></html>")
+        for name in ("html5lib", "lxml") if lxml_etree is not None else ("html5lib",):
+            document = getHTMLParser(name)(data)
+            self.assertEqual([node.tagName for node in document.cssStyleElements],
+                             ["style", "link", "style"])
+            c = pisaContext(".")
+            pisaCollectCSS(document, c)
+            self.assertEqual(c.cssText, 'p { color: red }\n@import "x.css" all;\np { color: blue }\n')
+
+    def test_collect_css_without_recorded_elements(self):
+        document = html5lib.parse(b"<style>p { color: red }</style><p>x</p>", treebuilder="dom")
+        c = pisaContext(".")
+        pisaCollectCSS(document, c)
+        self.assertEqual(c.cssText, "p { color: red }\n")
+
+    def test_normalize_whitespace(self):
+        document = pisaParseHTML5Lib(
+            b"<table>\n <tr>\n  <td> a </td>\n  <td>\n</td>\n </tr>\n</table>\n<p> b <i>c</i> </p>")
+        c = pisaContext(".")
+        self.assertEqual(pisaNormalizeWhitespace(document, c), 5)
+        table = document.getElementsByTagName("table")[0]
+        for node in table.getElementsByTagName("tbody") + table.getElementsByTagName("tr"):
+            for child in node.childNodes:
+                self.assertEqual(child in c.ignoredText, child.nodeType == child.TEXT_NODE)
+        # Whitespace in cells and paragraphs is kept, the document is unchanged
+        for td in table.getElementsByTagName("td") + document.getElementsByTagName("p"):
+            self.assertTrue(td.childNodes)
+            self.assertFalse(c.ignoredText.intersection(td.childNodes))
+        self.assertIn("<tr>\n  <td>", document.toxml())
+
     def test_image_base64(self):
         c = pisaContext(".")
         data = b'<img src="data:image/gif;base64,R0lGODlhAQABAIAAAAUEBAAAACwAAAAAAQABAAACAkQBADs=">'
         r = pisaParser(data, c)
         self.assertEqual(r.warn, 0)
+
+
+class HTMLParserBackendTest(TestCase):
+
+    _html = b"""<html><head><style>p { color: red }</style></head>
+<body><p class="a"> Gr&uuml;&szlig;e <b>bold</b> tail</p>
+<table><tr><td>1</td></tr></table></body></html>"""
+
+    def _tree(self, node):
+        node.normalize()
+        result = []
+        for child in node.childNodes:
+            if child.nodeType == child.ELEMENT_NODE:
+                result.append((child.tagName, sorted(child.attributes.items()), self._tree(child)))
+            elif child.nodeType == child.TEXT_NODE and child.data.strip():
+                result.append(child.data)
+        return result
+
+    def test_default_backend(self):
+        self.assertIs(getHTMLParser(), pisaParseHTML5Lib)
+        self.assertIs(getHTMLParser("lxml"), pisaParseLXML)
+
+    def test_unknown_backend(self):
+        self.assertRaises(ValueError, getHTMLParser, "unknown")
+
+    def test_lxml_not_installed(self):
+        with mock.patch("xhtml2pdf.parser.lxml_etree", None):
+            with self.assertRaisesRegex(ImportError, r"pip install xhtml2pdf\[lxml\]"):
+                pisaParseLXML(self._html)
+
+    @skipIf(lxml_etree is None, "lxml is not installed")
+    def test_lxml_tree_matches_html5lib(self):
+        self.assertEqual(
+            self._tree(pisaParseLXML(self._html).documentElement),
+            self._tree(pisaParseHTML5Lib(self._html).documentElement))
+
+    @skipIf(lxml_etree is None, "lxml is not installed")
+    def test_lxml_tree_matches_html5lib_corpus(self):
+        corpus = [
+            b'<html><body><pdf:language name="arabic"/><p>x</p></body></html>',
+            b'<div><pdf:toc /><p>a</p></div><p>b</p>',
+            b'<pdf:nextpage name="a" /> text <pdf:nextframe/><p>b</p><pdf:pagenumber>',
+            b'<p>x <pdf:pagenumber /> y</p><div>z</div>',
+            b'<pdf:frame box="1 2 3 4"><p>a</p></pdf:frame><p>b</p>',
+            b'<select multiple=""><option selected="selected">x</option></select>',
+            b'<table><col width="30"><col>\n<tr><td>x</td></tr></table>',
+            b'<table><colgroup><col></colgroup><tr><td>x</td></tr></table>',
+            b'<table><tr><td>1</td></tr>\n<!-- <tr> -->\n<tr><td>2</td></tr></table>',
+        ]
+        for html in corpus:
+            self.assertEqual(
+                self._tree(pisaParseLXML(html).documentElement),
+                self._tree(pisaParseHTML5Lib(html).documentElement), html)
+
+    @skipIf(lxml_etree is None, "lxml is not installed")
+    def test_lxml_tree_differences(self):
+        # See pisaParseLXML
+        html = b'<div>a</p>b</div><select multiple></select>'
+        body = pisaParseHTML5Lib(html).getElementsByTagName("body")[0]
+        self.assertEqual(self._tree(body), [
+            ("div", [], ["a", ("p", [], []), "b"]), ("select", [("multiple", "")], [])])
+        body = pisaParseLXML(html).getElementsByTagName("body")[0]
+        self.assertEqual(self._tree(body), [
+            ("div", [], ["ab"]), ("select", [("multiple", "multiple")], [])])
+
+    def test_buffer_sources(self):
+        with tempfile.TemporaryFile() as f:
+            f.write(self._html)
+            f.flush()
+            for name in ("html5lib", "lxml") if lxml_etree is not None else ("html5lib",):
+                parse = getHTMLParser(name)
+                expected = parse(self._html).toxml()
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                    for src in (memoryview(self._html), bytearray(self._html), BytesIO(self._html), buffer):
+                        self.assertEqual(parse(src).toxml(), expected, (name, type(src)))
+
+    def test_declared_encoding(self):
+        src = (u'<html><head><meta charset="iso-8859-1"></head>'
+               u'<body><p>Gr\xfc\xdfe</p></body></html>').encode("latin-1")
+        for name in ("html5lib", "lxml") if lxml_etree is not None else ("html5lib",):
+            for source in (src, BytesIO(src)):
+                document = getHTMLParser(name)(source, encoding="utf8")
+                self.assertEqual(document.getElementsByTagName("p")[0].firstChild.data, u"Gr\xfc\xdfe", name)
+            c = pisaParser(src, pisaContext("."), default_css=DEFAULT_CSS, html_parser=name)
+            self.assertEqual([para.text for para in c.story], [u"Gr\xfc\xdfe"], name)
+
+    @skipIf(lxml_etree is None, "lxml is not installed")
+    def test_lxml_parser(self):
+        c = pisaContext(".")
+        r = pisaParser(self._html, c, html_parser="lxml")
+        self.assertEqual(r.err, 0)
+        self.assertEqual(r.warn, 0)
+
+
+class StreamingTest(TestCase):
+
+    _xhtml = u"""<?xml version="1.0" encoding="utf-8"?>
+<html xmlns="http://www.w3.org/1999/xhtml"><head><style>
+p + p { color: red }
+li:first-child { font-weight: bold }
+.box span { color: blue }
+.hidden { display: none }
+</style></head><body>
+<p>Gr&uuml;&szlig;e&nbsp;first</p><p>second <span>plain</span></p>
+<div class="box"><p>in <span>box</span></p><p class="hidden">hidden <b>text</b></p></div>
+<ul><li>one</li><li>two</li></ul>
+<table><tr><td>1</td><td></td></tr><tr><td class="box"><span>2</span></td></tr></table>
+</body></html>"""
+
+    def _story(self, flowables):
+        result = []
+        for flowable in flowables:
+            if hasattr(flowable, "frags"):
+                # html5lib splits text at character references
+                frags = []
+                for frag in flowable.frags:
+                    style = (frag.fontName, str(frag.textColor))
+                    if frags and frags[-1][1:] == style:
+                        frags[-1] = (frags[-1][0] + frag.text,) + style
+                    else:
+                        frags.append((frag.text,) + style)
+                result.append(frags)
+            elif hasattr(flowable, "_cellvalues"):
+                result.append([self._story([cell]) for row in flowable._cellvalues for cell in row])
+            elif hasattr(flowable, "_content"):
+                result.append(self._story(flowable._content))
+            else:
+                result.append(type(flowable).__name__)
+        return result
+
+    def test_same_story_as_tree(self):
+        tree = pisaParser(self._xhtml.encode("utf-8"), pisaContext("."))
+        stream = pisaParser(BytesIO(self._xhtml.encode("utf-8")), pisaContext("."), streaming=True)
+        self.assertEqual(stream.err, 0)
+        self.assertEqual(self._story(stream.story), self._story(tree.story))
+
+    def test_next_sibling_selectors(self):
+        xhtml = u"""<html><head><style>
+p:last-child { color: red }
+li:not-last-child { font-weight: bold }
+.note:middle-child span { color: blue }
+tr:last-child td { color: green }
+</style></head><body>
+<div><p>one</p><p>two</p> text <p>three <b>bold</b></p> after</div>
+<ul><li>a</li><li>b <span>x</span></li><li>c</li></ul>
+<div>before<p class="note">only <span>child</span></p>after</div>
+<table><tr><td>1</td></tr><tr><td>2</td></tr><tr><td>3</td></tr></table>
+<p>last</p></body></html>"""
+        for src in (xhtml, xhtml.replace("<body>", "<body><div>").replace("</body>", "</div></body>")):
+            tree = pisaParser(src.encode("utf-8"), pisaContext("."))
+            stream = pisaParser(BytesIO(src.encode("utf-8")), pisaContext("."), streaming=True)
+            self.assertEqual(stream.err, 0)
+            self.assertEqual(self._story(stream.story), self._story(tree.story))
+
+    def test_tree_is_bounded_with_last_child(self):
+        loop = pisaStreamLoop(pisaContext("."))
+        loop.feed(b"<html><head><style>tr:last-child td { color: red }</style></head><body><table>")
+        sizes = []
+        for i in range(200):
+            loop.feed(("<tr><td>%d</td><td><b>x</b> y</td></tr>\n" % i).encode("utf-8"))
+            sizes.append(len(loop.document.getElementsByTagName("*")))
+        loop.feed(b"</table></body></html>")
+        loop.close()
+        self.assertLess(max(sizes), 20)
+
+    def test_tree_is_bounded(self):
+        loop = pisaStreamLoop(pisaContext("."))
+        loop.feed(b"<html><head><style>td { color: red }</style></head><body><table>")
+        sizes = []
+        for i in range(200):
+            loop.feed(("<tr><td>%d</td><td><b>x</b> y</td></tr>\n" % i).encode("utf-8"))
+            sizes.append(len(loop.document.getElementsByTagName("*")))
+        loop.feed(b"</table></body></html>")
+        loop.close()
+        self.assertLess(max(sizes), 12)
+
+    def test_declared_encoding(self):
+        src = (u'<?xml version="1.0" encoding="iso-8859-1"?>\n'
+               u'<html><body><p>Gr\xfc\xdfe</p></body></html>').encode("latin-1")
+        for source in (src, BytesIO(src)):
+            c = pisaParser(source, pisaContext("."), default_css=DEFAULT_CSS, streaming=True)
+            self.assertEqual(c.err, 0)
+            self.assertEqual([para.text for para in c.story], [u"Gr\xfc\xdfe"])
+
+    def test_parse_error(self):
+        c = pisaParser(b"<html><body><p>unclosed</body></html>", pisaContext("."), streaming=True)
+        self.assertEqual(c.err, 1)
+
+    def test_peak_memory_100mb(self):
+        """A 100 MB source is read in place, neither it nor its hidden text is copied"""
+        size = 100 * 1024 * 1024
+        data = (b"<html><body><p>start</p><div style='display: none'><p>" + b"x" * size +
+                b"</p></div><p>end</p></body></html>")
+        with tempfile.TemporaryFile() as f:
+            f.write(data)
+            f.flush()
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                for src in (memoryview(data), buffer):
+                    c = pisaContext(".")
+                    tracemalloc.start()
+                    try:
+                        pisaParser(src, c, default_css=DEFAULT_CSS, streaming=True)
+                        peak = tracemalloc.get_traced_memory()[1]
+                    finally:
+                        tracemalloc.stop()
+                    self.assertEqual(c.err, 0)
+                    self.assertEqual([para.text for para in c.story], ["start", "end"])
+                    self.assertLess(peak, size // 10, type(src))
+
+
+class StyleSharingTest(TestCase):
+
+    def _parse(self, data):
+        c = pisaContext(".")
+        c.dom = html5lib.parse(data, treebuilder="dom")
+        pisaPreLoop(c.dom, c)
+        c.parseCSS()
+        pisaLoop(c.dom, c)
+        return c
+
+    def _colors(self, c, tagName):
+        return [node.cssAttrs.get("color") for node in c.dom.getElementsByTagName(tagName)]
+
+    def test_cells_share_styles(self):
+        rows = "".join("<tr><td>%d</td><td class='n'>x</td></tr>" % i for i in range(50))
+        c = self._parse(("<style>td.n { color: red }</style><table>%s</table>" % rows).encode())
+        info = c.cssStyleCache.info()
+        self.assertGreater(info["hits"], 90)
+        tds = c.dom.getElementsByTagName("td")
+        self.assertIs(tds[0].cssAttrs, tds[2].cssAttrs)
+        self.assertIsNot(tds[0].cssAttrs, tds[1].cssAttrs)
+
+    def test_first_child(self):
+        c = self._parse(b"<style>p:first-child { color: red }</style><div><p>a</p><p>b</p></div>")
+        colors = self._colors(c, "p")
+        self.assertEqual(colors[0], "red")
+        self.assertNotEqual(colors[1], "red")
+
+    def test_attribute_selector(self):
+        c = self._parse(b"<style>p[title=x] { color: red }</style><div><p title='x'>a</p><p title='y'>b</p></div>")
+        colors = self._colors(c, "p")
+        self.assertEqual(colors[0], "red")
+        self.assertNotEqual(colors[1], "red")
+
+    def test_adjacent_sibling(self):
+        c = self._parse(b"<style>h1 + p { color: red }</style><div><h1>t</h1><p>a</p><p>b</p></div>")
+        colors = self._colors(c, "p")
+        self.assertEqual(colors[0], "red")
+        self.assertNotEqual(colors[1], "red")
+
+    def test_parents_share_styles(self):
+        c = self._parse(b"<style>.a span { color: red }</style>"
+                        b"<div class='a'><span>a</span></div><div class='a'><span>b</span></div>"
+                        b"<div class='b'><span>c</span></div>")
+        spans = c.dom.getElementsByTagName("span")
+        self.assertIs(spans[0].cssAttrs, spans[1].cssAttrs)
+        self.assertEqual(self._colors(c, "span")[:2], ["red", "red"])
+        self.assertNotEqual(self._colors(c, "span")[2], "red")
+
+    def test_styles_are_interned(self):
+        c = self._parse(b"<style>.a, .b { color: red }</style><p class='a'>a</p><p class='b'>b</p>")
+        first, second = [node.cssAttrs for node in c.dom.getElementsByTagName("p")]
+        self.assertIs(first, second)
+        self.assertEqual(hash(first), hash(CSSComputedStyle(dict(first))))
+        self.assertEqual(first, dict(first))
+        with self.assertRaises(TypeError):
+            first["color"] = "blue"
+
+    def test_inherit(self):
+        c = self._parse(b"<style>div { border-left-color: red } p { border-left-color: inherit }</style>"
+                        b"<div style='color: blue'><p style='color: inherit'>a</p></div><p>b</p>")
+        first, second = [node.cssAttrs for node in c.dom.getElementsByTagName("p")]
+        self.assertEqual((first.get("color"), first.get("border-left-color")), ("blue", "red"))
+        self.assertNotIn("border-left-color", second)
+
+    def test_css_error_keeps_other_properties(self):
+        with mock.patch("xhtml2pdf.w3c.css.CSSCascadeStrategy.findStylesFor", side_effect=ValueError):
+            c = self._parse(b"<style>p { color: red }</style><p style='font-size: 20px'>a</p>")
+        styles = c.dom.getElementsByTagName("p")[0].cssAttrs
+        self.assertEqual((styles.get("color"), styles.get("font-size")), ("red", ("20", "px")))
+
+        with mock.patch("xhtml2pdf.w3c.css.CSSParser.parseInline", side_effect=ValueError):
+            c = self._parse(b"<style>p { color: red }</style><p style='font-size: 20px'>a</p>")
+        styles = c.dom.getElementsByTagName("p")[0].cssAttrs
+        self.assertEqual(styles.get("color"), "red")
+
+
+class DiagnosticsTest(TestCase):
+
+    _xhtml = b"""<html>
+<body>
+<p>text</p>
+<img/>
+</body>
+</html>"""
+
+    def test_source_lines(self):
+        for kw in ({}, {"html_parser": "lxml"}, {"streaming": True}):
+            if kw.get("html_parser") == "lxml" and lxml_etree is None:
+                continue
+            c = pisaParser(self._xhtml, pisaContext("."), **kw)
+            self.assertIn(("warning", 4, "Need a valid file name!"),
+                          [(d.mode, d.line, d.message) for d in c.log], kw)
+
+    def test_formatted_when_read(self):
+        document = pisaParseHTML5Lib(b"<body>" + b"<p>a b c d e f g h</p>" * 1000)
+        c = pisaContext(".")
+        c.node = document.getElementsByTagName("body")[0]
+        with mock.patch("xhtml2pdf.context.getFragment", wraps=getFragment) as fragment:
+            diagnostic = c.warning("%d words", 8000)
+            self.assertEqual(c.log, [diagnostic])
+            self.assertEqual(fragment.call_count, 0)
+            self.assertEqual(str(diagnostic), "8000 words\n%r" % " ".join(c.node.toxml().split()[:50]))
+            self.assertEqual(fragment.call_count, 1)
+
+        mode, line, message, text = diagnostic
+        self.assertEqual((mode, message, text), ("warning", "8000 words", diagnostic.fragment))
+        c.releaseDocument()
+        self.assertIsNone(diagnostic.node)
+        self.assertEqual(diagnostic.fragment, text)
+
+    def test_fragment_is_bounded(self):
+        document = pisaParseHTML5Lib(b"<body>" + b"<p>a b c d e f g h</p>" * 1000)
+        writes = []
+        with mock.patch("xhtml2pdf.context._FragmentWriter.write", side_effect=writes.append, autospec=True):
+            getFragment(document.getElementsByTagName("body")[0], 50)
+        self.assertLess(len(writes), 100)
+
+
+class FragTest(TestCase):
+
+    def test_clone_copies_set_attributes(self):
+        c = pisaContext(".")
+        c.frag.bulletText = "1."
+        c.frag.cbDefn = object()
+        fontSize = c.frag.fontSize
+        c.pushFrag()
+        c.frag.fontSize = 20
+        frag = c.frag.clone()
+        self.assertIsInstance(frag, ParaFrag)
+        self.assertEqual((frag.fontSize, frag.leading, frag.zoom, frag.bulletText), (20, 0, 1.0, None))
+        self.assertTrue(hasattr(frag, "backColor"))
+        self.assertFalse(hasattr(frag, "lineBreak"))
+        self.assertLess(len(frag.__dict__), 10)
+        self.assertTrue(hasattr(frag, "cbDefn"))
+        self.assertFalse(hasattr(frag.clone(text="x"), "cbDefn"))
+
+        frag.leading = 12
+        self.assertEqual(c.frag.leading, 0)
+        c.pullFrag()
+        self.assertEqual(c.frag.fontSize, fontSize)
+        self.assertEqual(copy.copy(c.frag).bulletText, "1.")
+
+    def test_add_frag(self):
+        c = pisaContext(".")
+        c.addFrag(" plain text ")
+        c.addFrag(u"soft\xadhyphen  and\n tabs\t")
+        c.addFrag(u"a\xa0b")
+        self.assertEqual([frag.text for frag in c.fragList],
+                         ["plain text ", "softhyphen and tabs ", "a", u"\xa0", "b"])
+        self.assertEqual(c.text, u"plain text softhyphen and tabs a\xa0b")
+        self.assertTrue(c.force)
+
+        c.clearFrag()
+        c.frag.whiteSpace = "pre"
+        c.addFrag("a b\n\tc")
+        self.assertEqual([frag.text for frag in c.fragList[:4]], ["a", u"\xa0", "b", ""])
+        self.assertEqual(c.fragList[3].lineBreak, 1)
+        self.assertEqual("".join(frag.text for frag in c.fragList[4:]), 8 * u"\xa0" + "c")
+        self.assertEqual(c.text, "a b\n\tc")
@@ -1,6 +1,9 @@
 from unittest import TestCase
 
-from xhtml2pdf.w3c.css import CSSBuilder, CSSParser
+import html5lib
+
+from xhtml2pdf.w3c.css import CSSAncestorFilter, CSSBuilder, CSSCascadeStrategy, CSSParser, prepareCSSNode
+from xhtml2pdf.w3c.cssDOMElementInterface import CSSDOMElementInterface
 
 
 class SelectorsTest(TestCase):
@@ -28,3 +31,144 @@ class SelectorsTest(TestCase):
         specific_selector = list(parser.parse(specific_css)[0].keys())[0]
 
         self.assertGreater(specific_selector, general_selector)
+
+    def test_ruleset_index_matches_full_scan(self):
+        css = """
+            p { color: yellow; }
+            * { margin: 0; }
+            .red { color: red; }
+            p.red.big { font-size: 20pt; }
+            #main { color: blue; }
+            div#main.red { color: green; }
+            div p { color: black; }
+            td > .red { color: white; }
+            [title] { color: gray; }
+        """
+        html = b"""
+            <div id="main" class="red other">
+                <p class="red big">x</p><p>y</p>
+                <table><tr><td><span class="red">z</span></td></tr></table>
+                <span title="t">t</span>
+            </div>
+        """
+        ruleset = CSSParser(CSSBuilder(mediumSet=['pdf'])).parse(css)[0]
+        document = html5lib.parse(html, treebuilder="dom")
+        for node in document.getElementsByTagName("*"):
+            element = CSSDOMElementInterface(node)
+            for attrName in ("color", "margin", "font-size"):
+                expected = [(s, d) for s, d in ruleset.items()
+                            if attrName in d and s.matches(element)]
+                expected.sort()
+                self.assertEqual(
+                    [s for s, _ in ruleset.findCSSRulesFor(element, attrName)],
+                    [s for s, _ in expected])
+
+    def test_ruleset_index_is_invalidated(self):
+        parser = CSSParser(CSSBuilder(mediumSet=['pdf']))
+        ruleset = parser.parse("p { color: yellow; }")[0]
+        node = html5lib.parse(b"<p class='red'>x</p>", treebuilder="dom").getElementsByTagName("p")[0]
+        element = CSSDOMElementInterface(node)
+        self.assertEqual(len(ruleset.findCSSRulesFor(element, "color")), 1)
+        ruleset.mergeStyles(parser.parse(".red { color: red; }")[0])
+        self.assertEqual(len(ruleset.findCSSRulesFor(element, "color")), 2)
+
+    def test_cascade_styles_for_element(self):
+        parser = CSSParser(CSSBuilder(mediumSet=['pdf']))
+        user_agent = parser.parse("strong { font-weight: bold; } p { color: black; }")
+        author = parser.parse(".content * { margin: 0; } .content p { color: red; }")
+        cascade = CSSCascadeStrategy(userAgent=user_agent, user=author)
+        document = html5lib.parse(b"<div class='content'><p><strong>x</strong></p></div>", treebuilder="dom")
+        strong = CSSDOMElementInterface(document.getElementsByTagName("strong")[0])
+        styles = cascade.findStylesFor(strong)
+        self.assertEqual(styles["font-weight"], "bold")
+        self.assertEqual(styles["margin-left"], "0")
+        p = CSSDOMElementInterface(document.getElementsByTagName("p")[0])
+        styles = cascade.findStylesFor(p)
+        self.assertEqual(styles["color"], "red")
+        self.assertEqual(styles["color"], cascade.findStyleFor(p, "color"))
+
+    def test_compiled_selector_matching(self):
+        css = """
+            div p { color: black; }
+            div > p { color: black; }
+            p + p { color: black; }
+            li:first-child span { color: black; }
+            p[title=t] { color: black; }
+            p[class~=big] { color: black; }
+            .red.big { color: black; }
+        """
+        html = b"""
+            <div><p class="red big" title="t">x</p><p>y</p></div>
+            <ul><li><span>a</span></li><li><span>b</span></li></ul>
+        """
+        descendant, child, adjacent, pseudo, attr, attr_word, classes = CSSParser(
+            CSSBuilder(mediumSet=['pdf'])).parse(css)[0]
+        document = html5lib.parse(html, treebuilder="dom")
+        first, second = [CSSDOMElementInterface(node) for node in document.getElementsByTagName("p")]
+        span_a, span_b = [CSSDOMElementInterface(node) for node in document.getElementsByTagName("span")]
+
+        self.assertTrue(descendant.matches(second))
+        self.assertTrue(child.matches(first))
+        self.assertFalse(adjacent.matches(first))
+        self.assertTrue(adjacent.matches(second))
+        self.assertTrue(pseudo.matches(span_a))
+        self.assertFalse(pseudo.matches(span_b))
+        self.assertTrue(attr.matches(first))
+        self.assertFalse(attr.matches(second))
+        self.assertTrue(attr_word.matches(first))
+        self.assertTrue(classes.matches(first))
+        self.assertFalse(classes.matches(second))
+
+    def test_ancestor_keys(self):
+        parser = CSSParser(CSSBuilder(mediumSet=['pdf']))
+        selector, sibling = parser.parse(".invoice table > td#x span.y { a: b } div.z p + p { c: d }")[0]
+        self.assertEqual(sorted(selector.getAncestorKeys()), sorted([".invoice", "table", "td", "#x"]))
+        self.assertEqual(sorted(sibling.getAncestorKeys()), sorted(["div", ".z"]))
+
+    def test_ancestor_filter(self):
+        parser = CSSParser(CSSBuilder(mediumSet=['pdf']))
+        ruleset = parser.parse(".invoice td span { color: red; } span { margin-left: 0 }")[0]
+        document = html5lib.parse(b"<div class='invoice'><table><tr><td><span>x</span></td></tr></table></div>",
+                                  treebuilder="dom")
+        span = document.getElementsByTagName("span")[0]
+        ancestors = []
+        parent = span.parentNode
+        while parent.nodeType == parent.ELEMENT_NODE:
+            ancestors.insert(0, parent)
+            parent = parent.parentNode
+
+        ancestorFilter = CSSAncestorFilter()
+        for node in ancestors:
+            self.assertIsNotNone(ancestorFilter.getAncestorBits(node))
+            ancestorFilter.push(node)
+        element = CSSDOMElementInterface(span)
+        element.ancestorBits = ancestorFilter.getAncestorBits(span)
+        self.assertEqual(len(ruleset.findCSSRulesForElement(element)), 2)
+
+        # the filter of another element has no "invoice" ancestor
+        ancestorFilter.pop()
+        ancestorFilter.pop()
+        self.assertIsNone(ancestorFilter.getAncestorBits(span))
+        ancestorFilter = CSSAncestorFilter()
+        ancestorFilter.push(ancestors[0])
+        ancestorFilter.push(ancestors[-1])
+        element.ancestorBits = ancestorFilter.getAncestorBits(span)
+        self.assertEqual(len(ruleset.findCSSRulesForElement(element)), 1)
+
+    def test_prepare_css_node(self):
+        document = html5lib.parse(b"<ul><li id='a' class='x  y'>1</li> <li>2</li><li class='x'>3</li></ul>",
+                                  treebuilder="dom")
+        first, second, third = document.getElementsByTagName("li")
+        prepareCSSNode(third)
+        self.assertEqual(third.cssSiblingIndex, 2)
+        self.assertEqual(prepareCSSNode(first).cssClasses, frozenset(["x", "y"]))
+        self.assertEqual(first.cssId, "a")
+        self.assertEqual(prepareCSSNode(second).cssSiblingIndex, 1)
+        self.assertEqual(second.cssClasses, frozenset())
+
+        selector = CSSParser(CSSBuilder(mediumSet=['pdf'])).parse("li.y:first-child { color: red }")[0].keys()
+        selector = list(selector)[0]
+        self.assertTrue(selector.matches(CSSDOMElementInterface(first)))
+        first.setAttribute("class", "x")
+        prepareCSSNode(first)
+        self.assertFalse(selector.matches(CSSDOMElementInterface(first)))
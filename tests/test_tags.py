@@ -2,7 +2,10 @@ from unittest import TestCase
 from xml.dom import minidom
 
 from xhtml2pdf import tags
-from xhtml2pdf.parser import AttrContainer
+from xhtml2pdf.context import pisaContext
+from xhtml2pdf.default import SIZE
+from xhtml2pdf.parser import (TAG_DEFINITIONS, AttrContainer, getTagDefinition, pisaGetAttributes,
+                              pisaParser, registerTag)
 
 
 class PisaTagTestCase(TestCase):
@@ -15,3 +18,45 @@ class PisaTagTestCase(TestCase):
         self.assertEqual(instance.node, element)
         self.assertEqual(instance.tag, "unit")
         self.assertEqual(instance.attr, {})
+
+
+class TagRegistryTestCase(TestCase):
+
+    def setUp(self):
+        self.addCleanup(TAG_DEFINITIONS.pop, "pdfcustom", None)
+
+    def test_registered_tags(self):
+        self.assertIs(getTagDefinition("h1").handler, tags.pisaTagH1)
+        self.assertIs(getTagDefinition("pdfbarcode").handler, tags.pisaTagPDFBARCODE)
+        self.assertIsNone(getTagDefinition("span").handler)
+        self.assertEqual(pisaGetAttributes(pisaContext("."), "span", {"id": "x"}), {})
+
+    def test_attribute_conversion(self):
+        context = pisaContext(".")
+        attrs = pisaGetAttributes(context, "hr", {"size": "2pt", "align": "Center ", "other": "x"})
+        self.assertEqual(attrs.size, 2.0)
+        self.assertEqual(attrs.align, "center")
+        self.assertEqual(attrs.color.hexval(), "0x000000")
+        self.assertEqual(attrs.width, None)
+        self.assertNotIn("other", attrs)
+        self.assertEqual(context.warn, 0)
+
+    def test_register_custom_tag(self):
+        started = []
+
+        class pisaTagPDFCUSTOM(tags.pisaTag):
+
+            def start(self, c):
+                started.append(dict(self.attr))
+
+        registerTag("pdfcustom", pisaTagPDFCUSTOM, {
+            "size": (SIZE, "1pt"),
+            "mode": (["fast", "slow"], "fast"),
+        })
+        context = pisaParser(b"<pdf:custom mode='SLOW'/><pdf:custom size='3pt' mode='x'/>",
+                             pisaContext("."))
+        self.assertEqual(started, [
+            {"size": 1.0, "mode": "slow", "id": None},
+            {"size": 3.0, "mode": "fast", "id": None},
+        ])
+        self.assertEqual(context.warn, 1)
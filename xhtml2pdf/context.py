@@ -15,9 +15,15 @@
 # limitations under the License.
 
 import copy
+import hashlib
+import io
 import logging
 import os
 import re
+import sys
+import threading
+import weakref
+from collections import OrderedDict
 from pathlib import Path
 
 from reportlab import rl_settings
@@ -53,6 +59,23 @@ superFraction = 0.4
 
 NBSP = u"\u00a0"
 
+# Text addFrag can not take as it is: soft hyphens, NBSP and whitespace
+# other than single spaces, which is collapsed
+rxspecialtext = re.compile(u"[\xad\xa0]|[^\\S ]| {2}")
+rxnbsp = re.compile(u"(" + NBSP + u")")
+rxlinebreak = re.compile(r"(\r\n|\n|\r)")
+rxspace = re.compile(r"(\ )")
+
+# Parsed stylesheets shared by all contexts of this process. Stylesheets using
+# at-rules that act on the context (pages, frames, fonts, imports) are never
+# cached, see pisaContext.parseCachedCSS
+cssRulesetCache = css.CSSRulesetCache(maxsize=64)
+rxcssnocache = re.compile(r"@(import|page|frame|font-face)\b", re.I)
+
+# Inline style attributes are parsed once per distinct source string, see
+# pisaCSSParser.parseInline
+cssInlineCache = css.CSSRulesetCache(maxsize=1024)
+
 
 def clone(self, **kwargs):
     n = ParaFrag(**self.__dict__)
@@ -69,60 +92,68 @@ def clone(self, **kwargs):
 ParaFrag.clone = clone
 
 
+class pisaFrag(ParaFrag):
+    """
+    Style of a fragment of text.  The defaults of its attributes are class
+    attributes shared by all the frags: a frag only stores the attributes
+    set on it or on the frags it was cloned from, so cloning it, for every
+    element and every piece of text, copies a few of them instead of all.
+    Reading an attribute works as for ParaFrag, deleting one only removes
+    the value the frag stores.
+    """
+
+    sub = super = rise = underline = strike = greek = 0
+    leading = leadingSpace = spaceBefore = spaceAfter = 0
+    leftIndent = rightIndent = firstLineIndent = bulletIndent = 0
+    borderPadding = paddingLeft = paddingRight = paddingTop = paddingBottom = 0
+    insideStaticFrame = outlineLevel = 0
+
+    backColor = vAlign = link = borderStyle = borderColor = None
+    listStyleType = listStyleImage = wordWrap = height = width = bulletText = None
+
+    pageNumber = pageCount = outline = outlineOpen = keepWithNext = rtl = False
+
+    text = ""
+    fontName = "Times-Roman"
+
+    # Extras
+    letterSpacing = "normal"
+    leadingSource = "150%"
+    alignment = TA_LEFT
+    borderWidth = 1
+
+    borderLeftWidth = borderRightWidth = borderTopWidth = borderBottomWidth = borderWidth
+    borderLeftColor = borderRightColor = borderTopColor = borderBottomColor = borderColor
+    borderLeftStyle = borderRightStyle = borderTopStyle = borderBottomStyle = borderStyle
+
+    whiteSpace = "normal"
+    bulletFontName = "Helvetica"
+    zoom = 1.0
+
+    def clone(self, **kwargs):
+        n = object.__new__(self.__class__)
+        d = n.__dict__ = self.__dict__.copy()
+        if kwargs:
+            d.update(kwargs)
+            # This else could cause trouble in Paragraphs with images etc.
+            if "cbDefn" in d:
+                del d["cbDefn"]
+        # The default is None
+        if "bulletText" in d:
+            del d["bulletText"]
+        return n
+
+    def __copy__(self):
+        n = object.__new__(self.__class__)
+        n.__dict__ = self.__dict__.copy()
+        return n
+
+
 def getParaFrag(style):
-    frag = ParaFrag()
-
-    set_value(frag,
-              ('sub', 'super', 'rise', 'underline', 'strike', 'greek',
-               'leading', 'leadingSpace', 'spaceBefore',
-               'spaceAfter', 'leftIndent', 'rightIndent', 'firstLineIndent',
-               'borderPadding', 'paddingLeft', 'paddingRight',
-               'paddingTop', 'paddingBottom', 'bulletIndent',
-               'insideStaticFrame', 'outlineLevel'
-               ),
-              0)
-
-    set_value(frag,
-              ('backColor', 'vAlign', 'link', 'borderStyle',
-               'borderColor', 'listStyleType', 'listStyleImage',
-               'wordWrap', 'height', 'width', 'bulletText'
-               ),
-              None
-              )
-    set_value(frag,
-              ('pageNumber', 'pageCount', 'outline',
-               'outlineOpen', 'keepWithNext', 'rtl'),
-              False)
-
-    frag.text = ""
-    frag.fontName = "Times-Roman"
+    frag = pisaFrag()
     frag.fontName, frag.bold, frag.italic = ps2tt(style.fontName)
     frag.fontSize = style.fontSize
     frag.textColor = style.textColor
-
-    # Extras
-    frag.letterSpacing = "normal"
-    frag.leadingSource = "150%"
-    frag.alignment = TA_LEFT
-    frag.borderWidth = 1
-
-    frag.borderLeftWidth = frag.borderWidth
-    frag.borderLeftColor = frag.borderColor
-    frag.borderLeftStyle = frag.borderStyle
-    frag.borderRightWidth = frag.borderWidth
-    frag.borderRightColor = frag.borderColor
-    frag.borderRightStyle = frag.borderStyle
-    frag.borderTopWidth = frag.borderWidth
-    frag.borderTopColor = frag.borderColor
-    frag.borderTopStyle = frag.borderStyle
-    frag.borderBottomWidth = frag.borderWidth
-    frag.borderBottomColor = frag.borderColor
-    frag.borderBottomStyle = frag.borderStyle
-
-    frag.whiteSpace = "normal"
-    frag.bulletFontName = "Helvetica"
-    frag.zoom = 1.0
-
     return frag
 
 
@@ -369,6 +400,18 @@ class pisaCSSBuilder(css.CSSBuilder):
 
 class pisaCSSParser(css.CSSParser):
 
+    def parseInline(self, src):
+        """
+        Parse the source of a style attribute.  Reports repeat the same
+        inline styles on many elements, so the (read-only) result is shared
+        by all elements and documents using the same source.
+        """
+        result = cssInlineCache.get(src)
+        if result is None:
+            result = css.CSSParser.parseInline(self, src)
+            cssInlineCache.put(src, result)
+        return result
+
     def parseExternal(self, cssResourceName):
         result = None
         oldRootPath = self.rootPath
@@ -387,6 +430,219 @@ class pisaCSSParser(css.CSSParser):
         return result
 
 
+class _FragmentComplete(Exception):
+    pass
+
+
+class _FragmentWriter(object):
+    """
+    Collects what is written until it has more than limit words
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.chunks = []
+        # At least the number of words written, a word may be split
+        # between two chunks
+        self.words = 0
+
+    def write(self, data):
+        self.chunks.append(data)
+        self.words += len(data.split())
+        if self.words > self.limit:
+            self.words = len("".join(self.chunks).split())
+            if self.words > self.limit:
+                raise _FragmentComplete()
+
+
+def getFragment(node, l=20):
+    """
+    Returns the quoted first l words of the XML of node, only as much of
+    the subtree of node is serialized as needed
+    """
+    writer = _FragmentWriter(l)
+    try:
+        node.writexml(writer)
+    except _FragmentComplete:
+        pass
+    except Exception:
+        return ""
+    return repr(" ".join("".join(writer.chunks).split()[:l]))
+
+
+class pisaDiagnostic(object):
+    """
+    A warning or an error of pisaContext.  It keeps the node the context
+    was at and the message with its arguments, the message and the
+    fragment of the node quoted with it are formatted when they are read.
+    Unpacks as (mode, line, message, fragment) like the tuples of the log
+    did.
+    """
+
+    __slots__ = ("mode", "line", "msg", "args", "node", "_fragment")
+
+    def __init__(self, mode, node, msg, args=()):
+        self.mode = mode
+        self.line = getattr(node, "sourceLine", 0)
+        self.msg = msg
+        self.args = args
+        self.node = node
+        self._fragment = None
+
+    @property
+    def message(self):
+        try:
+            return str(self.msg % self.args)
+        except Exception:
+            return str(self.msg)
+
+    @property
+    def fragment(self):
+        if self._fragment is None:
+            self._fragment = getFragment(self.node, 50)
+        return self._fragment
+
+    def release(self):
+        """
+        Format the fragment and drop the node
+        """
+        self._fragment = self.fragment
+        self.node = None
+
+    def __iter__(self):
+        return iter((self.mode, self.line, self.message, self.fragment))
+
+    def __str__(self):
+        return "%s\n%s" % (self.message, self.fragment)
+
+    def __repr__(self):
+        return "<pisaDiagnostic %s in line %d: %r>" % (self.mode, self.line, self.message)
+
+
+class pisaFontCache(object):
+    """
+    Bounded LRU cache of the TrueType fonts @font-face and <pdf:font> load,
+    shared by the documents of the process.
+
+    The fonts are keyed by a hash of the font file (see makeKey), so a file
+    is parsed once whatever the name and the URL it is loaded with.  The
+    size of a font is the size of the file, which the font keeps in memory,
+    and of its glyph tables; the least recently used fonts are evicted when
+    the sizes add up to more than maxbytes.  Evicted fonts stay registered
+    with reportlab, only evict and clear unregister them.  A TTFont keeps the subsets it
+    embeds by document, so one font serves all documents, but like all the
+    fonts reportlab registers, not two documents built at the same time.
+    """
+
+    def __init__(self, maxbytes=128 * 1024 * 1024):
+        self.maxbytes = maxbytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def makeKey(klass, data):
+        return hashlib.sha1(data).hexdigest()
+
+    makeKey = classmethod(makeKey)
+
+    def getFont(self, name, data, filename=None):
+        """
+        Return a TTFont called name for the font file data, parsed by the
+        first call for the same data.  filename names the font in the PDF
+        """
+        key = self.makeKey(data)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if entry is None:
+            data = io.BytesIO(data)
+            data.name = filename or "(ttf)"
+            font = TTFont(name, data)
+            size = (len(data.getvalue()) + sys.getsizeof(font.face.charWidths)
+                    + sys.getsizeof(font.face.charToGlyph))
+            self.put(key, font, size)
+            return font
+        font = entry[0]
+        if font.fontName != name:
+            # Shares the face, but not what the font embedded in documents
+            font = copy.copy(font)
+            font.fontName = name
+            font.state = weakref.WeakKeyDictionary()
+        return font
+
+    def put(self, key, font, size):
+        if self.maxbytes <= 0:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (font, size)
+            self.bytes += size
+            while self.bytes > self.maxbytes and len(self._entries) > 1:
+                # The fonts stay registered, the document being built may
+                # use them
+                self._remove(next(iter(self._entries)), unregister=False)
+
+    def evict(self, key):
+        """
+        Drop the font of key, see makeKey, from the cache and the fonts of
+        its face from the fonts reportlab has registered, so the next
+        document loading it parses it again
+        """
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        """
+        Drop all fonts from the cache and from the fonts reportlab has
+        registered, see evict
+        """
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+            self.hits = self.misses = 0
+
+    def _remove(self, key, unregister=True):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        font, size = entry
+        self.bytes -= size
+        if not unregister:
+            return
+        # reportlab keeps the fonts it registered, by name and by face name,
+        # also those of an earlier parse of the font evicted from the cache
+        faceName = font.face.name
+        for registry in (pdfmetrics._fonts, pdfmetrics._dynFaceNames):
+            for name, registered in list(registry.items()):
+                if getattr(getattr(registered, "face", None), "name", None) == faceName:
+                    del registry[name]
+
+    def info(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'bytes': self.bytes,
+            'maxbytes': self.maxbytes,
+        }
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# TrueType fonts shared by all contexts of this process, see pisaContext.loadFont
+fontCache = pisaFontCache()
+
+
 class pisaContext(object):
     """
     Helper class for creation of reportlab story and container for
@@ -396,8 +652,27 @@ class pisaContext(object):
     def __init__(self, path, debug=0, capacity=-1):
         self.fontList = copy.copy(xhtml2pdf.default.DEFAULT_FONT)
         self.asianFontList = copy.copy(xhtml2pdf.util.get_default_asian_font())
+        self.capacity = capacity
+
+        # External callback function for path calculations
+        self.pathCallback = None
+
+        # Store path to document
+        self.pathDocument = path or "__dummy__"
+        parts = urlparse.urlparse(self.pathDocument)
+        if not parts.scheme:
+            self.pathDocument = str(Path(self.pathDocument).absolute().resolve())
+        self.pathDirectory = getDirName(self.pathDocument)
+
+        self.reset()
+
+    def reset(self):
+        """
+        Set up the state of a new document: all but the fonts, the paths
+        and the capacity, which __init__ sets up
+        """
         set_value(self,
-                  ('path', 'story', 'text', 'log', 'frameStaticList',
+                  ('path', 'story', 'textList', 'log', 'frameStaticList',
                    'pisaBackgroundList', 'frameList', 'anchorFrag',
                    'anchorName', 'fragList', 'fragAnchor', 'fragStack'
                    ), [],  _copy=True)
@@ -410,7 +685,9 @@ class pisaContext(object):
         set_value(self, ('text', 'cssText', 'cssDefaultText'), "")
         set_value(self, ('templateList', 'frameStatic', 'imageData'),
                   {}, _copy=True)
-        self.capacity = capacity
+        self.cssAncestorFilter = css.CSSAncestorFilter()
+        # Text nodes pisaLoop adds no frags for, see pisaNormalizeWhitespace
+        self.ignoredText = set()
         self.toc = PmlTableOfContents()
         self.multiBuild = False
         self.pageSize = A4
@@ -419,16 +696,8 @@ class pisaContext(object):
             ParagraphStyle('default%d' % self.UID()))
         self.fragStrip = True
         self.force = False
-
-        # External callback function for path calculations
-        self.pathCallback = None
-
-        # Store path to document
-        self.pathDocument = path or "__dummy__"
-        parts = urlparse.urlparse(self.pathDocument)
-        if not parts.scheme:
-            self.pathDocument = str(Path(self.pathDocument).absolute().resolve())
-        self.pathDirectory = getDirName(self.pathDocument)
+        # Font names of font-family values, see getFontName
+        self.fontNameCache = {}
 
         self.meta = dict(
             author="",
@@ -478,11 +747,45 @@ class pisaContext(object):
         self.cssParser._c = weakref.ref(self)
         pisaCSSParser.c = property(lambda self: self._c())
 
-        self.css = self.cssParser.parse(self.cssText)
-        self.cssDefault = self.cssParser.parse(self.cssDefaultText)
+        self.css = self.parseCachedCSS(self.cssText)
+        self.cssDefault = self.parseCachedCSS(self.cssDefaultText)
         self.cssCascade = css.CSSCascadeStrategy(
             userAgent=self.cssDefault, user=self.css)
         self.cssCascade.parser = self.cssParser
+        self.cssStyleCache = css.CSSStyleSharingCache(self.cssCascade)
+
+    def releaseDocument(self):
+        """
+        Drop the document the story was built from and the styles computed
+        for its nodes before the layout, which needs neither: the story,
+        the TOC and the anchors do not refer to them.  The parsed style
+        sheets and the cascade are kept for the callers.
+        """
+        # The diagnostics quote the document
+        for diagnostic in self.log:
+            diagnostic.release()
+        if self.node is not None and self.node.ownerDocument is not None:
+            # Its nodes refer to each other, see pisaUnlinkDocument
+            xhtml2pdf.parser.pisaUnlinkDocument(self.node.ownerDocument)
+        self.node = self.cssAttr = None
+        self.ignoredText = set()
+        self.cssAncestorFilter = css.CSSAncestorFilter()
+        self.cssStyleCache = None
+
+    def parseCachedCSS(self, value):
+        """
+        Parse a stylesheet, reusing the result of an earlier parse of the
+        same source if it had no side effects on the context
+        """
+        if rxcssnocache.search(value):
+            return self.cssParser.parse(value)
+        key = cssRulesetCache.makeKey(
+            value, self.cssBuilder.getMediumSet())
+        result = cssRulesetCache.get(key)
+        if result is None:
+            result = self.cssParser.parse(value)
+            cssRulesetCache.put(key, result)
+        return result
 
     # METHODS FOR STORY
     def addStory(self, data):
@@ -649,6 +952,19 @@ class pisaContext(object):
         self.clearFrag()
 
     # METHODS FOR FRAG
+    @property
+    def text(self):
+        """
+        Text of the paragraph, addFrag collects it in textList
+        """
+        if len(self.textList) > 1:
+            self.textList[:] = [u"".join(self.textList)]
+        return self.textList[0] if self.textList else u""
+
+    @text.setter
+    def text(self, value):
+        self.textList = [value] if value else []
+
     def clearFrag(self):
         self.fragList = []
         self.fragStrip = True
@@ -689,18 +1005,14 @@ class pisaContext(object):
         frag.fontName = frag.bulletFontName = tt2ps(
             frag.fontName, frag.bold, frag.italic)
 
-        # Replace &shy; with empty and normalize NBSP
-        text = (text
-                .replace(u"\xad", u"")
-                .replace(u"\xc2\xa0", NBSP)
-                .replace(u"\xa0", NBSP))
-
         if frag.whiteSpace == "pre":
 
+            if u"\xad" in text or NBSP in text:
+                text = self._normalizeText(text)
+
             # Handle by lines
-            for text in re.split(r'(\r\n|\n|\r)', text):
-                # This is an exceptionally expensive piece of code
-                self.text += text
+            for text in rxlinebreak.split(text):
+                self.textList.append(text)
                 if ("\n" in text) or ("\r" in text):
                     # If EOL insert a linebreak
                     frag = baseFrag.clone()
@@ -712,31 +1024,41 @@ class pisaContext(object):
                     text = text.replace(u"\t", 8 * u" ")
                     # Somehow for Reportlab NBSP have to be inserted
                     # as single character fragments
-                    for text in re.split(r'(\ )', text):
+                    for text in rxspace.split(text):
                         frag = baseFrag.clone()
                         if text == " ":
                             text = NBSP
                         frag.text = text
                         self._appendFrag(frag)
+        elif rxspecialtext.search(text) is None:
+            # Ordinary text, one frag with the text as it is
+            self._addTextFrag(baseFrag, text)
         else:
-            for text in re.split(u'(' + NBSP + u')', text):
+            for text in rxnbsp.split(self._normalizeText(text)):
                 frag = baseFrag.clone()
                 if text == NBSP:
                     self.force = True
                     frag.text = NBSP
-                    self.text += text
+                    self.textList.append(text)
                     self._appendFrag(frag)
                 else:
-                    frag.text = " ".join(("x" + text + "x").split())[1: - 1]
-                    language_check = frag_text_language_check(self, frag.text)
-                    if language_check:
-                        frag.text = language_check
-                    if self.fragStrip:
-                        frag.text = frag.text.lstrip()
-                        if frag.text:
-                            self.fragStrip = False
-                    self.text += frag.text
-                    self._appendFrag(frag)
+                    self._addTextFrag(frag, " ".join(("x" + text + "x").split())[1: - 1])
+
+    @staticmethod
+    def _normalizeText(text):
+        # Replace &shy; with empty and normalize NBSP
+        return text.replace(u"\xad", u"").replace(u"\xc2\xa0", NBSP)
+
+    def _addTextFrag(self, frag, text):
+        if hasattr(self, "language"):
+            text = frag_text_language_check(self, text) or text
+        if self.fragStrip:
+            text = text.lstrip()
+            if text:
+                self.fragStrip = False
+        frag.text = text
+        self.textList.append(text)
+        self._appendFrag(frag)
 
     def pushFrag(self):
         self.fragStack.append(self.frag)
@@ -745,15 +1067,11 @@ class pisaContext(object):
     def pullFrag(self):
         self.frag = self.fragStack.pop()
 
-    # XXX
     def _getFragment(self, l=20):
-        try:
-            return repr(" ".join(self.node.toxml().split()[:l]))
-        except:
-            return ""
+        return getFragment(self.node, l)
 
     def _getLineNumber(self):
-        return 0
+        return getattr(self.node, "sourceLine", 0)
 
     def context(self, msg):
         return "%s\n%s" % (
@@ -761,22 +1079,24 @@ class pisaContext(object):
             self._getFragment(50))
 
     def warning(self, msg, *args):
+        """
+        Record a warning about the current node in log and return the
+        pisaDiagnostic, which is formatted like context(msg % args) when it
+        is converted to str, e.g. by log.warning(c.warning(msg, *args))
+        """
         self.warn += 1
-        self.log.append((xhtml2pdf.default.PML_WARNING, self._getLineNumber(), str(
-            msg), self._getFragment(50)))
-        try:
-            return self.context(msg % args)
-        except:
-            return self.context(msg)
+        diagnostic = pisaDiagnostic(xhtml2pdf.default.PML_WARNING, self.node, msg, args)
+        self.log.append(diagnostic)
+        return diagnostic
 
     def error(self, msg, *args):
+        """
+        Record an error about the current node, see warning
+        """
         self.err += 1
-        self.log.append((xhtml2pdf.default.PML_ERROR, self._getLineNumber(), str(
-            msg), self._getFragment(50)))
-        try:
-            return self.context(msg % args)
-        except:
-            return self.context(msg)
+        diagnostic = pisaDiagnostic(xhtml2pdf.default.PML_ERROR, self.node, msg, args)
+        self.log.append(diagnostic)
+        return diagnostic
 
     def getFile(self, name, relative=None):
         """
@@ -788,9 +1108,17 @@ class pisaContext(object):
 
     def getFontName(self, names, default="helvetica"):
         """
-        Name of a font
+        Name of a font, looked up once for a value until the next font
+        is registered
         """
-        # print names, self.fontList
+        key = (tuple(names) if type(names) is ListType else names, default)
+        try:
+            return self.fontNameCache[key]
+        except KeyError:
+            font = self.fontNameCache[key] = self._getFontName(names, default)
+            return font
+
+    def _getFontName(self, names, default):
         if type(names) is not ListType:
             names = str(names)
             names = names.strip().split(",")
@@ -808,6 +1136,7 @@ class pisaContext(object):
 
     def registerFont(self, fontname, alias=None):
         alias = alias if alias is not None else []
+        self.fontNameCache.clear()
         self.fontList[str(fontname).lower()] = str(fontname)
         for a in alias:
             self.fontList[str(a)] = str(fontname)
@@ -848,10 +1177,12 @@ class pisaContext(object):
                         self.warning("Repeated font embed for %s, skip new embed ", fullFontName))
                 else:
 
-                    # Register TTF font and special name
-                    filename = file.getNamedFile()
-                    file = TTFont(fullFontName, filename)
-                    pdfmetrics.registerFont(file)
+                    # Register TTF font and special name, parsed once for
+                    # all documents
+                    data = file.getData()
+                    if hasattr(data, "read"):
+                        data = data.read()
+                    pdfmetrics.registerFont(fontCache.getFont(fullFontName, data or b"", src))
 
                     # Add or replace missing styles
                     for bold in (0, 1):
@@ -904,3 +1235,30 @@ class pisaContext(object):
                         fontName, fontAlias + [fullFontName, fontNameOriginal])
             else:
                 log.warning(self.warning("wrong attributes for <pdf:font>"))
+
+
+class pisaContextFactory(object):
+    """
+    Makes the contexts for many documents of the same path, e.g. many
+    small documents rendered by a server: the fonts and the paths are set
+    up once, for a template context which is never rendered itself, and
+    getContext returns a copy of it with the state of a new document.
+    Nothing of a document is reused, the state of every document is built
+    anew by pisaContext.reset.  The parsed default CSS is shared anyway,
+    see cssRulesetCache:
+
+        factory = pisaContextFactory(path, link_callback=link_callback)
+        for src, dest in documents:
+            pisaDocument(src, dest, context=factory.getContext())
+    """
+
+    def __init__(self, path=None, link_callback=None, debug=0, capacity=100 * 1024):
+        self.template = pisaContext(path, debug=debug, capacity=capacity)
+        self.template.pathCallback = link_callback
+
+    def getContext(self):
+        context = copy.copy(self.template)
+        # The document adds its fonts, the Asian fonts are only read
+        context.fontList = copy.copy(self.template.fontList)
+        context.reset()
+        return context
@@ -38,23 +38,23 @@ log = logging.getLogger("xhtml2pdf")
 def pisaErrorDocument(dest, c):
     out = pisaTempFile(capacity=c.capacity)
     out.write("<p style='background-color:red;'><strong>%d error(s) occured:</strong><p>" % c.err)
-    for mode, line, msg, _ in c.log:
-        if mode == "error":
+    for diagnostic in c.log:
+        if diagnostic.mode == "error":
             out.write("<pre>%s in line %d: %s</pre>" %
-                      (mode, line, html_escape(msg)))
+                      (diagnostic.mode, diagnostic.line, html_escape(diagnostic.message)))
 
     out.write("<p><strong>%d warning(s) occured:</strong><p>" % c.warn)
-    for mode, line, msg, _ in c.log:
-        if mode == "warning":
+    for diagnostic in c.log:
+        if diagnostic.mode == "warning":
             out.write("<p>%s in line %d: %s</p>" %
-                      (mode, line, html_escape(msg)))
+                      (diagnostic.mode, diagnostic.line, html_escape(diagnostic.message)))
 
     return pisaDocument(out.getvalue(), dest, raise_exception=False)
 
 
 def pisaStory(src, path=None, link_callback=None, debug=0, default_css=None,
               xhtml=False, encoding=None, context=None, xml_output=None,
-              **kw):
+              html_parser=None, streaming=False, **kw):
     # Prepare Context
     if not context:
         context = pisaContext(path, debug=debug)
@@ -65,7 +65,8 @@ def pisaStory(src, path=None, link_callback=None, debug=0, default_css=None,
         default_css = DEFAULT_CSS
 
     # Parse and fill the story
-    pisaParser(src, context, default_css, xhtml, encoding, xml_output)
+    pisaParser(src, context, default_css, xhtml, encoding, xml_output,
+               html_parser=html_parser, streaming=streaming)
 
     # Avoid empty documents
     if not context.story:
@@ -94,8 +95,8 @@ def get_encrypt_instance(data):
 def pisaDocument(src, dest=None, path=None, link_callback=None, debug=0,
                  default_css=None, xhtml=False, encoding=None, xml_output=None,
                  raise_exception=True, capacity=100 * 1024, context_meta=None,
-                 encrypt=None, signature=None,
-                 **kw):
+                 encrypt=None, signature=None, html_parser=None,
+                 streaming=False, context=None, **kw):
     log.debug("pisaDocument options:\n  src = %r\n  dest = %r\n  path = %r\n  link_callback = %r\n  xhtml = %r\n  context_meta = %r",
               src,
               dest,
@@ -104,17 +105,23 @@ def pisaDocument(src, dest=None, path=None, link_callback=None, debug=0,
               xhtml,
               context_meta)
 
-    # Prepare simple context
-    context = pisaContext(path, debug=debug, capacity=capacity)
+    # Prepare simple context, unless one is given, e.g. by pisaContextFactory
+    if context is None:
+        context = pisaContext(path, debug=debug, capacity=capacity)
+        context.pathCallback = link_callback
+    elif link_callback is not None:
+        context.pathCallback = link_callback
 
     if context_meta is not None:
         context.meta.update(context_meta)
 
-    context.pathCallback = link_callback
-
     # Build story
     context = pisaStory(src, path, link_callback, debug, default_css, xhtml,
-                        encoding, context=context, xml_output=xml_output)
+                        encoding, context=context, xml_output=xml_output,
+                        html_parser=html_parser, streaming=streaming)
+
+    # The layout only needs the story
+    context.releaseDocument()
 
     # Buffer PDF into memory
     out = io.BytesIO()
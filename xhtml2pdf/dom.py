@@ -0,0 +1,593 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2010 Dirk Holtwick, holtwick.it
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compact DOM the parser backends build the documents with.
+
+It implements the part of the miniDOM API xhtml2pdf, the tags and
+html5lib's "dom" tree builder use (see getDOMImplementation), so miniDOM
+nodes may still be passed to the tags and the CSS code.  The nodes have
+__slots__, the tag and attribute names are interned and the attributes of
+an element are a tuple of Attr.  The elements know the line of their
+start tag in the source (sourceLine) and carry the values the CSS
+code stores on them (cssAttrs, cssElement, cssStyle, cssClasses, cssId,
+cssSiblingIndex and cssStyleIdentity) and getCSSAttr.
+"""
+
+import io
+import sys
+
+_intern = sys.intern
+
+
+def _writeData(writer, data):
+    if data:
+        writer.write(data.replace("&", "&amp;").replace("<", "&lt;")
+                     .replace("\"", "&quot;").replace(">", "&gt;"))
+
+
+def _writeNodes(writer, nodes, indent, addindent, newl):
+    """
+    Write nodes and their descendants like miniDOM's writexml does, with a
+    stack of its own instead of recursion
+    """
+    # (node, indent), node is None for the end tag in indent
+    stack = [(node, indent) for node in reversed(nodes)]
+    while stack:
+        node, indent = stack.pop()
+        if node is None:
+            writer.write(indent)
+            continue
+        nodeType = node.nodeType
+        if nodeType == Node.ELEMENT_NODE:
+            writer.write(indent + "<" + node.tagName)
+            for attr in node._attrs:
+                writer.write(" %s=\"" % attr.name)
+                _writeData(writer, attr.value)
+                writer.write("\"")
+            children = node.childNodes
+            if not children:
+                writer.write("/>%s" % newl)
+            elif len(children) == 1 and children[0].nodeType == Node.TEXT_NODE:
+                writer.write(">")
+                _writeData(writer, children[0].data)
+                writer.write("</%s>%s" % (node.tagName, newl))
+            else:
+                writer.write(">" + newl)
+                stack.append((None, "%s</%s>%s" % (indent, node.tagName, newl)))
+                childIndent = indent + addindent
+                stack.extend((child, childIndent) for child in reversed(children))
+        elif nodeType == Node.TEXT_NODE:
+            _writeData(writer, "%s%s%s" % (indent, node.data, newl))
+        elif nodeType == Node.COMMENT_NODE:
+            if "--" in node.data:
+                raise ValueError("'--' is not allowed in a comment node")
+            writer.write("%s<!--%s-->%s" % (indent, node.data, newl))
+        elif nodeType == Node.DOCUMENT_TYPE_NODE:
+            writer.write("<!DOCTYPE " + node.name)
+            if node.publicId:
+                writer.write("%s  PUBLIC '%s'%s  '%s'" % (newl, node.publicId, newl, node.systemId))
+            elif node.systemId:
+                writer.write("%s  SYSTEM '%s'" % (newl, node.systemId))
+            writer.write(">" + newl)
+        else:
+            stack.extend((child, indent) for child in reversed(node.childNodes))
+
+
+class Node(object):
+    """
+    Base of the nodes, keeping the links to the parent and the siblings
+    """
+
+    __slots__ = ("parentNode", "previousSibling", "nextSibling", "__weakref__")
+
+    ELEMENT_NODE = 1
+    ATTRIBUTE_NODE = 2
+    TEXT_NODE = 3
+    CDATA_SECTION_NODE = 4
+    ENTITY_REFERENCE_NODE = 5
+    ENTITY_NODE = 6
+    PROCESSING_INSTRUCTION_NODE = 7
+    COMMENT_NODE = 8
+    DOCUMENT_NODE = 9
+    DOCUMENT_TYPE_NODE = 10
+    DOCUMENT_FRAGMENT_NODE = 11
+    NOTATION_NODE = 12
+
+    nodeType = None
+    nodeValue = None
+    ownerDocument = None
+    # Nodes which can have child nodes have a list instead
+    childNodes = ()
+
+    def __init__(self):
+        self.parentNode = None
+        self.previousSibling = None
+        self.nextSibling = None
+
+    def __bool__(self):
+        return True
+
+    @property
+    def firstChild(self):
+        children = self.childNodes
+        return children[0] if children else None
+
+    @property
+    def lastChild(self):
+        children = self.childNodes
+        return children[-1] if children else None
+
+    def hasChildNodes(self):
+        return bool(self.childNodes)
+
+    def appendChild(self, node):
+        if node.parentNode is not None:
+            node.parentNode.removeChild(node)
+        children = self.childNodes
+        previous = children[-1] if children else None
+        node.previousSibling = previous
+        node.nextSibling = None
+        if previous is not None:
+            previous.nextSibling = node
+        node.parentNode = self
+        children.append(node)
+        return node
+
+    def insertBefore(self, node, refChild):
+        if refChild is None:
+            return self.appendChild(node)
+        if node.parentNode is not None:
+            node.parentNode.removeChild(node)
+        children = self.childNodes
+        index = self._index(refChild)
+        previous = refChild.previousSibling
+        node.previousSibling = previous
+        node.nextSibling = refChild
+        refChild.previousSibling = node
+        if previous is not None:
+            previous.nextSibling = node
+        node.parentNode = self
+        children.insert(index, node)
+        return node
+
+    def removeChild(self, node):
+        del self.childNodes[self._index(node)]
+        previous, following = node.previousSibling, node.nextSibling
+        if previous is not None:
+            previous.nextSibling = following
+        if following is not None:
+            following.previousSibling = previous
+        node.parentNode = node.previousSibling = node.nextSibling = None
+        return node
+
+    def _index(self, child):
+        # Identity, the nodes do not compare by value
+        for index, node in enumerate(self.childNodes):
+            if node is child:
+                return index
+        raise ValueError("%r is not a child node of %r" % (child, self))
+
+    def getElementsByTagName(self, name):
+        """
+        Returns the descendant elements named name ("*" for all) in
+        document order
+        """
+        result = []
+        stack = list(reversed(self.childNodes))
+        while stack:
+            node = stack.pop()
+            if node.nodeType == Node.ELEMENT_NODE:
+                if name == "*" or node.tagName == name:
+                    result.append(node)
+                stack.extend(reversed(node.childNodes))
+        return result
+
+    def normalize(self):
+        """
+        Join adjacent text nodes and remove the empty ones in the subtree
+        """
+        stack = [self]
+        while stack:
+            parent = stack.pop()
+            children = []
+            for child in parent.childNodes:
+                if child.nodeType == Node.TEXT_NODE:
+                    if not child.data:
+                        continue
+                    if children and children[-1].nodeType == Node.TEXT_NODE:
+                        children[-1].data += child.data
+                        child.parentNode = None
+                        continue
+                elif child.childNodes:
+                    stack.append(child)
+                children.append(child)
+            if len(children) != len(parent.childNodes):
+                previous = None
+                for child in children:
+                    child.previousSibling = previous
+                    if previous is not None:
+                        previous.nextSibling = child
+                    previous = child
+                if previous is not None:
+                    previous.nextSibling = None
+                parent.childNodes[:] = children
+
+    def unlink(self):
+        """
+        Break the references of the subtree, see also
+        xhtml2pdf.parser.pisaUnlinkDocument
+        """
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node.childNodes:
+                stack.extend(node.childNodes)
+                del node.childNodes[:]
+            node.parentNode = node.previousSibling = node.nextSibling = None
+
+    def writexml(self, writer, indent="", addindent="", newl=""):
+        _writeNodes(writer, (self,), indent, addindent, newl)
+
+    def toxml(self, encoding=None, standalone=None):
+        return self.toprettyxml("", "", encoding, standalone)
+
+    def toprettyxml(self, indent="\t", newl="\n", encoding=None, standalone=None):
+        if encoding is None:
+            writer = io.StringIO()
+        else:
+            writer = io.TextIOWrapper(io.BytesIO(), encoding=encoding,
+                                      errors="xmlcharrefreplace", newline="\n")
+        if self.nodeType == Node.DOCUMENT_NODE:
+            self.writexml(writer, "", indent, newl, encoding, standalone)
+        else:
+            self.writexml(writer, "", indent, newl)
+        if encoding is None:
+            return writer.getvalue()
+        return writer.detach().getvalue()
+
+
+class Attr(object):
+    """
+    Attribute of an element
+    """
+
+    __slots__ = ("name", "value")
+
+    nodeType = Node.ATTRIBUTE_NODE
+    namespaceURI = None
+
+    def __init__(self, name, value=""):
+        self.name = _intern(name)
+        self.value = value
+
+    nodeName = localName = property(lambda self: self.name)
+
+    @property
+    def nodeValue(self):
+        return self.value
+
+    def __repr__(self):
+        return "<Attr %s=%r>" % (self.name, self.value)
+
+
+class NamedNodeMap(object):
+    """
+    The attributes of an element as a mapping of the names to the Attr,
+    made on access like the one of miniDOM
+    """
+
+    __slots__ = ("_element",)
+
+    def __init__(self, element):
+        self._element = element
+
+    def __len__(self):
+        return len(self._element._attrs)
+
+    length = property(__len__)
+
+    def __iter__(self):
+        return (attr.name for attr in self._element._attrs)
+
+    def __contains__(self, name):
+        return self._element.getAttributeNode(name) is not None
+
+    def __getitem__(self, name):
+        attr = self._element.getAttributeNode(name)
+        if attr is None:
+            raise KeyError(name)
+        return attr
+
+    def __setitem__(self, name, value):
+        if isinstance(value, Attr):
+            value = value.value
+        self._element.setAttribute(name, value)
+
+    def __delitem__(self, name):
+        if self._element.getAttributeNode(name) is None:
+            raise KeyError(name)
+        self._element.removeAttribute(name)
+
+    def get(self, name, default=None):
+        attr = self._element.getAttributeNode(name)
+        return default if attr is None else attr
+
+    def item(self, index):
+        attrs = self._element._attrs
+        return attrs[index] if 0 <= index < len(attrs) else None
+
+    def keys(self):
+        return [attr.name for attr in self._element._attrs]
+
+    def values(self):
+        return list(self._element._attrs)
+
+    def items(self):
+        return [(attr.name, attr.value) for attr in self._element._attrs]
+
+
+class Element(Node):
+    """
+    Element with its attributes as a tuple of Attr
+    """
+
+    __slots__ = ("ownerDocument", "tagName", "namespaceURI", "childNodes", "_attrs",
+                 # Line of the start tag in the source, 0 if unknown
+                 "sourceLine",
+                 # Stored by the CSS code, see xhtml2pdf.parser.CSSCollect
+                 # and xhtml2pdf.w3c.css.prepareCSSNode
+                 "cssAttrs", "cssElement", "cssStyle", "cssClasses", "cssId",
+                 "cssSiblingIndex", "cssStyleIdentity")
+
+    nodeType = Node.ELEMENT_NODE
+
+    def __init__(self, tagName, namespaceURI=None, ownerDocument=None):
+        Node.__init__(self)
+        self.ownerDocument = ownerDocument
+        self.tagName = _intern(tagName)
+        self.namespaceURI = namespaceURI
+        self.childNodes = []
+        self._attrs = ()
+        self.sourceLine = 0
+
+    nodeName = property(lambda self: self.tagName)
+    localName = property(lambda self: self.tagName.split(":", 1)[-1])
+
+    @property
+    def attributes(self):
+        return NamedNodeMap(self)
+
+    def hasAttributes(self):
+        return bool(self._attrs)
+
+    def getAttributeNode(self, name):
+        for attr in self._attrs:
+            if attr.name == name:
+                return attr
+        return None
+
+    def getAttribute(self, name):
+        for attr in self._attrs:
+            if attr.name == name:
+                return attr.value
+        return ""
+
+    def hasAttribute(self, name):
+        return self.getAttributeNode(name) is not None
+
+    def setAttribute(self, name, value):
+        attr = self.getAttributeNode(name)
+        if attr is None:
+            self._attrs += (Attr(name, value),)
+        else:
+            attr.value = value
+
+    def setAttributeNS(self, namespaceURI, qualifiedName, value):
+        self.setAttribute(qualifiedName, value)
+
+    def removeAttribute(self, name):
+        self._attrs = tuple(attr for attr in self._attrs if attr.name != name)
+
+    def cloneNode(self, deep=False):
+        clone = Element(self.tagName, self.namespaceURI, self.ownerDocument)
+        clone._attrs = tuple(Attr(attr.name, attr.value) for attr in self._attrs)
+        clone.sourceLine = self.sourceLine
+        if deep:
+            for child in self.childNodes:
+                clone.appendChild(child.cloneNode(True))
+        return clone
+
+    def unlink(self):
+        Node.unlink(self)
+        self.ownerDocument = None
+
+    def getCSSAttr(self, cssCascade, attrName, default=NotImplemented):
+        if attrName in self.cssAttrs:
+            return self.cssAttrs[attrName]
+
+        try:
+            result = cssCascade.findStyleFor(self.cssElement, attrName, default)
+        except LookupError:
+            result = None
+
+        # XXX Workaround for inline styles
+        try:
+            style = self.cssStyle
+        except AttributeError:
+            style = self.cssStyle = cssCascade.parser.parseInline(
+                self.cssElement.getStyleAttr() or '')[0]
+        if attrName in style:
+            result = style[attrName]
+
+        if result == 'inherit':
+            if hasattr(self.parentNode, 'getCSSAttr'):
+                result = self.parentNode.getCSSAttr(cssCascade, attrName, default)
+            elif default is not NotImplemented:
+                return default
+            raise LookupError(
+                "Could not find inherited CSS attribute value for '%s'" % (attrName,))
+
+        # cssAttrs is an interned, immutable CSSComputedStyle, see CSSCollect
+        return result
+
+    def __repr__(self):
+        return "<DOM Element: %s>" % self.tagName
+
+
+class Text(Node):
+
+    __slots__ = ("data",)
+
+    nodeType = Node.TEXT_NODE
+    nodeName = "#text"
+
+    def __init__(self, data):
+        Node.__init__(self)
+        self.data = data
+
+    nodeValue = property(lambda self: self.data)
+
+    def cloneNode(self, deep=False):
+        return Text(self.data)
+
+    def __repr__(self):
+        return "<DOM Text node %r>" % self.data[:10]
+
+
+class Comment(Node):
+
+    __slots__ = ("data",)
+
+    nodeType = Node.COMMENT_NODE
+    nodeName = "#comment"
+
+    def __init__(self, data):
+        Node.__init__(self)
+        self.data = data
+
+    nodeValue = property(lambda self: self.data)
+
+    def cloneNode(self, deep=False):
+        return Comment(self.data)
+
+
+class DocumentType(Node):
+
+    __slots__ = ("name", "publicId", "systemId")
+
+    nodeType = Node.DOCUMENT_TYPE_NODE
+    internalSubset = None
+
+    def __init__(self, name, publicId=None, systemId=None):
+        Node.__init__(self)
+        self.name = name
+        self.publicId = publicId
+        self.systemId = systemId
+
+    nodeName = property(lambda self: self.name)
+
+    def cloneNode(self, deep=False):
+        return DocumentType(self.name, self.publicId, self.systemId)
+
+
+class DocumentFragment(Node):
+
+    __slots__ = ("childNodes",)
+
+    nodeType = Node.DOCUMENT_FRAGMENT_NODE
+    nodeName = "#document-fragment"
+
+    def __init__(self):
+        Node.__init__(self)
+        self.childNodes = []
+
+
+class Document(Node):
+    """
+    Document, the parser backends record its style and link elements in
+    document order in cssStyleElements
+    """
+
+    __slots__ = ("childNodes", "cssStyleElements")
+
+    nodeType = Node.DOCUMENT_NODE
+    nodeName = "#document"
+
+    def __init__(self):
+        Node.__init__(self)
+        self.childNodes = []
+        self.cssStyleElements = None
+
+    @property
+    def documentElement(self):
+        for node in self.childNodes:
+            if node.nodeType == Node.ELEMENT_NODE:
+                return node
+        return None
+
+    def createElement(self, tagName):
+        return Element(tagName, None, self)
+
+    def createElementNS(self, namespaceURI, qualifiedName):
+        return Element(qualifiedName, namespaceURI, self)
+
+    def createTextNode(self, data):
+        return Text(data)
+
+    def createComment(self, data):
+        return Comment(data)
+
+    def createAttribute(self, name):
+        return Attr(name)
+
+    def createDocumentFragment(self):
+        return DocumentFragment()
+
+    def writexml(self, writer, indent="", addindent="", newl="", encoding=None,
+                 standalone=None):
+        declarations = []
+        if encoding:
+            declarations.append('encoding="%s"' % encoding)
+        if standalone is not None:
+            declarations.append('standalone="%s"' % ("yes" if standalone else "no"))
+        writer.write('<?xml version="1.0" %s?>%s' % (" ".join(declarations), newl))
+        _writeNodes(writer, self.childNodes, indent, addindent, newl)
+
+
+class DOMImplementation(object):
+
+    def createDocument(self, namespaceURI=None, qualifiedName=None, doctype=None):
+        document = Document()
+        if doctype is not None:
+            document.appendChild(doctype)
+        if qualifiedName:
+            document.appendChild(document.createElementNS(namespaceURI, qualifiedName))
+        return document
+
+    def createDocumentType(self, qualifiedName, publicId, systemId):
+        return DocumentType(qualifiedName, publicId, systemId)
+
+
+def getDOMImplementation():
+    """
+    The DOM implementation of this module, which makes the module usable
+    with html5lib.treebuilders.getTreeBuilder("dom", xhtml2pdf.dom)
+    """
+    return _implementation
+
+
+_implementation = DOMImplementation()
@@ -266,7 +266,7 @@ class NetworkFileUri(BaseFile):
         data, is_gzip = self.get_httplib(uri)
         if is_gzip:
             data = gzip.GzipFile(mode="rb", fileobj=BytesIO(data))
-        log.debug("Uri parsed: {}".format(uri))
+        log.debug("Uri parsed: %s", uri)
         return data
 
 
@@ -353,7 +353,7 @@ class FileNetworkManager:
             else:
                 urlParts = urlparse.urlparse(uri)
 
-            log.debug("URLParts: {}".format((urlParts, urlParts.scheme)))
+            log.debug("URLParts: %s", (urlParts, urlParts.scheme))
             if urlParts.scheme == 'file':
                 instance = LocalProtocolURI(uri, basepath)
             elif urlParts.scheme in ('http', 'https'):
@@ -15,20 +15,25 @@
 # limitations under the License.
 
 import copy
+import io
 import logging
 import re
-import xml.dom.minidom
+import sys
+import weakref
+from html.entities import name2codepoint
 from xml.dom import Node
+from xml.parsers import expat
 
 import html5lib
 from html5lib import treebuilders
 from reportlab.platypus.doctemplate import FrameBreak, NextPageTemplate
 from reportlab.platypus.flowables import KeepInFrame, PageBreak
 
+from xhtml2pdf import dom
 from xhtml2pdf.default import BOOL, BOX, COLOR, FILE, FONT, INT, MUST, POS, SIZE, STRING, TAGS
 
-# TODO: Why do we need to import these Tags here? They aren't uses in this file or any other file,
-#  but if we don't import them, Travis & AppVeyor fail. Very strange (fbernhart)
+# The tag handlers imported here are registered by _registerTags, see
+# registerTag for adding others
 from xhtml2pdf.tables import (TableData,
                               pisaTagTABLE,
                               pisaTagTD,
@@ -76,12 +81,14 @@ from xhtml2pdf.tags import (pisaTagIMG,
                             # pisaTagSELECT,
                             # pisaTagOPTION
                             )
-from xhtml2pdf.files import pisaTempFile
 from xhtml2pdf.util import getAlign, getBool, getBox, getColor, getPos, getSize, toList, transform_attrs
-from xhtml2pdf.w3c import cssDOMElementInterface
+from xhtml2pdf.w3c import css, cssDOMElementInterface
 from xhtml2pdf.xhtml2pdf_reportlab import PmlLeftPageBreak, PmlRightPageBreak
 
-CSSAttrCache = {}
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
 
 log = logging.getLogger("xhtml2pdf")
 
@@ -97,81 +104,177 @@ class AttrContainer(dict):
             return self[name]
 
 
-def pisaGetAttributes(c, tag, attributes):
+def _convertChoice(c, name, value, allowed, default):
+    value = value.strip().lower()
+    if value not in allowed:
+        #~ raise PML_EXCEPTION, "attribute '%s' of wrong value, allowed is one of: %s" % (k, repr(v))
+        log.warning(
+            c.warning("Attribute '%s' of wrong value, allowed is one of: %s", name, repr(allowed)))
+        return default
+    return value
 
-    attrs = {}
-    if attributes:
-        for k, v in attributes.items():
-            try:
-                # XXX no Unicode! Reportlab fails with template names
-                attrs[str(k)] = str(v)
-            except:
-                attrs[k] = v
-
-    nattrs = {}
-    if tag in TAGS:
-        block, adef = TAGS[tag]
-        adef["id"] = STRING
-
-        for k, v in adef.items():
-            nattrs[k] = None
-            # print k, v
-            # defaults, wenn vorhanden
-            if type(v) == tuple:
-                if v[1] == MUST:
-                    if k not in attrs:
-                        log.warning(
-                            c.warning("Attribute '%s' must be set!", k))
-                        nattrs[k] = None
-                        continue
-                nv = attrs.get(k, v[1])
-                dfl = v[1]
-                v = v[0]
+
+def _convertBool(c, name, value, allowed, default):
+    value = value.strip().lower()
+    return value in ("1", "y", "yes", "true", str(name))
+
+
+def _convertSize(c, name, value, allowed, default):
+    try:
+        return getSize(value)
+    except:
+        log.warning(
+            c.warning("Attribute '%s' expects a size value", name))
+        return value
+
+
+def _convertString(c, name, value, allowed, default):
+    return value
+
+
+ATTRIBUTE_CONVERTERS = {
+    BOOL: _convertBool,
+    SIZE: _convertSize,
+    BOX: lambda c, name, value, allowed, default: getBox(value, c.pageSize),
+    POS: lambda c, name, value, allowed, default: getPos(value, c.pageSize),
+    INT: lambda c, name, value, allowed, default: int(value),
+    COLOR: lambda c, name, value, allowed, default: getColor(value),
+    FILE: lambda c, name, value, allowed, default: c.getFile(value),
+    FONT: lambda c, name, value, allowed, default: c.getFontName(value),
+}
+
+# The conversion of these types depends on the context
+CONTEXT_TYPES = (BOX, POS, FILE, FONT)
+
+
+class pisaTagDefinition(object):
+    """
+    The handler class of a tag and the plan to convert its attributes,
+    compiled from a definition of attributes as in TAGS: a dict of the
+    attribute names and either the type or a (type, default) tuple, the
+    type may be a list of the allowed values and the default MUST.
+    """
+
+    def __init__(self, name, handler=None, attributes=None):
+        self.name = name
+        self.handler = handler
+        self.attributes = attributes
+        # attribute name: (converter, allowed values, default)
+        self.plan = {}
+        # Converted defaults of all attributes
+        self.defaults = {}
+        # Attributes which must be set or whose default is converted on use
+        self.required = []
+        self.dynamic = []
+
+        if attributes is None:
+            return
+        attributes = dict(attributes)
+        attributes["id"] = STRING
+        for key, kind in attributes.items():
+            default = None
+            if type(kind) == tuple:
+                kind, default = kind
+            if type(kind) == list:
+                converter = _convertChoice
             else:
-                nv = attrs.get(k, None)
-                dfl = None
+                converter = ATTRIBUTE_CONVERTERS.get(kind, _convertString)
+            self.plan[key] = (converter, kind, default)
+            self.defaults[key] = None
+            if default == MUST:
+                self.required.append(key)
+            elif default is not None:
+                if kind in CONTEXT_TYPES:
+                    self.dynamic.append(key)
+                    continue
+                # Defaults which warn on conversion keep warning on use
+                context = _DefaultContext()
+                try:
+                    value = converter(context, key, default, kind, default)
+                except Exception:
+                    context.warn = 1
+                if context.warn:
+                    self.dynamic.append(key)
+                else:
+                    self.defaults[key] = value
+
+    def getAttributes(self, c, attributes):
+        """
+        Returns the AttrContainer of the converted attributes of a node
+        """
+        nattrs = AttrContainer(self.defaults)
+        if self.attributes is None:
+            return nattrs
+
+        present = {}
+        if attributes:
+            plan = self.plan
+            for key, value in attributes.items():
+                entry = plan.get(key)
+                if entry is not None:
+                    present[key] = value = str(value)
+                    converter, kind, default = entry
+                    nattrs[key] = converter(c, key, value, kind, default)
+
+        for key in self.required:
+            if key not in present:
+                log.warning(
+                    c.warning("Attribute '%s' must be set!", key))
+        for key in self.dynamic:
+            if key not in present:
+                converter, kind, default = self.plan[key]
+                nattrs[key] = converter(c, key, default, kind, default)
+        return nattrs
+
+
+class _DefaultContext(object):
+    """
+    Stands in for the context while the defaults are converted
+    """
+
+    warn = 0
 
-            if nv is not None:
-                if type(v) == list:
-                    nv = nv.strip().lower()
-                    if nv not in v:
-                        #~ raise PML_EXCEPTION, "attribute '%s' of wrong value, allowed is one of: %s" % (k, repr(v))
-                        log.warning(
-                            c.warning("Attribute '%s' of wrong value, allowed is one of: %s", k, repr(v)))
-                        nv = dfl
+    def warning(self, msg, *args):
+        self.warn += 1
 
-                elif v == BOOL:
-                    nv = nv.strip().lower()
-                    nv = nv in ("1", "y", "yes", "true", str(k))
 
-                elif v == SIZE:
-                    try:
-                        nv = getSize(nv)
-                    except:
-                        log.warning(
-                            c.warning("Attribute '%s' expects a size value", k))
+TAG_DEFINITIONS = {}
 
-                elif v == BOX:
-                    nv = getBox(nv, c.pageSize)
 
-                elif v == POS:
-                    nv = getPos(nv, c.pageSize)
+def registerTag(name, handler=None, attributes=None):
+    """
+    Register the tag name, in lower case and without the colon of its
+    namespace prefix (e.g. "pdfbarcode").  handler is the pisaTag subclass
+    handling the elements, attributes the definition of their attributes,
+    see pisaTagDefinition.  If either is None the one of an earlier
+    registration is kept.
+    """
+    previous = TAG_DEFINITIONS.get(name)
+    if previous is not None:
+        if handler is None:
+            handler = previous.handler
+        if attributes is None:
+            attributes = previous.attributes
+    definition = TAG_DEFINITIONS[name] = pisaTagDefinition(name, handler, attributes)
+    return definition
 
-                elif v == INT:
-                    nv = int(nv)
 
-                elif v == COLOR:
-                    nv = getColor(nv)
+def getTagDefinition(name):
+    """
+    Returns the pisaTagDefinition of the tag name, tags which were not
+    registered have neither a handler nor attributes
+    """
+    try:
+        return TAG_DEFINITIONS[name]
+    except KeyError:
+        return _unknownTag
 
-                elif v == FILE:
-                    nv = c.getFile(nv)
 
-                elif v == FONT:
-                    nv = c.getFontName(nv)
+_unknownTag = pisaTagDefinition(None)
 
-                nattrs[k] = nv
 
-    return AttrContainer(nattrs)
+def pisaGetAttributes(c, tag, attributes):
+    return getTagDefinition(tag).getAttributes(c, attributes)
 
 
 attrNames = '''
@@ -229,39 +332,8 @@ attrNames = '''
     '''.strip().split()
 
 
-def getCSSAttr(self, cssCascade, attrName, default=NotImplemented):
-    if attrName in self.cssAttrs:
-        return self.cssAttrs[attrName]
-
-    try:
-        result = cssCascade.findStyleFor(self.cssElement, attrName, default)
-    except LookupError:
-        result = None
-
-    # XXX Workaround for inline styles
-    try:
-        style = self.cssStyle
-    except:
-        style = self.cssStyle = cssCascade.parser.parseInline(
-            self.cssElement.getStyleAttr() or '')[0]
-    if attrName in style:
-        result = style[attrName]
-
-    if result == 'inherit':
-        if hasattr(self.parentNode, 'getCSSAttr'):
-            result = self.parentNode.getCSSAttr(cssCascade, attrName, default)
-        elif default is not NotImplemented:
-            return default
-        raise LookupError(
-            "Could not find inherited CSS attribute value for '%s'" % (attrName,))
-
-    if result is not None:
-        self.cssAttrs[attrName] = result
-    return result
-
-
-# TODO: Monkeypatching standard lib should go away.
-xml.dom.minidom.Element.getCSSAttr = getCSSAttr
+# The elements of the documents have getCSSAttr, see xhtml2pdf.dom
+getCSSAttr = dom.Element.getCSSAttr
 
 # Create an aliasing system.  Many sources use non-standard tags, because browsers allow
 # them to.  This allows us to map a nonstandard name to the standard one.
@@ -271,22 +343,52 @@ nonStandardAttrNames = {
 
 
 def mapNonStandardAttrs(c, n, attrList):
+    # c may be shared with other elements, see CSSCollect
     for attr in nonStandardAttrNames:
         if attr in attrList and nonStandardAttrNames[attr] not in c:
+            c = dict(c)
             c[nonStandardAttrNames[attr]] = attrList[attr]
     return c
 
 
-def getCSSAttrCacheKey(node):
-    _cl = _id = _st = ''
-    for k, v in node.attributes.items():
-        if k == 'class':
-            _cl = v
-        elif k == 'id':
-            _id = v
-        elif k == 'style':
-            _st = v
-    return "%s#%s#%s#%s#%s" % (id(node.parentNode), node.tagName.lower(), _cl, _id, _st)
+def CSSCollectStyles(node, cssCascade):
+    """
+    Computes the values of all attrNames for node in a single cascade.
+    Properties set to "inherit" take the value collected for the parent,
+    see CSSCollect.
+    """
+    try:
+        styles = cssCascade.findStylesFor(node.cssElement)
+    except Exception:  # TODO: Kill this catch-all!
+        log.debug("CSS error in <%s>", node.tagName, exc_info=1)
+        # Look up the properties one by one, see below
+        styles = None
+    try:
+        # XXX Workaround for inline styles
+        node.cssStyle = cssCascade.parser.parseInline(
+            node.cssElement.getStyleAttr() or '')[0]
+    except Exception:  # TODO: Kill this catch-all!
+        log.debug("CSS error in the style of <%s>", node.tagName, exc_info=1)
+        node.cssStyle = {}
+
+    parentAttrs = getattr(node.parentNode, "cssAttrs", None) or {}
+    cssAttrs = {}
+    for cssAttrName in attrNames:
+        if cssAttrName in node.cssStyle:
+            value = node.cssStyle[cssAttrName]
+        elif styles is not None:
+            value = styles.get(cssAttrName)
+        else:
+            try:
+                value = cssCascade.findStyleFor(node.cssElement, cssAttrName, None)
+            except Exception:  # TODO: Kill this catch-all!
+                log.debug("CSS error '%s'", cssAttrName, exc_info=1)
+                continue
+        if value == 'inherit':
+            value = parentAttrs.get(cssAttrName)
+        if value is not None:
+            cssAttrs[cssAttrName] = value
+    return cssAttrs
 
 
 def CSSCollect(node, c):
@@ -295,29 +397,19 @@ def CSSCollect(node, c):
 
     if c.css:
 
-        _key = getCSSAttrCacheKey(node)
-
-        if hasattr(node.parentNode, "tagName"):
-            if node.parentNode.tagName.lower() != "html":
-                CachedCSSAttr = CSSAttrCache.get(_key, None)
-                if CachedCSSAttr is not None:
-                    node.cssAttrs = CachedCSSAttr
-                    return CachedCSSAttr
-
+        css.prepareCSSNode(node)
         node.cssElement = cssDOMElementInterface.CSSDOMElementInterface(node)
-        node.cssAttrs = {}
-        # node.cssElement.onCSSParserVisit(c.cssCascade.parser)
-        cssAttrMap = {}
-        for cssAttrName in attrNames:
-            try:
-                cssAttrMap[cssAttrName] = node.getCSSAttr(
-                    c.cssCascade, cssAttrName)
-            # except LookupError:
-            #    pass
-            except Exception:  # TODO: Kill this catch-all!
-                log.debug("CSS error '%s'", cssAttrName, exc_info=1)
 
-        CSSAttrCache[_key] = node.cssAttrs
+        # Elements matching the same rules share their styles
+        key = c.cssStyleCache.makeKey(node)
+        cached = c.cssStyleCache.get(key)
+        if cached is not None:
+            node.cssStyleIdentity, node.cssAttrs = cached
+            return node.cssAttrs
+
+        node.cssElement.ancestorBits = c.cssAncestorFilter.getAncestorBits(node)
+        node.cssAttrs = c.cssStyleCache.intern(CSSCollectStyles(node, c.cssCascade))
+        node.cssStyleIdentity = c.cssStyleCache.put(key, node.cssAttrs)
     return node.cssAttrs
 
 
@@ -485,42 +577,273 @@ def pisaPreLoop(node, context, collect=False):
     """
 
     data = ""
-    if node.nodeType == Node.TEXT_NODE and collect:
-        data = node.data
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if node.nodeType == Node.TEXT_NODE and collect:
+            data += node.data
+
+        elif node.nodeType == Node.ELEMENT_NODE:
+            name = node.tagName.lower()
+
+            if name in ("style", "link"):
+                attr = pisaGetAttributes(context, name, node.attributes)
+                media = [x.strip()
+                         for x in attr.media.lower().split(",") if x.strip()]
+
+                if attr.get("type", "").lower() in ("", "text/css") and \
+                        (not media or "all" in media or "print" in media or "pdf" in media):
+
+                    if name == "style":
+                        context.addCSS("".join(
+                            pisaPreLoop(child, context, collect=True) for child in node.childNodes))
+                        continue
 
-    elif node.nodeType == Node.ELEMENT_NODE:
-        name = node.tagName.lower()
+                    if name == "link" and attr.href and attr.rel.lower() == "stylesheet":
+                        # print "CSS LINK", attr
+                        context.addCSS('\n@import "%s" %s;' %
+                                       (attr.href, ",".join(media)))
 
-        if name in ("style", "link"):
-            attr = pisaGetAttributes(context, name, node.attributes)
-            media = [x.strip()
-                     for x in attr.media.lower().split(",") if x.strip()]
+        stack.extend(reversed(node.childNodes))
 
-            if attr.get("type", "").lower() in ("", "text/css") and \
-                    (not media or "all" in media or "print" in media or "pdf" in media):
+    return data
 
-                if name == "style":
-                    for node in node.childNodes:
-                        data += pisaPreLoop(node, context, collect=True)
-                    context.addCSS(data)
-                    return u""
 
-                if name == "link" and attr.href and attr.rel.lower() == "stylesheet":
-                    # print "CSS LINK", attr
-                    context.addCSS('\n@import "%s" %s;' %
-                                   (attr.href, ",".join(media)))
+class pisaElementState(object):
+    """
+    What pisaLoopEnd needs to know about an element pisaLoopStart entered.
+    The path of tag names is shared with the ancestors as nested
+    (parentPath, tagName) tuples, kw with the parent unless CSS2Frag
+    changes its margins.
+    """
 
-    for node in node.childNodes:
-        result = pisaPreLoop(node, context, collect=collect)
-        if collect:
-            data += result
+    def __init__(self, node, path, kw):
+        self.node = node
+        self.path = path
+        self.kw = kw
+        self.obj = None
+        self.isBlock = False
+        self.pageBreakAfter = False
+        self.frameBreakAfter = False
+        self.keepInFrame = False
+        self.keepInFrameMode = None
+        self.keepInFrameMaxWidth = 0
+        self.keepInFrameMaxHeight = 0
+        self.staticFrame = None
+        self.oldStory = None
+        self.fragBlock = None
+
+
+PAGE_BREAK = 1
+PAGE_BREAK_RIGHT = 2
+PAGE_BREAK_LEFT = 3
+
+
+def pisaLoopStart(node, context, path, kw):
+    """
+    Enter the element node: compute its styles and open its block, frag
+    and tag.  Returns the pisaElementState to pass to pisaLoopEnd after the
+    child nodes have been visited with its path and kw, or None if the
+    element and its child nodes are not rendered.
+    """
+    node.tagName = sys.intern(node.tagName.replace(":", "").lower())
 
-    return data
+    if node.tagName in ("style", "script"):
+        return None
+
+    state = pisaElementState(node, (path, node.tagName), kw)
+
+    # Prepare attributes
+    definition = getTagDefinition(node.tagName)
+    attr = definition.getAttributes(context, node.attributes)
+    # log.debug(indent + "<%s %s>" % (node.tagName, attr) +
+    # repr(node.attributes.items())) #, path
+
+    # Calculate styles
+    context.cssAttr = CSSCollect(node, context)
+    context.cssAttr = mapNonStandardAttrs(context.cssAttr, node, attr)
+    context.node = node
+
+    # Block?
+    display = lower(context.cssAttr.get("display", "inline"))
+    # print indent, node.tagName, display,
+    # context.cssAttr.get("background-color", None), attr
+    isBlock = state.isBlock = (display == "block")
+
+    if isBlock:
+        context.addPara()
+
+        # Page break by CSS
+        if "-pdf-next-page" in context.cssAttr:
+            context.addStory(
+                NextPageTemplate(str(context.cssAttr["-pdf-next-page"])))
+        if "-pdf-page-break" in context.cssAttr:
+            if str(context.cssAttr["-pdf-page-break"]).lower() == "before":
+                context.addStory(PageBreak())
+        if "-pdf-frame-break" in context.cssAttr:
+            if str(context.cssAttr["-pdf-frame-break"]).lower() == "before":
+                context.addStory(FrameBreak())
+            if str(context.cssAttr["-pdf-frame-break"]).lower() == "after":
+                state.frameBreakAfter = True
+        if "page-break-before" in context.cssAttr:
+            if str(context.cssAttr["page-break-before"]).lower() == "always":
+                context.addStory(PageBreak())
+            if str(context.cssAttr["page-break-before"]).lower() == "right":
+                context.addStory(PageBreak())
+                context.addStory(PmlRightPageBreak())
+            if str(context.cssAttr["page-break-before"]).lower() == "left":
+                context.addStory(PageBreak())
+                context.addStory(PmlLeftPageBreak())
+        if "page-break-after" in context.cssAttr:
+            if str(context.cssAttr["page-break-after"]).lower() == "always":
+                state.pageBreakAfter = PAGE_BREAK
+            if str(context.cssAttr["page-break-after"]).lower() == "right":
+                state.pageBreakAfter = PAGE_BREAK_RIGHT
+            if str(context.cssAttr["page-break-after"]).lower() == "left":
+                state.pageBreakAfter = PAGE_BREAK_LEFT
+
+    if display == "none":
+        # print "none!"
+        return None
+
+    # Translate CSS to frags
+
+    # Save previous frag styles
+    context.pushFrag()
+
+    # Map styles to Reportlab fragment properties, the margins of blocks add
+    # up in kw
+    if isBlock and ("margin-left" in context.cssAttr or "margin-right" in context.cssAttr):
+        kw = state.kw = copy.copy(kw)
+    CSS2Frag(context, kw, isBlock)
+
+    # EXTRAS
+    transform_attrs(context.frag,
+                    (
+                        ("keepWithNext", "-pdf-keep-with-next"),
+                        ("outline", "-pdf-outline"),
+                        #("borderLeftColor", "-pdf-outline-open"),
+                    ),
+                    context.cssAttr,
+                    getBool
+                    )
+
+    if "-pdf-outline-level" in context.cssAttr:
+        context.frag.outlineLevel = int(
+            context.cssAttr["-pdf-outline-level"])
+
+    if "-pdf-word-wrap" in context.cssAttr:
+        context.frag.wordWrap = context.cssAttr["-pdf-word-wrap"]
+
+    # handle keep-in-frame
+    if "-pdf-keep-in-frame-mode" in context.cssAttr:
+        value = str(
+            context.cssAttr["-pdf-keep-in-frame-mode"]).strip().lower()
+        if value in ("shrink", "error", "overflow", "truncate"):
+            state.keepInFrameMode = value
+        else:
+            state.keepInFrameMode = "shrink"
+        # Added because we need a default value.
+
+    if "-pdf-keep-in-frame-max-width" in context.cssAttr:
+        state.keepInFrameMaxWidth = getSize(
+            "".join(context.cssAttr["-pdf-keep-in-frame-max-width"]))
+    if "-pdf-keep-in-frame-max-height" in context.cssAttr:
+        state.keepInFrameMaxHeight = getSize(
+            "".join(context.cssAttr["-pdf-keep-in-frame-max-height"]))
+
+    # ignore nested keep-in-frames, tables have their own KIF handling
+    state.keepInFrame = state.keepInFrameMode is not None and context.keepInFrameIndex is None
+    if state.keepInFrame:
+        # keep track of current story index, so we can wrap everythink
+        # added after this point in a KeepInFrame
+        context.keepInFrameIndex = len(context.story)
+
+    # BEGIN tag
+    klass = definition.handler
+
+    # Static block
+    elementId = attr.get("id", None)
+    state.staticFrame = context.frameStatic.get(elementId, None)
+    if state.staticFrame:
+        context.frag.insideStaticFrame += 1
+        state.oldStory = context.swapStory()
+
+    # Tag specific operations
+    if klass is not None:
+        state.obj = klass(node, attr)
+        state.obj.start(context)
+
+    # Visit child nodes
+    context.fragBlock = state.fragBlock = copy.copy(context.frag)
+    context.cssAncestorFilter.push(node)
+    return state
+
+
+def pisaLoopEnd(context, state):
+    """
+    Leave the element pisaLoopStart entered once its child nodes have been
+    visited
+    """
+    context.cssAncestorFilter.pop()
+    context.fragBlock = state.fragBlock
+
+    # END tag
+    if state.obj:
+        state.obj.end(context)
+
+    # Block?
+    if state.isBlock:
+        context.addPara()
+
+        # XXX Buggy!
+
+        # Page break by CSS
+        if state.pageBreakAfter:
+            context.addStory(PageBreak())
+            if state.pageBreakAfter == PAGE_BREAK_RIGHT:
+                context.addStory(PmlRightPageBreak())
+            if state.pageBreakAfter == PAGE_BREAK_LEFT:
+                context.addStory(PmlLeftPageBreak())
+        if state.frameBreakAfter:
+            context.addStory(FrameBreak())
+
+    if state.keepInFrame:
+        # get all content added after start of -pdf-keep-in-frame and wrap
+        # it in a KeepInFrame
+        substory = context.story[context.keepInFrameIndex:]
+        context.story = context.story[:context.keepInFrameIndex]
+        context.story.append(
+            KeepInFrame(
+                content=substory,
+                maxWidth=state.keepInFrameMaxWidth,
+                maxHeight=state.keepInFrameMaxHeight,
+                mode=state.keepInFrameMode))
+        # mode wasn't being used; it is necessary for tables or images at
+        # end of page.
+        context.keepInFrameIndex = None
+
+    # Static block, END
+    if state.staticFrame:
+        context.addPara()
+        for frame in state.staticFrame:
+            frame.pisaStaticStory = context.story
+        context.swapStory(state.oldStory)
+        context.frag.insideStaticFrame -= 1
+
+    # context.debug(1, indent, "</%s>" % (node.tagName))
+
+    # Reset frag style
+    context.pullFrag()
 
 
 def pisaLoop(node, context, path=None, **kw):
-    if path is None:
-        path = []
+    """
+    Visit node and its descendants in document order, calling
+    pisaLoopStart and pisaLoopEnd for the elements and adding the text to
+    the context.  The walk keeps its own stack of child node iterators, so
+    the depth of the document is not limited by the recursion limit.
+    """
 
     # Initialize KW
     if not kw:
@@ -530,244 +853,223 @@ def pisaLoop(node, context, path=None, **kw):
             "margin-left": 0,
             "margin-right": 0,
         }
-    else:
-        kw = copy.copy(kw)
 
-    # indent = len(path) * "  " # only used for debug print statements
+    # Open nodes as (state, child node iterator, path, kw), state is None
+    # for nodes other than elements
+    stack = [(None, iter((node,)), path, kw)]
+    while stack:
+        state, children, path, kw = stack[-1]
+        node = next(children, None)
 
-    # TEXT
-    if node.nodeType == Node.TEXT_NODE:
-        # print indent, "#", repr(node.data) #, context.frag
-        context.addFrag(node.data)
-        # context.text.append(node.value)
+        # END tag
+        if node is None:
+            stack.pop()
+            if state is not None:
+                pisaLoopEnd(context, state)
+
+        # TEXT
+        elif node.nodeType == Node.TEXT_NODE:
+            # print indent, "#", repr(node.data) #, context.frag
+            if node not in context.ignoredText:
+                context.addFrag(node.data)
+            # context.text.append(node.value)
+
+        # ELEMENT
+        elif node.nodeType == Node.ELEMENT_NODE:
+            state = pisaLoopStart(node, context, path, kw)
+            if state is not None:
+                stack.append((state, iter(node.childNodes), state.path, state.kw))
+
+        # Unknown or not handled
+        else:
+            # context.debug(1, indent, "???", node, node.nodeType, repr(node))
+            # Loop over children
+            stack.append((None, iter(node.childNodes), path, kw))
 
-    # ELEMENT
-    elif node.nodeType == Node.ELEMENT_NODE:
 
-        node.tagName = node.tagName.replace(":", "").lower()
+# Whitespace only text directly inside these elements is never rendered: the
+# head has no inline content and the table tags clear the frags added
+# outside of the cells (whatever the white-space property)
+_SPACE_DROPPING_TAGS = frozenset(
+    ("html", "head", "table", "thead", "tbody", "tfoot", "tr", "colgroup"))
 
-        if node.tagName in ("style", "script"):
-            return
 
-        path = copy.copy(path) + [node.tagName]
-
-        # Prepare attributes
-        attr = pisaGetAttributes(context, node.tagName, node.attributes)
-        # log.debug(indent + "<%s %s>" % (node.tagName, attr) +
-        # repr(node.attributes.items())) #, path
-
-        # Calculate styles
-        context.cssAttr = CSSCollect(node, context)
-        context.cssAttr = mapNonStandardAttrs(context.cssAttr, node, attr)
-        context.node = node
-
-        # Block?
-        PAGE_BREAK = 1
-        PAGE_BREAK_RIGHT = 2
-        PAGE_BREAK_LEFT = 3
-
-        pageBreakAfter = False
-        frameBreakAfter = False
-        display = lower(context.cssAttr.get("display", "inline"))
-        # print indent, node.tagName, display,
-        # context.cssAttr.get("background-color", None), attr
-        isBlock = (display == "block")
-
-        if isBlock:
-            context.addPara()
-
-            # Page break by CSS
-            if "-pdf-next-page" in context.cssAttr:
-                context.addStory(
-                    NextPageTemplate(str(context.cssAttr["-pdf-next-page"])))
-            if "-pdf-page-break" in context.cssAttr:
-                if str(context.cssAttr["-pdf-page-break"]).lower() == "before":
-                    context.addStory(PageBreak())
-            if "-pdf-frame-break" in context.cssAttr:
-                if str(context.cssAttr["-pdf-frame-break"]).lower() == "before":
-                    context.addStory(FrameBreak())
-                if str(context.cssAttr["-pdf-frame-break"]).lower() == "after":
-                    frameBreakAfter = True
-            if "page-break-before" in context.cssAttr:
-                if str(context.cssAttr["page-break-before"]).lower() == "always":
-                    context.addStory(PageBreak())
-                if str(context.cssAttr["page-break-before"]).lower() == "right":
-                    context.addStory(PageBreak())
-                    context.addStory(PmlRightPageBreak())
-                if str(context.cssAttr["page-break-before"]).lower() == "left":
-                    context.addStory(PageBreak())
-                    context.addStory(PmlLeftPageBreak())
-            if "page-break-after" in context.cssAttr:
-                if str(context.cssAttr["page-break-after"]).lower() == "always":
-                    pageBreakAfter = PAGE_BREAK
-                if str(context.cssAttr["page-break-after"]).lower() == "right":
-                    pageBreakAfter = PAGE_BREAK_RIGHT
-                if str(context.cssAttr["page-break-after"]).lower() == "left":
-                    pageBreakAfter = PAGE_BREAK_LEFT
-
-        if display == "none":
-            # print "none!"
-            return
+def _isSpace(data):
+    return not data.strip("\t\n\x0c\r ")
 
-        # Translate CSS to frags
 
-        # Save previous frag styles
-        context.pushFrag()
+def pisaNormalizeWhitespace(document, context):
+    """
+    Record the insignificant whitespace only text nodes of document, the
+    indentation between the rows and cells of tables in particular, in
+    context.ignoredText so that pisaLoop does not create frags for them.
+    The document itself is left as is for the messages quoting it.  Returns
+    the number of text nodes recorded.
+    """
+    ignored = context.ignoredText
+    count = len(ignored)
+    stack = [document]
+    while stack:
+        node = stack.pop()
+        if node.nodeType == Node.ELEMENT_NODE and \
+                node.tagName.lower() in _SPACE_DROPPING_TAGS:
+            for child in node.childNodes:
+                if child.nodeType == Node.TEXT_NODE:
+                    if _isSpace(child.data):
+                        ignored.add(child)
+                else:
+                    stack.append(child)
+        else:
+            stack.extend(child for child in node.childNodes
+                         if child.nodeType != Node.TEXT_NODE)
+    return len(ignored) - count
 
-        # Map styles to Reportlab fragment properties
-        CSS2Frag(context, kw, isBlock)
 
-        # EXTRAS
-        transform_attrs(context.frag,
-                        (
-                            ("keepWithNext", "-pdf-keep-with-next"),
-                            ("outline", "-pdf-outline"),
-                            #("borderLeftColor", "-pdf-outline-open"),
-                        ),
-                        context.cssAttr,
-                        getBool
-                        )
+def pisaUnlinkDocument(document):
+    """
+    Break the references between the nodes of document and from the nodes
+    to their CSS interfaces, so that the nodes are freed as soon as they
+    are not referenced anymore instead of by the next full run of the
+    garbage collector.  Unlike Node.unlink the walk keeps its own stack.
+    """
+    stack = [document]
+    while stack:
+        node = stack.pop()
+        children = node.childNodes
+        if children:
+            stack.extend(children)
+            del children[:]
+        if node.nodeType == Node.ELEMENT_NODE:
+            node.cssElement = None
+        node.unlink()
+
+
+def pisaCollectCSS(document, context):
+    """
+    Collect the CSS of the style and link elements the parser backend
+    recorded in document order in document.cssStyleElements, or of the
+    whole document if it did not record them
+    """
+    elements = getattr(document, "cssStyleElements", None)
+    if elements is None:
+        pisaPreLoop(document, context)
+    else:
+        for node in elements:
+            pisaPreLoop(node, context)
 
-        if "-pdf-outline-level" in context.cssAttr:
-            context.frag.outlineLevel = int(
-                context.cssAttr["-pdf-outline-level"])
-
-        if "-pdf-word-wrap" in context.cssAttr:
-            context.frag.wordWrap = context.cssAttr["-pdf-word-wrap"]
-
-        # handle keep-in-frame
-        keepInFrameMode = None
-        keepInFrameMaxWidth = 0
-        keepInFrameMaxHeight = 0
-        if "-pdf-keep-in-frame-mode" in context.cssAttr:
-            value = str(
-                context.cssAttr["-pdf-keep-in-frame-mode"]).strip().lower()
-            if value in ("shrink", "error", "overflow", "truncate"):
-                keepInFrameMode = value
-            else:
-                keepInFrameMode = "shrink"
-            # Added because we need a default value.
-
-        if "-pdf-keep-in-frame-max-width" in context.cssAttr:
-            keepInFrameMaxWidth = getSize(
-                "".join(context.cssAttr["-pdf-keep-in-frame-max-width"]))
-        if "-pdf-keep-in-frame-max-height" in context.cssAttr:
-            keepInFrameMaxHeight = getSize(
-                "".join(context.cssAttr["-pdf-keep-in-frame-max-height"]))
-
-        # ignore nested keep-in-frames, tables have their own KIF handling
-        keepInFrame = keepInFrameMode is not None and context.keepInFrameIndex is None
-        if keepInFrame:
-            # keep track of current story index, so we can wrap everythink
-            # added after this point in a KeepInFrame
-            context.keepInFrameIndex = len(context.story)
-
-        # BEGIN tag
-        klass = globals().get("pisaTag%s" %
-                              node.tagName.replace(":", "").upper(), None)
-        obj = None
-
-        # Static block
-        elementId = attr.get("id", None)
-        staticFrame = context.frameStatic.get(elementId, None)
-        if staticFrame:
-            context.frag.insideStaticFrame += 1
-            oldStory = context.swapStory()
-
-        # Tag specific operations
-        if klass is not None:
-            obj = klass(node, attr)
-            obj.start(context)
-
-        # Visit child nodes
-        context.fragBlock = fragBlock = copy.copy(context.frag)
-        for nnode in node.childNodes:
-            pisaLoop(nnode, context, path, **kw)
-        context.fragBlock = fragBlock
 
-        # END tag
-        if obj:
-            obj.end(context)
+_DOMTreeBuilder = treebuilders.getTreeBuilder("dom", dom)
 
-        # Block?
-        if isBlock:
-            context.addPara()
 
-            # XXX Buggy!
+class pisaTreeBuilder(_DOMTreeBuilder):
+    """
+    html5lib tree builder for xhtml2pdf.dom recording the style and link
+    elements in document.cssStyleElements while building the tree.  Given
+    the html5lib parser using it (htmlParser), it sets the sourceLine of
+    the elements to the line the tokenizer is in.
+    """
 
-            # Page break by CSS
-            if pageBreakAfter:
-                context.addStory(PageBreak())
-                if pageBreakAfter == PAGE_BREAK_RIGHT:
-                    context.addStory(PmlRightPageBreak())
-                if pageBreakAfter == PAGE_BREAK_LEFT:
-                    context.addStory(PmlLeftPageBreak())
-            if frameBreakAfter:
-                context.addStory(FrameBreak())
+    htmlParser = None
+
+    def reset(self):
+        _DOMTreeBuilder.reset(self)
+        self.cssStyleElements = []
+        # The newlines of the current chunk of the input stream before
+        # lineOffset are counted in line
+        self.lineChunk = None
+        self.lineOffset = 0
+        self.line = 0
+
+    def getSourceLine(self):
+        """
+        Line of the position of the tokenizer, the newlines are counted from
+        the last position on instead of from the start of the chunk
+        """
+        tokenizer = getattr(self.htmlParser, "tokenizer", None)
+        if tokenizer is None:
+            return 0
+        stream = tokenizer.stream
+        chunk, offset = stream.chunk, stream.chunkOffset
+        if chunk is not self.lineChunk or offset < self.lineOffset:
+            self.lineChunk, self.lineOffset = chunk, 0
+            self.line = stream.prevNumLines + 1
+        self.line += chunk.count("\n", self.lineOffset, offset)
+        self.lineOffset = offset
+        return self.line
+
+    def elementClass(self, name, namespace=None):
+        element = _DOMTreeBuilder.elementClass(self, name, namespace)
+        element.element.sourceLine = self.getSourceLine()
+        if name in ("style", "link"):
+            self.cssStyleElements.append(element.element)
+        return element
 
-        if keepInFrame:
-            # get all content added after start of -pdf-keep-in-frame and wrap
-            # it in a KeepInFrame
-            substory = context.story[context.keepInFrameIndex:]
-            context.story = context.story[:context.keepInFrameIndex]
-            context.story.append(
-                KeepInFrame(
-                    content=substory,
-                    maxWidth=keepInFrameMaxWidth,
-                    maxHeight=keepInFrameMaxHeight,
-                    mode=keepInFrameMode))
-            # mode wasn't being used; it is necessary for tables or images at
-            # end of page.
-            context.keepInFrameIndex = None
-
-        # Static block, END
-        if staticFrame:
-            context.addPara()
-            for frame in staticFrame:
-                frame.pisaStaticStory = context.story
-            context.swapStory(oldStory)
-            context.frag.insideStaticFrame -= 1
-
-        # context.debug(1, indent, "</%s>" % (node.tagName))
-
-        # Reset frag style
-        context.pullFrag()
-
-    # Unknown or not handled
-    else:
-        # context.debug(1, indent, "???", node, node.nodeType, repr(node))
-        # Loop over children
-        for node in node.childNodes:
-            pisaLoop(node, context, path, **kw)
+    def getDocument(self):
+        document = _DOMTreeBuilder.getDocument(self)
+        document.cssStyleElements = self.cssStyleElements
+        return document
 
 
-def pisaParser(src, context, default_css="", xhtml=False, encoding="utf8", xml_output=None):
+class _BufferFile(io.RawIOBase):
     """
-    - Parse HTML and get miniDOM
-    - Extract CSS informations, add default CSS, parse CSS
-    - Handle the document DOM itself and build reportlab story
-    - Return Context object
+    Binary file reading an object which supports the buffer protocol, like
+    bytearray or memoryview, without copying it as a whole
     """
 
-    global CSSAttrCache
-    CSSAttrCache = {}
+    def __init__(self, buffer):
+        self.view = memoryview(buffer).cast("B")
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        data = self.view[self.position:self.position + len(b)]
+        b[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += len(self.view)
+        self.position = max(offset, 0)
+        return self.position
+
+    def tell(self):
+        return self.position
 
+
+def pisaParseHTML5Lib(src, encoding="utf8", xhtml=False, capacity=-1):
+    """
+    Parse src with html5lib (pure Python) into an xhtml2pdf.dom document.  Bytes,
+    binary file like objects (an mmap too) and other buffers like memoryview
+    are read in place, text is encoded first.
+    """
     if xhtml:
         log.warning("xhtml parameter will be removed on next release 0.2.8")
         # TODO: XHTMLParser doesn't seem to exist...
-        parser = html5lib.XHTMLParser(tree=treebuilders.getTreeBuilder("dom"))
+        parser = html5lib.XHTMLParser(tree=pisaTreeBuilder)
     else:
-        parser = html5lib.HTMLParser(tree=treebuilders.getTreeBuilder("dom"))
+        parser = html5lib.HTMLParser(tree=pisaTreeBuilder)
+    # Like html5lib, without a reference cycle
+    parser.tree.htmlParser = weakref.proxy(parser)
     parser_kwargs = {}
     if isinstance(src, str):
         # If an encoding was provided, do not change it.
         if not encoding:
             encoding = "utf-8"
         src = src.encode(encoding)
-        src = pisaTempFile(src, capacity=context.capacity)
         # To pass the encoding used to convert the text_type src to binary_type
         # on to html5lib's parser to ensure proper decoding
         parser_kwargs['transport_encoding'] = encoding
+    elif not isinstance(src, bytes) and not hasattr(src, "read"):
+        # html5lib would copy other buffers into a BytesIO
+        src = _BufferFile(src)
 
     # # Test for the restrictions of html5lib
     # if encoding:
@@ -780,18 +1082,531 @@ def pisaParser(src, context, default_css="", xhtml=False, encoding="utf8", xml_o
     #     else:
     #         if inputstream.codecName(encoding) is None:
     #             log.error("%r is not a valid encoding", encoding)
-    document = parser.parse(
+    return parser.parse(
         src, **parser_kwargs
     )  # encoding=encoding)
 
-    if xml_output:
-        xml_output.write(document.toprettyxml(encoding=encoding))
+
+def pisaParseLXML(src, encoding=None, xhtml=False, capacity=-1):
+    """
+    Parse src with the libxml2 HTML parser of lxml and convert the result
+    into an xhtml2pdf.dom document like the one built by html5lib, see
+    _lxmlToDOM and _html5libFixups.  Where libxml2 keeps no trace of the
+    source the trees still differ:
+
+    - a stray </p> is dropped, html5lib inserts an empty <p> for it
+    - boolean attributes like <select multiple> get their name as value,
+      html5lib gives them an empty value
+    - an empty <pdf:...></pdf:...> element gets the rest of its parent as
+      content like <pdf:... />
+    """
+    if lxml_etree is None:
+        raise ImportError(
+            "The 'lxml' HTML parser requires lxml to be installed. You can "
+            "install it by running \"pip install xhtml2pdf[lxml]\".")
+    if isinstance(src, str):
+        encoding = encoding or "utf-8"
+        src = src.encode(encoding)
+    else:
+        # Like html5lib, the encoding of bytes is detected (BOM, <meta>)
+        encoding = None
+    parser = lxml_etree.HTMLParser(encoding=encoding, remove_pis=True, huge_tree=True)
+    if hasattr(src, "read"):
+        # Read in chunks instead of reading the whole file first
+        root = lxml_etree.parse(src, parser).getroot()
+    else:
+        # Bytes and other buffers like memoryview are parsed in place
+        root = lxml_etree.fromstring(src, parser)
+
+    document = dom.Document()
+    document.cssStyleElements = []
+    if root is not None:
+        _lxmlToDOM(document, document, root)
+        _html5libFixups(document)
+    return document
+
+
+XHTML_NAMESPACE = "http://www.w3.org/1999/xhtml"
+
+
+def _lxmlToDOM(document, parent, element):
+    """
+    Append a copy of the lxml element, its subtree and its tail text to the
+    DOM node parent, recording style and link elements in
+    document.cssStyleElements
+    """
+    stack = [(parent, element)]
+    # The node the following children of a parent are appended to instead
+    nested = {}
+    while stack:
+        parent, element = stack.pop()
+        if parent in nested:
+            target = nested[parent]
+            while target in nested:
+                target = nested[target]
+            nested[parent] = parent = target
+        tag = element.tag
+        if isinstance(tag, str):
+            node = document.createElementNS(XHTML_NAMESPACE, tag.lower())
+            node.sourceLine = element.sourceline or 0
+            if node.tagName in ("style", "link"):
+                document.cssStyleElements.append(node)
+            for name, value in element.items():
+                node.setAttribute(name, value)
+            parent.appendChild(node)
+            if element.text:
+                _appendText(document, node, element.text)
+            elif ":" in node.tagName and not len(element):
+                # html5lib ignores the "/>" of <pdf:nextpage /> and the like,
+                # the rest of the parent becomes their content
+                nested[parent] = node
+            stack.extend((node, child) for child in reversed(element))
+        elif tag is lxml_etree.Comment:
+            parent.appendChild(document.createComment(element.text or ""))
+        if element.tail:
+            _appendText(document, nested.get(parent, parent), element.tail)
+
+
+rxleadingspace = re.compile("^[\t\n\x0c\r ]+")
+
+
+def _splitText(tagName, text):
+    """
+    Split text of an element tagName into the text nodes html5lib builds:
+    like its tokenizer, whitespace directly following a tag becomes a text
+    node of its own outside of raw text elements, the fragments built from
+    text depend on it.
+    """
+    if tagName not in ("style", "script", "textarea", "title"):
+        match = rxleadingspace.match(text)
+        if match and match.end() < len(text):
+            return [match.group(), text[match.end():]]
+    return [text]
+
+
+def _appendText(document, parent, text):
+    """
+    Append text to the DOM node parent, see _splitText
+    """
+    for data in _splitText(parent.tagName, text):
+        parent.appendChild(document.createTextNode(data))
+
+
+# The table section html5lib inserts around rows and columns of a table
+_TABLE_SECTIONS = {"tr": "tbody", "col": "colgroup"}
+
+
+def _html5libFixups(document):
+    """
+    Adapt a DOM built by another parser to the tree construction rules of
+    html5lib the rest of xhtml2pdf relies on
+    """
+    html = document.documentElement
+    if html is None or html.tagName != "html":
+        return
+    children = [child.tagName for child in html.childNodes if child.nodeType == Node.ELEMENT_NODE]
+    if "head" not in children:
+        html.insertBefore(document.createElementNS(XHTML_NAMESPACE, "head"), html.firstChild)
+    if "body" not in children:
+        html.appendChild(document.createElementNS(XHTML_NAMESPACE, "body"))
+
+    # Rows and columns are always inside a table section
+    stack = [html]
+    while stack:
+        node = stack.pop()
+        if node.tagName == "table":
+            section = None
+            for child in list(node.childNodes):
+                if child.nodeType == Node.ELEMENT_NODE and child.tagName in _TABLE_SECTIONS:
+                    name = _TABLE_SECTIONS[child.tagName]
+                    if section is None or section.tagName != name:
+                        section = document.createElementNS(XHTML_NAMESPACE, name)
+                        node.insertBefore(section, child)
+                    section.appendChild(child)
+                elif child.nodeType == Node.ELEMENT_NODE or (
+                        child.nodeType == Node.TEXT_NODE and child.data.strip()):
+                    section = None
+                elif section is not None:
+                    section.appendChild(child)
+        stack.extend(child for child in node.childNodes if child.nodeType == Node.ELEMENT_NODE)
+
+
+HTML_PARSERS = {
+    "html5lib": pisaParseHTML5Lib,
+    "lxml": pisaParseLXML,
+}
+
+DEFAULT_HTML_PARSER = "html5lib"
+
+
+def getHTMLParser(name=None):
+    """
+    Return the parse function of the HTML parser backend name, see
+    HTML_PARSERS.  A callable is returned as is.
+    """
+    if callable(name):
+        return name
+    try:
+        return HTML_PARSERS[name or DEFAULT_HTML_PARSER]
+    except KeyError:
+        raise ValueError("Unknown HTML parser %r, choose one of: %s" % (
+            name, ", ".join(sorted(HTML_PARSERS))))
+
+
+# Streaming
+
+_PENDING = object()
+
+# Elements html5lib moves into the head, they do not start the body
+_HEAD_TAGS = ("head", "base", "link", "meta", "script", "style", "title")
+
+_XHTML_ENTITIES = "".join(
+    '<!ENTITY %s "&#%d;">' % item for item in sorted(name2codepoint.items()))
+
+
+# Pseudo classes which test the next sibling of an element, see pisaStreamLoop
+_NEXT_SIBLING_PSEUDO_CLASSES = frozenset((
+    "last-child", "not-last-child", "middle-child", "not-middle-child"))
+
+
+def _getNextSiblingSelectors(cascade):
+    """
+    The compound selectors of the rulesets of cascade with a pseudo class
+    testing the next sibling, as (element name, ids, classes)
+    """
+    selectors = set()
+    stack = [nodeFilter for ruleset in cascade.iterCSSRulesets() for nodeFilter in ruleset]
+    while stack:
+        selector = stack.pop()
+        qualifiers = selector.qualifiers
+        stack.extend(q.selector for q in qualifiers if q.isCombiner())
+        if any(q.isPseudo() and q.name in _NEXT_SIBLING_PSEUDO_CLASSES for q in qualifiers):
+            selectors.add((selector.name.lower(),
+                           tuple(q.hashId for q in qualifiers if q.isHash()),
+                           tuple(q.classId for q in qualifiers if q.isClass())))
+    return tuple(selectors)
+
+
+class pisaStreamLoop(object):
+    """
+    Drive pisaLoopStart, pisaLoopEnd and context.addFrag from the events of
+    the incremental XML parser expat, in the order a pisaLoop walk of the
+    complete document would call them.
+
+    Only the open elements are kept in the DOM, each with the last of its
+    child elements which ended already, so selectors on previous siblings
+    still match; the child nodes of an element are dropped after its end.
+    The CSS is collected from the elements before the body, style sheets
+    inside the body are ignored.  Elements are started with their first
+    child node or their end, so the tags may check for child nodes.  Like
+    html5lib, rows of a table are wrapped in a tbody.
+
+    Elements a selector with :last-child, :middle-child or their :not-
+    forms may match wait for their next sibling or the end of their
+    parent instead: they are kept in the DOM with their child nodes and
+    the text after them, which are visited then.  A selector like
+    *:last-child makes all the document wait.
+    """
+
+    def __init__(self, context, encoding=None):
+        self.context = context
+        self.document = dom.Document()
+        self.document.cssStyleElements = []
+        # Open elements as [node, state, implicit, waits, waiting], state is
+        # _PENDING before pisaLoopStart and None if the element is not
+        # rendered; waits if it waits for its next sibling, waiting is the
+        # first child node which waits to be visited
+        self.stack = []
+        self.started = 0
+        self.skipDepth = 0
+        self.text = []
+        self.cssReady = False
+        self.nextSiblingSelectors = ()
+
+        self.parser = expat.ParserCreate(encoding)
+        self.parser.buffer_text = True
+        self.parser.StartElementHandler = self.startElement
+        self.parser.EndElementHandler = self.endElement
+        self.parser.CharacterDataHandler = self.characters
+        self.parser.CommentHandler = self.comment
+        # Resolve the named character references of HTML
+        self.parser.UseForeignDTD(True)
+        self.parser.SetParamEntityParsing(expat.XML_PARAM_ENTITY_PARSING_UNLESS_STANDALONE)
+        self.parser.ExternalEntityRefHandler = self.externalEntityRef
+
+    def feed(self, data, isFinal=False):
+        self.parser.Parse(data, isFinal)
+
+    def close(self):
+        self.feed(b"", True)
+        if not self.cssReady:
+            self.parseCSS()
+
+    def externalEntityRef(self, context, base, systemId, publicId):
+        parser = self.parser.ExternalEntityParserCreate(context)
+        parser.Parse(_XHTML_ENTITIES, True)
+        return 1
+
+    def parseCSS(self):
+        pisaCollectCSS(self.document, self.context)
+        self.context.parseCSS()
+        self.nextSiblingSelectors = _getNextSiblingSelectors(self.context.cssCascade)
+        self.cssReady = True
+
+    def waitsForNextSibling(self, node):
+        for name, ids, classes in self.nextSiblingSelectors:
+            if (name in ("*", node.tagName) and all(node.cssId == i for i in ids)
+                    and all(c in node.cssClasses for c in classes)):
+                return True
+        return False
+
+    def isWaiting(self):
+        """
+        Whether the innermost open element is in an element which waits
+        for its next sibling, see catchUp
+        """
+        return self.started < len(self.stack)
+
+    def isSkipping(self):
+        return self.skipDepth or (self.stack and self.stack[-1][1] is None)
+
+    def catchUp(self, node=None):
+        """
+        Start the open elements which are pending and visit their child
+        nodes before node, up to an element which waits for its next
+        sibling.  Returns False if they are not rendered.
+        """
+        stack = self.stack
+        for i in range(self.started, len(stack)):
+            entry = stack[i]
+            element, waits = entry[0], entry[3]
+            if waits:
+                self.started = i
+                return True
+            if i:
+                parent = stack[i - 1][1]
+                path, kw = parent.path, parent.kw
+            else:
+                path, kw = None, {
+                    "margin-top": 0,
+                    "margin-bottom": 0,
+                    "margin-left": 0,
+                    "margin-right": 0,
+                }
+            state = entry[1] = pisaLoopStart(element, self.context, path, kw)
+            if state is None:
+                # The open elements inside are not rendered either
+                self.skipDepth += len(stack) - i - 1
+                del stack[i + 1:]
+                self.started = len(stack)
+                return False
+            stop = stack[i + 1][0] if i + 1 < len(stack) else node
+            for child in element.childNodes:
+                if child is stop:
+                    break
+                pisaLoop(child, self.context, state.path, **state.kw)
+        self.started = len(stack)
+        return True
+
+    def visitWaiting(self, entry, stop=None):
+        """
+        Visit the child nodes of the open element of entry which wait for
+        the next sibling of the first of them, up to stop
+        """
+        child, entry[4] = entry[4], None
+        state = entry[1]
+        while child is not stop:
+            pisaLoop(child, self.context, state.path, **state.kw)
+            if child.nodeType == Node.ELEMENT_NODE:
+                while child.firstChild is not None:
+                    child.removeChild(child.firstChild)
+            child = child.nextSibling
+
+    def appendChild(self, node):
+        """
+        Append node to the innermost open element, visiting it if the
+        element is rendered.  Returns False if node is not rendered.
+        """
+        entry = self.stack[-1]
+        parent = entry[0]
+        parent.appendChild(node)
+        if not self.cssReady:
+            return True
+        if not self.catchUp(node):
+            parent.removeChild(node)
+            return False
+        if self.isWaiting():
+            # Visited with the element which waits
+            return True
+        if entry[4] is not None:
+            if node.nodeType != Node.ELEMENT_NODE:
+                return True
+            self.visitWaiting(entry, node)
+
+        # Only the last element before node is needed for sibling selectors
+        previous = node.previousSibling
+        while previous is not None and previous.nodeType != Node.ELEMENT_NODE:
+            previous = previous.previousSibling
+        while parent.firstChild is not previous and parent.firstChild is not node:
+            parent.removeChild(parent.firstChild)
+
+        if node.nodeType == Node.TEXT_NODE:
+            self.context.addFrag(node.data)
+        return True
+
+    def characters(self, data):
+        # The text of elements which are not rendered is not kept at all
+        if not self.isSkipping():
+            self.text.append(data)
+
+    def flushText(self):
+        if not self.text:
+            return
+        text = "".join(self.text)
+        del self.text[:]
+        if not self.stack or self.isSkipping():
+            return
+        tagName = self.stack[-1][0].tagName
+        if tagName in _SPACE_DROPPING_TAGS and _isSpace(text):
+            # See pisaNormalizeWhitespace
+            return
+        for data in _splitText(tagName, text):
+            if not self.appendChild(self.document.createTextNode(data)):
+                return
+
+    def comment(self, data):
+        self.flushText()
+
+    def startElement(self, name, attrs, implicit=False):
+        self.flushText()
+        if self.isSkipping():
+            self.skipDepth += 1
+            return
+        name = name.lower()
+
+        if self.stack:
+            top = self.stack[-1]
+            if top[2] and name in ("caption", "col", "colgroup", "tbody", "tfoot", "thead"):
+                self.endElement(top[0].tagName)
+            elif name == "tr" and top[0].tagName == "table":
+                self.startElement("tbody", {}, implicit=True)
+                if self.isSkipping():
+                    self.skipDepth += 1
+                    return
+            if not self.cssReady and name not in _HEAD_TAGS and not any(
+                    entry[0].tagName == "head" for entry in self.stack):
+                self.parseCSS()
+            elif self.cssReady and name in ("style", "link"):
+                log.warning("<%s> after the head is ignored in streaming mode", name)
+
+        node = self.document.createElementNS(XHTML_NAMESPACE, name)
+        node.sourceLine = self.parser.CurrentLineNumber
+        for key, value in attrs.items():
+            node.setAttribute(key.lower(), value)
+        if name in ("style", "link") and not self.cssReady:
+            self.document.cssStyleElements.append(node)
+        if not self.stack:
+            self.document.appendChild(node)
+        elif not self.appendChild(node):
+            self.skipDepth += 1
+            return
+        css.prepareCSSNode(node)
+        waits = len(self.stack) > 0 and self.cssReady and self.waitsForNextSibling(node)
+        self.stack.append([node, _PENDING, implicit, waits, None])
+
+    def endElement(self, name):
+        self.flushText()
+        if self.skipDepth:
+            self.skipDepth -= 1
+            return
+        while self.stack[-1][2] and name != "tbody":
+            self.endElement("tbody")
+
+        node = self.stack[-1][0]
+        if not self.cssReady and (node.tagName == "head" or len(self.stack) == 1):
+            self.parseCSS()
+        entry = self.stack[-1]
+        if self.cssReady:
+            self.catchUp()
+            if not self.isWaiting():
+                if entry[4] is not None:
+                    self.visitWaiting(entry)
+                if entry[1] is not None:
+                    pisaLoopEnd(self.context, entry[1])
+                while node.firstChild is not None:
+                    node.removeChild(node.firstChild)
+        self.stack.pop()
+        self.started = min(self.started, len(self.stack))
+        if entry[3] and len(self.stack) <= self.started and self.stack[-1][4] is None:
+            # Visited with its next sibling or the end of the parent
+            self.stack[-1][4] = node
+
+
+def pisaStreamParser(src, context, encoding=None, chunkSize=64 * 1024):
+    """
+    Convert well-formed XHTML without building the document tree, see
+    pisaStreamLoop.  src may be a file-like object, which is read in
+    chunks of chunkSize, or text, bytes or another buffer, which is fed
+    in slices of chunkSize.  encoding overrides the encoding of the XML
+    declaration of bytes, which expat detects without it.
+    """
+    if hasattr(src, "read"):
+        chunks = iter(lambda: src.read(chunkSize), src.read(0))
+    else:
+        if not isinstance(src, str):
+            # Slices of a memoryview are not copied
+            src = memoryview(src).cast("B")
+        chunks = (src[i:i + chunkSize] for i in range(0, len(src), chunkSize))
+    loop = None
+    try:
+        for data in chunks:
+            if loop is None:
+                if isinstance(data, str):
+                    # expat gets text as UTF-8
+                    encoding = "utf-8"
+                loop = pisaStreamLoop(context, encoding or None)
+            if isinstance(data, str):
+                data = data.encode("utf-8")
+            loop.feed(data)
+        if loop is None:
+            loop = pisaStreamLoop(context)
+        loop.close()
+    except expat.ExpatError as e:
+        context.error("XHTML parse error in streaming mode: %s", e)
+    return context
+
+
+def pisaParser(src, context, default_css="", xhtml=False, encoding="utf8", xml_output=None,
+               html_parser=None, streaming=False):
+    """
+    - Parse HTML and get the DOM, see xhtml2pdf.dom
+    - Extract CSS informations, add default CSS, parse CSS
+    - Handle the document DOM itself and build reportlab story
+    - Return Context object
+
+    html_parser selects the parser backend, see getHTMLParser.  With
+    streaming, src must be well-formed XHTML which is converted while it
+    is parsed, see pisaStreamParser.
+    """
 
     if default_css:
         context.addDefaultCSS(default_css)
 
-    pisaPreLoop(document, context)
+    if streaming:
+        if xml_output:
+            log.warning("xml_output is not available in streaming mode")
+        # Like html5lib, expat detects the encoding of bytes itself
+        return pisaStreamParser(src, context)
+
+    document = getHTMLParser(html_parser)(
+        src, encoding=encoding, xhtml=xhtml, capacity=context.capacity)
+
+    if xml_output:
+        xml_output.write(document.toprettyxml(encoding=encoding))
+
+    pisaCollectCSS(document, context)
     context.parseCSS()
+    pisaNormalizeWhitespace(document, context)
     pisaLoop(document, context)
     return context
 
@@ -807,3 +1622,15 @@ def XHTML2PDF(*a, **kw):
 
 
 XML2PDF = XHTML2PDF
+
+
+def _registerTags():
+    for name, (block, attributes) in TAGS.items():
+        registerTag(name, attributes=attributes)
+    for name, value in list(globals().items()):
+        if name.startswith("pisaTag") and value is not pisaTag and \
+                isinstance(value, type) and issubclass(value, pisaTag):
+            registerTag(name[7:].lower(), handler=value)
+
+
+_registerTags()
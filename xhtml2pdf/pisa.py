@@ -79,6 +79,12 @@ DEST
     (automatically used if file ends with ".xml")
   --html:
     Force parsing in HTML Mode (default)
+  --parser:
+    HTML parser to use, "html5lib" (default) or "lxml"
+    (faster, requires lxml)
+  --stream:
+    Convert well-formed XHTML while reading it, without keeping
+    the whole document in memory (for very large files)
     
 [HTTP Connection options]
 
@@ -180,6 +186,8 @@ def execute():
             "xhtml",
             "xml",
             "html",
+            "parser=",
+            "stream",
             "encoding=",
             "system",
             "profile",
@@ -204,6 +212,8 @@ def execute():
     encoding = None
     xml_output = None
     base_dir = None
+    html_parser = None
+    streaming = False
 
     log_level = logging.ERROR
     log_format = LOG_FORMAT
@@ -285,6 +295,12 @@ def execute():
         elif o in ("--html",):
             xhtml = False
 
+        elif o in ("--parser",):
+            html_parser = a
+
+        elif o in ("--stream",):
+            streaming = True
+
         elif httpConfig.is_http_config(o, a):
             continue
 
@@ -317,6 +333,7 @@ def execute():
             xhtml = src.lower().endswith(".xml")
 
         lc = None
+        fsrcclose = 0
 
         if src == "-" or base_dir is not None:
             # Output to console
@@ -331,8 +348,7 @@ def execute():
                 src = "".join(urlparse.urlsplit(src)[1:3]).replace("/", "-")
             else:
                 fsrc = wpath = os.path.abspath(src)
-                with open(fsrc, "rb") as file_handler:
-                    fsrc = file_handler.read()
+                fsrcclose = 1
 
         if a_dest is None:
             dest_part = src
@@ -371,27 +387,36 @@ def execute():
         if not quiet:
             print ("Converting {} to {}...".format(src, dest))
 
-        pisaDocument(
-            fsrc,
-            fdest,
-            debug=debug,
-            path=wpath,
-            errout=sys.stdout,
-            tempdir=tempdir,
-            format=file_format,
-            link_callback=lc,
-            default_css=css,
-            xhtml=xhtml,
-            encoding=encoding,
-            xml_output=xml_output
-        )
+        if fsrcclose:
+            # The parser reads the file itself
+            fsrc = open(fsrc, "rb")
+
+        try:
+            pisaDocument(
+                fsrc,
+                fdest,
+                debug=debug,
+                path=wpath,
+                errout=sys.stdout,
+                tempdir=tempdir,
+                format=file_format,
+                link_callback=lc,
+                default_css=css,
+                xhtml=xhtml,
+                encoding=encoding,
+                xml_output=xml_output,
+                html_parser=html_parser,
+                streaming=streaming
+            )
+        finally:
+            if fsrcclose:
+                fsrc.close()
+            if fdestclose:
+                fdest.close()
 
         if xml_output:
             xml_output.getvalue()
 
-        if fdestclose:
-            fdest.close()
-
         if (not errors) and startviewer:
             if not quiet:
                 print ("Open viewer for file %s" % dest)
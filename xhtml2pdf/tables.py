@@ -182,7 +182,7 @@ class pisaTagTABLE(pisaTag):
         for i, row in enumerate(data):
             data[i] += [''] * (maxcols - len(row))
 
-        log.debug("Col widths: {}".format(list(tdata.colw)))
+        log.debug("Col widths: %s", list(tdata.colw))
         if tdata.data:
             # log.debug("Table styles %r", tdata.styles)
             t = PmlTable(
@@ -286,7 +286,7 @@ class pisaTagTD(pisaTag):
             # If is value, the set it in the right place in the arry
             if width is not None:
                 tdata.colw[col] = _width(width)
-                log.debug("Col {} has width {}".format(col, width))
+                log.debug("Col %s has width %s", col, width)
             else:
                 # If there are no child nodes, nothing within the column can change the
                 # width.  Set the column width to the sum of the right and left padding
@@ -294,7 +294,7 @@ class pisaTagTD(pisaTag):
                 log.debug(width)
                 if len(self.node.childNodes) == 0:
                     width = c.frag.paddingLeft + c.frag.paddingRight
-                    log.debug("Col {} has width {}".format(col, width))
+                    log.debug("Col %s has width %s", col, width)
                     if width:
                         tdata.colw[col] = _width(width)
                 else:
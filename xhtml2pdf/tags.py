@@ -335,8 +335,8 @@ class pisaTagBR(pisaTag):
 class pisaTagIMG(pisaTag):
     def start(self, c):
         attr = self.attr
-        log.debug("Parsing img tag, src: {}".format(attr.src))
-        log.debug("Attrs: {}".format(attr))
+        log.debug("Parsing img tag, src: %s", attr.src)
+        log.debug("Attrs: %s", attr)
 
         if attr.src:
             filedata = attr.src.getData()
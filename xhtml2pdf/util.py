@@ -615,11 +615,16 @@ def get_default_asian_font():
     return default_asian_font
 
 
+# CID fonts set_asian_fonts has registered, once for the process
+registered_asian_fonts = set()
+
+
 def set_asian_fonts(fontname):
-    font_dict = copy(reportlab.pdfbase._cidfontdata.defaultUnicodeEncodings)
-    fonts = font_dict.keys()
-    if fontname in fonts:
+    if fontname in registered_asian_fonts:
+        return
+    if fontname in reportlab.pdfbase._cidfontdata.defaultUnicodeEncodings:
         pdfmetrics.registerFont(UnicodeCIDFont(fontname))
+        registered_asian_fonts.add(fontname)
 
 
 def detect_language(name):
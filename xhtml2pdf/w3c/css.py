@@ -32,7 +32,11 @@ Dependencies:
 """
 
 import copy
+import hashlib
 import os
+import threading
+from collections import OrderedDict
+from operator import itemgetter
 
 from . import cssParser
 from . import cssSpecial
@@ -58,6 +62,10 @@ CSSParseError = cssParser.CSSParseError
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
 class CSSElementInterfaceAbstract(object):
+    # Bits of the CSSAncestorFilter for the ancestors of the element, None if
+    # unknown
+    ancestorBits = None
+
     def getAttr(self, name, default=NotImplemented):
         raise NotImplementedError('Subclass responsibility')
 
@@ -67,6 +75,9 @@ class CSSElementInterfaceAbstract(object):
     def getClassAttr(self):
         return self.getAttr('class', '')
 
+    def getClassSet(self):
+        return frozenset(self.getClassAttr().split())
+
     def getInlineStyle(self):
         raise NotImplementedError('Subclass responsibility')
 
@@ -192,10 +203,40 @@ class CSSCascadeStrategy(object):
             for attrName, attrRules in rules.items():
                 attrRules += ruleset.findCSSRuleFor(element, attrName)
 
-        for attrRules in rules.items():
+        for attrRules in rules.values():
             attrRules.sort()
         return rules
 
+    def findCSSRulesForElement(self, element):
+        """Returns all rules matching element, in ascending order of precedence.
+
+        Every selector is matched once, whatever the number of properties
+        looked up afterwards.  Rules of equal specificity keep the order of
+        iterCSSRulesets, so later rulesets win just like in findCSSRulesFor.
+        """
+        rules = []
+        for ruleset in self.iterCSSRulesets(element.getInlineStyle()):
+            rules += ruleset.findCSSRulesForElement(element)
+        try:
+            rules.sort(key=itemgetter(0))
+        except (TypeError, AttributeError):
+            # Some qualifiers can't be ordered against each other, fall
+            # back to specificity and source order
+            rules.sort(key=lambda rule: rule[0].specificity())
+        return rules
+
+    def findStylesFor(self, element):
+        """Returns a dict with the winning value of every property declared
+        for element.
+
+        As with findStyleFor, values like "inherit" are left to the client
+        to resolve.
+        """
+        style = {}
+        for nodeFilter, declarations in self.findCSSRulesForElement(element):
+            style.update(declarations)
+        return style
+
     # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
     def _extractStyleForRule(self, rule, attrName, default=NotImplemented):
@@ -217,6 +258,8 @@ class CSSSelectorBase(object):
     inline = False
     _hash = None
     _specificity = None
+    _matcher = None
+    _ancestorBits = None
 
     def __init__(self, completeName='*'):
         if not isinstance(completeName, tuple):
@@ -295,21 +338,117 @@ class CSSSelectorBase(object):
                 elementCount += e
         return self.inline, hashCount, qualifierCount, elementCount
 
+    def getIndexKey(self):
+        """Bucket key of the rightmost compound selector, see CSSRuleset.
+
+        Ids are preferred over classes and classes over the element name,
+        as they narrow down the candidate elements the most.
+        """
+        className = None
+        for q in self.qualifiers:
+            if q.isHash():
+                return '#' + q.hashId
+            elif className is None and q.isClass():
+                className = q.classId
+        if className is not None:
+            return '.' + className
+        return self.name
+
+    def iterQualifiers(self):
+        """Yields the qualifiers of this and all combined selectors"""
+        for q in self.qualifiers:
+            yield q
+            if q.isCombiner():
+                yield from q.selector.iterQualifiers()
+
+    def getCompoundKeys(self):
+        """Keys of the CSSAncestorFilter an element matching the rightmost
+        compound selector has"""
+        keys = []
+        if self.name != '*':
+            keys.append(self.name)
+        for q in self.qualifiers:
+            if q.isHash():
+                keys.append('#' + q.hashId)
+            elif q.isClass():
+                keys.append('.' + q.classId)
+        return keys
+
+    def getAncestorKeys(self):
+        """Keys of the CSSAncestorFilter the ancestors of a matching element
+        must have"""
+        keys = []
+        for q in self.qualifiers:
+            if q.isCombiner():
+                if q.op in (' ', '>'):
+                    keys.extend(q.selector.getCompoundKeys())
+                # siblings share their ancestors
+                keys.extend(q.selector.getAncestorKeys())
+        return keys
+
+    def getAncestorBits(self):
+        if self._ancestorBits is None:
+            return CSSAncestorFilter.getKeysBits(self.getAncestorKeys())
+        return self._ancestorBits
+
     def matches(self, element=None):
         if element is None:
             return False
+        return self.getMatcher()(element.domElement, element.__class__)
 
-        # with  CSSDOMElementInterface.matchesNode(self, (namespace, tagName)) replacement:
-        if self.fullName[1] not in ('*', element.domElement.tagName):
-            return False
-        if self.fullName[0] not in (None, '', '*') and self.fullName[0] != element.domElement.namespaceURI:
-            return False
+    def getMatcher(self):
+        if self._matcher is None:
+            return self.compileMatcher()
+        return self._matcher
 
-        for qualifier in self.qualifiers:
-            if not qualifier.matches(element):
-                return False
+    def compileMatcher(self):
+        """Returns a function matching this selector against a DOM node.
+
+        The function is called as matcher(node, elementFactory) and works on
+        the raw DOM nodes, elementFactory is only used to wrap nodes for the
+        pseudo class qualifiers, see CSSElementInterfaceAbstract.inPseudoState.
+        Qualifiers are tested in order of their cost, combinators last.
+        """
+        namespace, name = self.fullName
+        tests = [q.compileMatcher() for q in self.qualifiers if not q.isCombiner()]
+        tests.extend(q.compileMatcher() for q in self.qualifiers if q.isCombiner())
+        if namespace in (None, '', '*'):
+            namespace = None
+        if name == '*':
+            name = None
+
+        if not tests:
+            if namespace is None:
+                if name is None:
+                    return lambda node, elementFactory: True
+                return lambda node, elementFactory: node.tagName == name
+
+            def matcher(node, elementFactory):
+                return (name is None or node.tagName == name) and node.namespaceURI == namespace
+            return matcher
+
+        if len(tests) == 1:
+            test = tests[0]
         else:
-            return True
+            def test(node, elementFactory):
+                for check in tests:
+                    if not check(node, elementFactory):
+                        return False
+                return True
+
+        if namespace is None:
+            if name is None:
+                return test
+
+            def matcher(node, elementFactory):
+                return node.tagName == name and test(node, elementFactory)
+            return matcher
+
+        def matcher(node, elementFactory):
+            if name is not None and node.tagName != name:
+                return False
+            return node.namespaceURI == namespace and test(node, elementFactory)
+        return matcher
 
     def asString(self):
         result = []
@@ -384,6 +523,8 @@ class CSSImmutableSelector(CSSSelectorBase):
         self.qualifiers = tuple(qualifiers)
         CSSSelectorBase.__init__(self, completeName)
         self._updateHash()
+        self._matcher = self.compileMatcher()
+        self._ancestorBits = self.getAncestorBits()
 
     def fromSelector(klass, selector):
         return klass(selector.completeName, selector.qualifiers)
@@ -436,6 +577,16 @@ class CSSSelectorHashQualifier(CSSSelectorQualifierBase):
     def matches(self, element):
         return element.getIdAttr() == self.hashId
 
+    def compileMatcher(self):
+        hashId = self.hashId
+
+        def matcher(node, elementFactory):
+            try:
+                return node.cssId == hashId
+            except AttributeError:
+                return prepareCSSNode(node).cssId == hashId
+        return matcher
+
     def __eq__(self, other):
         """Python 3"""
         return self.hashId == other.hashId
@@ -459,11 +610,17 @@ class CSSSelectorClassQualifier(CSSSelectorQualifierBase):
         return '.' + self.classId
 
     def matches(self, element):
-        # return self.classId in element.getClassAttr().split()
-        attrValue = element.domElement.attributes.get('class')
-        if attrValue is not None:
-            return self.classId in attrValue.value.split()
-        return False
+        return self.classId in element.getClassSet()
+
+    def compileMatcher(self):
+        classId = self.classId
+
+        def matcher(node, elementFactory):
+            try:
+                return classId in node.cssClasses
+            except AttributeError:
+                return classId in prepareCSSNode(node).cssClasses
+        return matcher
 
     def __eq__(self, other):
         """Python 3"""
@@ -514,6 +671,27 @@ class CSSSelectorAttributeQualifier(CSSSelectorQualifierBase):
             return False
         raise RuntimeError("Unknown operator %r for %r" % (self.op, self))
 
+    def compileMatcher(self):
+        name, op, value = self.name, self.op, self.value
+        if op is None:
+            return lambda node, elementFactory: node.getAttributeNode(name) is not None
+        elif op == '=':
+            def matcher(node, elementFactory):
+                attrValue = node.getAttributeNode(name)
+                return attrValue is not None and attrValue.value == value
+        elif op == '~=':
+            def matcher(node, elementFactory):
+                attrValue = node.getAttributeNode(name)
+                return attrValue is not None and value in attrValue.value.split()
+        elif op == '|=':
+            def matcher(node, elementFactory):
+                attrValue = node.getAttributeNode(name)
+                return attrValue is not None and value in attrValue.value.split('-')
+        else:
+            def matcher(node, elementFactory):
+                raise RuntimeError("Unknown operator %r for %r" % (op, self))
+        return matcher
+
 
 class CSSSelectorPseudoQualifier(CSSSelectorQualifierBase):
     def __init__(self, attrName, params=()):
@@ -535,6 +713,10 @@ class CSSSelectorPseudoQualifier(CSSSelectorQualifierBase):
     def matches(self, element):
         return element.inPseudoState(self.name, self.params)
 
+    def compileMatcher(self):
+        name, params = self.name, self.params
+        return lambda node, elementFactory: elementFactory(node).inPseudoState(name, params)
+
 
 class CSSSelectorCombinationQualifier(CSSSelectorQualifierBase):
     def __init__(self, op, selector):
@@ -563,7 +745,39 @@ class CSSSelectorCombinationQualifier(CSSSelectorQualifierBase):
                 return False
             return selector.matches(parent)
         elif op == '+':
-            return selector.matches(element.getPreviousSibling())
+            sibling = element.getPreviousSibling()
+            if sibling is None:
+                return False
+            return selector.matches(element.__class__(sibling))
+
+    def compileMatcher(self):
+        op = self.op
+        selector = self.selector.getMatcher()
+        if op == ' ':
+            def matcher(node, elementFactory):
+                parent = node.parentNode
+                while parent is not None and parent.nodeType == parent.ELEMENT_NODE:
+                    if selector(parent, elementFactory):
+                        return True
+                    parent = parent.parentNode
+                return False
+        elif op == '>':
+            def matcher(node, elementFactory):
+                parent = node.parentNode
+                if parent is None or parent.nodeType != parent.ELEMENT_NODE:
+                    return False
+                return selector(parent, elementFactory)
+        elif op == '+':
+            def matcher(node, elementFactory):
+                sibling = node.previousSibling
+                while sibling is not None:
+                    if sibling.nodeType == sibling.ELEMENT_NODE:
+                        return selector(sibling, elementFactory)
+                    sibling = sibling.previousSibling
+                return False
+        else:
+            return lambda node, elementFactory: False
+        return matcher
 
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -604,8 +818,105 @@ class CSSDeclarations(dict):
 
 
 class CSSRuleset(dict):
+    """Maps selectors to declarations.
+
+    Rules are bucketed by the id, class or element name of their rightmost
+    compound selector (see CSSSelectorBase.getIndexKey), so that only rules
+    which can possibly match an element have to be tested against it.  The
+    index is built lazily and dropped whenever the ruleset is modified.
+    """
+    _index = None
+    _sourceOrder = None
+    _selectorFeatures = None
+
+    def __setitem__(self, key, value):
+        self._index = None
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self._index = None
+        dict.__delitem__(self, key)
+
+    def clear(self):
+        self._index = None
+        dict.clear(self)
+
+    def pop(self, *args):
+        self._index = None
+        return dict.pop(self, *args)
+
+    def popitem(self):
+        self._index = None
+        return dict.popitem(self)
+
+    def setdefault(self, key, default=None):
+        self._index = None
+        return dict.setdefault(self, key, default)
+
+    def update(self, *args, **kw):
+        self._index = None
+        dict.update(self, *args, **kw)
+
+    def getIndex(self):
+        index = self._index
+        if index is None:
+            index = {}
+            for nodeFilter, declarations in self.items():
+                index.setdefault(nodeFilter.getIndexKey(), []).append((nodeFilter, declarations))
+            sourceOrder = dict((nodeFilter, i) for i, nodeFilter in enumerate(self))
+            # Rulesets are shared between threads by CSSRulesetCache: the
+            # index is published last, once all that goes with it is set
+            self._sourceOrder = sourceOrder
+            self._selectorFeatures = None
+            self._index = index
+        return index
+
+    def getSelectorFeatures(self):
+        """Returns the names of the attributes tested by attribute qualifiers
+        and whether pseudo classes or adjacent sibling combinators are used,
+        see CSSStyleSharingCache"""
+        self.getIndex()
+        if self._selectorFeatures is None:
+            attrNames = set()
+            usesPseudo = usesAdjacent = False
+            for nodeFilter in self:
+                for q in nodeFilter.iterQualifiers():
+                    if q.isAttr():
+                        attrNames.add(q.name)
+                    elif q.isPseudo():
+                        usesPseudo = True
+                    elif q.isCombiner() and q.op == '+':
+                        usesAdjacent = True
+            self._selectorFeatures = frozenset(attrNames), usesPseudo, usesAdjacent
+        return self._selectorFeatures
+
+    def iterCandidateRules(self, element):
+        """Yields the rules whose rightmost compound selector could match element.
+
+        Rules requiring ancestors the element does not have are skipped if
+        the element knows its ancestorBits, see CSSAncestorFilter.
+        """
+        index = self.getIndex()
+        ancestorBits = element.ancestorBits
+        keys = ['*', element.domElement.tagName]
+        elementId = element.getIdAttr()
+        if elementId:
+            keys.append('#' + elementId)
+        keys.extend('.' + c for c in element.getClassSet())
+        for key in keys:
+            rules = index.get(key)
+            if not rules:
+                continue
+            if ancestorBits is None:
+                yield from rules
+                continue
+            for rule in rules:
+                selectorBits = rule[0].getAncestorBits()
+                if ancestorBits & selectorBits == selectorBits:
+                    yield rule
+
     def findCSSRulesFor(self, element, attrName):
-        ruleResults = [(nodeFilter, declarations) for nodeFilter, declarations in self.items() if
+        ruleResults = [(nodeFilter, declarations) for nodeFilter, declarations in self.iterCandidateRules(element) if
                        (attrName in declarations) and (nodeFilter.matches(element))]
         ruleResults.sort()
         return ruleResults
@@ -615,6 +926,14 @@ class CSSRuleset(dict):
         # whose value evalutates as False"
         return self.findCSSRulesFor(element, attrName)[-1:]
 
+    def findCSSRulesForElement(self, element):
+        """Returns all rules matching element in source order"""
+        ruleResults = [(nodeFilter, declarations) for nodeFilter, declarations in self.iterCandidateRules(element)
+                       if nodeFilter.matches(element)]
+        sourceOrder = self._sourceOrder
+        ruleResults.sort(key=lambda rule: sourceOrder[rule[0]])
+        return ruleResults
+
     def mergeStyles(self, styles):
         " XXX Bugfix for use in PISA "
         for k, v in styles.items():
@@ -636,6 +955,342 @@ class CSSInlineRuleset(CSSRuleset, CSSDeclarations):
         # whose value evalutates as False"
         return self.findCSSRulesFor(*args, **kw)[-1:]
 
+    def findCSSRulesForElement(self, element):
+        if self:
+            return [(CSSInlineSelector(), self)]
+        return []
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# ~ CSS DOM Nodes
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+_noClasses = frozenset()
+
+
+def prepareCSSNode(node):
+    """Stores the values selectors are matched against on a DOM element.
+
+    These are the class tokens (cssClasses), the id (cssId) and the index
+    among the element siblings (cssSiblingIndex).  The document walk
+    prepares every element when it visits it, matching prepares elements
+    on demand.  Prepare the element again after changing its class or id.
+    """
+    classAttr = node.getAttribute('class')
+    node.cssClasses = frozenset(classAttr.split()) if classAttr else _noClasses
+    node.cssId = node.getAttribute('id')
+
+    index = 0
+    sibling = node.previousSibling
+    while sibling is not None:
+        if sibling.nodeType == sibling.ELEMENT_NODE:
+            siblingIndex = getattr(sibling, 'cssSiblingIndex', None)
+            if siblingIndex is not None:
+                index += siblingIndex + 1
+                break
+            index += 1
+        sibling = sibling.previousSibling
+    node.cssSiblingIndex = index
+    return node
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# ~ CSS Ancestor Filter
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class CSSAncestorFilter(object):
+    """Bloom filter of the tag names, ids and classes of the ancestors of the
+    element currently styled.
+
+    The document walk pushes every element before descending into its
+    children and pops it afterwards.  There is one filter per depth, each an
+    integer bit set including the bits of the filter above it, so both are
+    O(1).  Selectors whose ancestor keys (see
+    CSSSelectorBase.getAncestorKeys) are missing from the filter of an
+    element can not match it.
+    """
+    size = 1024
+
+    def __init__(self):
+        self._nodes = []
+        self._bits = [0]
+
+    def getKeyBits(klass, key):
+        h = hash(key)
+        return (1 << (h % klass.size)) | (1 << ((h // klass.size) % klass.size))
+
+    getKeyBits = classmethod(getKeyBits)
+
+    def getKeysBits(klass, keys):
+        bits = 0
+        for key in keys:
+            bits |= klass.getKeyBits(key)
+        return bits
+
+    getKeysBits = classmethod(getKeysBits)
+
+    def getNodeBits(klass, node):
+        try:
+            elementId, classes = node.cssId, node.cssClasses
+        except AttributeError:
+            prepareCSSNode(node)
+            elementId, classes = node.cssId, node.cssClasses
+        keys = [node.tagName]
+        if elementId:
+            keys.append('#' + elementId)
+        keys.extend('.' + c for c in classes)
+        return klass.getKeysBits(keys)
+
+    getNodeBits = classmethod(getNodeBits)
+
+    def push(self, node):
+        self._nodes.append(node)
+        self._bits.append(self._bits[-1] | self.getNodeBits(node))
+
+    def pop(self):
+        self._nodes.pop()
+        self._bits.pop()
+
+    def getAncestorBits(self, node):
+        """Returns the filter of the ancestors of node, None if they are not
+        the elements pushed"""
+        parent = node.parentNode
+        if self._nodes:
+            if self._nodes[-1] is parent:
+                return self._bits[-1]
+        elif parent is None or parent.nodeType != parent.ELEMENT_NODE:
+            return 0
+        return None
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# ~ CSS Style Sharing
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def _freezeStyleValue(value):
+    if isinstance(value, (list, tuple)):
+        return type(value), tuple(_freezeStyleValue(v) for v in value)
+    return value
+
+
+class CSSComputedStyle(dict):
+    """Immutable, hashable computed style of an element.
+
+    Computed styles are interned by CSSStyleSharingCache.intern, equal
+    styles of a document are the same object.
+    """
+    _key = None
+
+    def __init__(self, styles=(), key=None):
+        dict.__init__(self, styles)
+        if key is None:
+            key = self.makeKey(self)
+        self._key = key
+        self._hash = hash(key)
+
+    def makeKey(klass, styles):
+        return tuple(sorted(((name, _freezeStyleValue(value)) for name, value in styles.items()),
+                            key=itemgetter(0)))
+
+    makeKey = classmethod(makeKey)
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def _immutable(self, *args, **kw):
+        raise TypeError("%s is immutable" % self.__class__.__name__)
+
+    __setitem__ = __delitem__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+
+    def __copy__(self):
+        return self
+
+    def __reduce__(self):
+        return self.__class__, (dict(self), self._key)
+
+
+class CSSStyleSharingCache(object):
+    """Shares the computed styles of elements matched by the same rules.
+
+    Every styled element gets a style identity (cssStyleIdentity).  The key
+    of an element (see makeKey) consists of the identity of its parent and
+    everything the selectors of the cascade can test on the element itself:
+    its name, id, classes and inline style, the attributes used by
+    attribute qualifiers, its position among its siblings if pseudo classes
+    are used and the identity of its previous sibling if adjacent sibling
+    combinators are used.  Elements with the same key match the same rules
+    and share identity and styles, which must be treated as read-only.
+
+    The cache belongs to a single document, it is not thread safe.
+    """
+
+    def __init__(self, cascade):
+        attrNames = set()
+        self.usesPseudo = self.usesAdjacent = False
+        for ruleset in cascade.iterCSSRulesets():
+            names, usesPseudo, usesAdjacent = ruleset.getSelectorFeatures()
+            attrNames.update(names)
+            self.usesPseudo = self.usesPseudo or usesPseudo
+            self.usesAdjacent = self.usesAdjacent or usesAdjacent
+        self.attrNames = tuple(sorted(attrNames))
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._styles = {}
+
+    def intern(self, styles):
+        """Returns the CSSComputedStyle equal to the styles dict, creating
+        it on first use"""
+        try:
+            key = CSSComputedStyle.makeKey(styles)
+            return self._styles[key]
+        except KeyError:
+            style = self._styles[key] = CSSComputedStyle(styles, key)
+            return style
+        except TypeError:
+            # unhashable values
+            return styles
+
+    def makeKey(self, node):
+        """Returns the key of a prepared DOM element (see prepareCSSNode),
+        None if it can not share its styles"""
+        parent = node.parentNode
+        if parent is None or parent.nodeType != parent.ELEMENT_NODE:
+            parentIdentity = None
+        else:
+            parentIdentity = getattr(parent, 'cssStyleIdentity', None)
+            if parentIdentity is None:
+                return None
+
+        key = (parentIdentity, node.namespaceURI, node.tagName, node.cssId,
+               node.cssClasses, node.getAttribute('style'))
+        if self.attrNames:
+            attrs = []
+            for name in self.attrNames:
+                attrValue = node.getAttributeNode(name)
+                attrs.append(None if attrValue is None else attrValue.value)
+            key += (tuple(attrs),)
+        if self.usesPseudo or self.usesAdjacent:
+            previous = node.previousSibling
+            while previous is not None and previous.nodeType != previous.ELEMENT_NODE:
+                previous = previous.previousSibling
+            following = node.nextSibling
+            while following is not None and following.nodeType != following.ELEMENT_NODE:
+                following = following.nextSibling
+            if self.usesPseudo:
+                key += (previous is None, following is None)
+            if self.usesAdjacent and previous is not None:
+                previousIdentity = getattr(previous, 'cssStyleIdentity', None)
+                if previousIdentity is None:
+                    return None
+                key += (previousIdentity,)
+        return key
+
+    def get(self, key):
+        """Returns the (identity, styles) stored for key, None on a miss"""
+        entry = None
+        if key is not None:
+            entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def put(self, key, styles):
+        """Stores styles and returns the new style identity for them"""
+        identity = object()
+        if key is not None:
+            self._entries[key] = identity, styles
+        return identity
+
+    def info(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'styles': len(self._styles),
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# ~ CSS Ruleset Cache
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class CSSRulesetCache(object):
+    """Bounded LRU cache of parsed stylesheets.
+
+    Entries are keyed by a hash of the CSS source and the medium set it was
+    parsed for (see makeKey).  Cached results are shared between callers
+    and must be treated as read-only.
+    """
+
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def makeKey(klass, src, mediumSet=()):
+        if isinstance(src, str):
+            src = src.encode('utf-8', 'surrogatepass')
+        digest = hashlib.sha1(src).hexdigest()
+        return digest, tuple(sorted(mediumSet or ()))
+
+    makeKey = classmethod(makeKey)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def info(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+        }
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # ~ CSS Builder
@@ -26,9 +26,9 @@ class CSSDOMElementInterface(css.CSSElementInterfaceAbstract):
 
     _pseudoStateHandlerLookup = {
         'first-child':
-            lambda self: not bool(self.getPreviousSibling()),
+            lambda self: self.getSiblingIndex() == 0,
         'not-first-child':
-            lambda self: bool(self.getPreviousSibling()),
+            lambda self: self.getSiblingIndex() != 0,
 
         'last-child':
             lambda self: not bool(self.getNextSibling()),
@@ -84,13 +84,30 @@ class CSSDOMElementInterface(css.CSSElementInterfaceAbstract):
 
 
     def getIdAttr(self):
-        return self.getAttr('id', '')
+        try:
+            return self.domElement.cssId
+        except AttributeError:
+            return css.prepareCSSNode(self.domElement).cssId
 
 
     def getClassAttr(self):
         return self.getAttr('class', '')
 
 
+    def getClassSet(self):
+        try:
+            return self.domElement.cssClasses
+        except AttributeError:
+            return css.prepareCSSNode(self.domElement).cssClasses
+
+
+    def getSiblingIndex(self):
+        try:
+            return self.domElement.cssSiblingIndex
+        except AttributeError:
+            return css.prepareCSSNode(self.domElement).cssSiblingIndex
+
+
     def getStyleAttr(self):
         return self.getAttr('style', None)
 
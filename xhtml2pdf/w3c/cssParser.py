@@ -45,12 +45,19 @@ from . import cssSpecial
 #~ Definitions
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-def isAtRuleIdent(src, ident):
-    return re.match(r'^@' + ident + r'\s*', src)
+_reAtRuleIdent = re.compile(r'@[a-z\-]+\s*')
 
 
-def stripAtRuleIdent(src):
-    return re.sub(r'^@[a-z\-]+\s*', '', src)
+def isAtRuleIdent(src, ident, pos=0):
+    return src.startswith('@' + ident, pos)
+
+
+def skipAtRuleIdent(src, pos=0):
+    """Returns the position following the at-rule keyword at pos"""
+    match = _reAtRuleIdent.match(src, pos)
+    if match:
+        return match.end()
+    return pos
 
 
 class CSSSelectorAbstract(object):
@@ -392,6 +399,10 @@ class CSSParser(object):
         re_comment = re.compile(i_comment, _reflags)
         i_important = r'!\s*(important)'
         re_important = re.compile(i_important, _reflags)
+        re_whitespace = re.compile(r'\s*', _reflags)
+        re_nmchars = re.compile('(?:%s)*' % i_nmchar, _reflags)
+        re_media_query = re.compile('.*({.*)')
+        re_declaration_end = re.compile('[;}]')
         del _orRule
 
     # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -439,8 +450,14 @@ class CSSParser(object):
             # XXX Some simple preprocessing
             src = cssSpecial.cleanupCSS(src)
 
+            # FIXME: BYTES to STR
+            if type(src) == bytes:
+                src = src.decode()
+            # Get rid of the comments
+            src = self.re_comment.sub('', src)
+
             try:
-                src, stylesheet = self._parseStylesheet(src)
+                pos, stylesheet = self._parseStylesheet(src, 0)
             except self.ParseError as err:
                 err.setFullCSSSource(src)
                 raise
@@ -456,7 +473,7 @@ class CSSParser(object):
         self.cssBuilder.beginInline()
         try:
             try:
-                src, properties = self._parseDeclarationGroup(src.strip(), braces=False)
+                pos, properties = self._parseDeclarationGroup(src.strip(), 0, braces=False)
             except self.ParseError as err:
                 err.setFullCSSSource(src, inline=True)
                 raise
@@ -481,7 +498,7 @@ class CSSParser(object):
             properties = []
             try:
                 for propertyName, src in kwAttributes.items():
-                    src, single_property = self._parseDeclarationProperty(src.strip(), propertyName)
+                    pos, single_property = self._parseDeclarationProperty(src.strip(), 0, propertyName)
                     properties.append(single_property)
 
             except self.ParseError as err:
@@ -510,100 +527,101 @@ class CSSParser(object):
 
     # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
     # ~ Internal _parse methods
+    #
+    # All of them work on the complete source string and a position in it,
+    # and return the position following the parsed construct together with
+    # the result.  The source itself is never sliced while parsing, which
+    # kept large stylesheets quadratic.
     # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-    def _parseStylesheet(self, src):
+    def _parseStylesheet(self, src, pos):
         """stylesheet
         : [ CHARSET_SYM S* STRING S* ';' ]?
             [S|CDO|CDC]* [ import [S|CDO|CDC]* ]*
             [ [ ruleset | media | page | font_face ] [S|CDO|CDC]* ]*
         ;
         """
-        # FIXME: BYTES to STR 
-        if type(src) == bytes:
-            src=src.decode()
-        # Get rid of the comments
-        src = self.re_comment.sub('', src)
-
         # [ CHARSET_SYM S* STRING S* ';' ]?
-        src = self._parseAtCharset(src)
+        pos = self._parseAtCharset(src, pos)
 
         # [S|CDO|CDC]*
-        src = self._parseSCDOCDC(src)
+        pos = self._parseSCDOCDC(src, pos)
         #  [ import [S|CDO|CDC]* ]*
-        src, stylesheetImports = self._parseAtImports(src)
+        pos, stylesheetImports = self._parseAtImports(src, pos)
 
         # [ namespace [S|CDO|CDC]* ]*
-        src = self._parseAtNamespace(src)
+        pos = self._parseAtNamespace(src, pos)
 
         stylesheetElements = []
 
         # [ [ ruleset | atkeywords ] [S|CDO|CDC]* ]*
-        while src: # due to ending with ]*
-            if src.startswith('@'):
+        end = len(src)
+        while pos < end: # due to ending with ]*
+            if src.startswith('@', pos):
                 # @media, @page, @font-face
-                src, atResults = self._parseAtKeyword(src)
+                pos, atResults = self._parseAtKeyword(src, pos)
                 if atResults is not None and atResults != NotImplemented:
                     stylesheetElements.extend(atResults)
             else:
                 # ruleset
-                src, ruleset = self._parseRuleset(src)
+                pos, ruleset = self._parseRuleset(src, pos)
                 stylesheetElements.append(ruleset)
 
             # [S|CDO|CDC]*
-            src = self._parseSCDOCDC(src)
+            pos = self._parseSCDOCDC(src, pos)
 
         stylesheet = self.cssBuilder.stylesheet(stylesheetElements, stylesheetImports)
-        return src, stylesheet
+        return pos, stylesheet
 
 
-    def _parseSCDOCDC(self, src):
+    def _parseSCDOCDC(self, src, pos):
         """[S|CDO|CDC]*"""
         while 1:
-            src = src.lstrip()
-            if src.startswith('<!--'):
-                src = src[4:]
-            elif src.startswith('-->'):
-                src = src[3:]
+            pos = self._skipWhitespace(src, pos)
+            if src.startswith('<!--', pos):
+                pos += 4
+            elif src.startswith('-->', pos):
+                pos += 3
             else:
                 break
-        return src
+        return pos
 
 
     # ~ CSS @ directives ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-    def _parseAtCharset(self, src):
+    def _parseAtCharset(self, src, pos):
         """[ CHARSET_SYM S* STRING S* ';' ]?"""
-        if isAtRuleIdent(src, 'charset'):
-            src = stripAtRuleIdent(src)
-            charset, src = self._getString(src)
-            src = src.lstrip()
-            if src[:1] != ';':
-                raise self.ParseError('@charset expected a terminating \';\'', src, self.ctxsrc)
-            src = src[1:].lstrip()
+        if isAtRuleIdent(src, 'charset', pos):
+            ctxpos = pos
+            pos = skipAtRuleIdent(src, pos)
+            charset, pos = self._getString(src, pos)
+            pos = self._skipWhitespace(src, pos)
+            if not src.startswith(';', pos):
+                raise self.ParseError('@charset expected a terminating \';\'', src[pos:], src[ctxpos:])
+            pos = self._skipWhitespace(src, pos + 1)
 
             self.cssBuilder.atCharset(charset)
-        return src
+        return pos
 
 
-    def _parseAtImports(self, src):
+    def _parseAtImports(self, src, pos):
         """[ import [S|CDO|CDC]* ]*"""
         result = []
-        while isAtRuleIdent(src, 'import'):
-            ctxsrc = src
-            src = stripAtRuleIdent(src)
+        while isAtRuleIdent(src, 'import', pos):
+            ctxpos = pos
+            pos = skipAtRuleIdent(src, pos)
 
-            import_, src = self._getStringOrURI(src)
+            import_, pos = self._getStringOrURI(src, pos)
             if import_ is None:
-                raise self.ParseError('Import expecting string or url', src, ctxsrc)
+                raise self.ParseError('Import expecting string or url', src[pos:], src[ctxpos:])
 
             mediums = []
-            medium, src = self._getIdent(src.lstrip())
+            medium, pos = self._getIdent(src, self._skipWhitespace(src, pos))
             while medium is not None:
                 mediums.append(medium)
-                if src[:1] == ',':
-                    src = src[1:].lstrip()
-                    medium, src = self._getIdent(src)
+                if src.startswith(',', pos):
+                    pos = self._skipWhitespace(src, pos + 1)
+                    medium, pos = self._getIdent(src, pos)
                 else:
                     break
 
@@ -611,131 +629,126 @@ class CSSParser(object):
             if not mediums:
                 mediums = ["all"]
 
-            if src[:1] != ';':
-                raise self.ParseError('@import expected a terminating \';\'', src, ctxsrc)
-            src = src[1:].lstrip()
+            if not src.startswith(';', pos):
+                raise self.ParseError('@import expected a terminating \';\'', src[pos:], src[ctxpos:])
+            pos = self._skipWhitespace(src, pos + 1)
 
             stylesheet = self.cssBuilder.atImport(import_, mediums, self)
             if stylesheet is not None:
                 result.append(stylesheet)
 
-            src = self._parseSCDOCDC(src)
-        return src, result
+            pos = self._parseSCDOCDC(src, pos)
+        return pos, result
 
 
-    def _parseAtNamespace(self, src):
+    def _parseAtNamespace(self, src, pos):
         """namespace :
 
         @namespace S* [IDENT S*]? [STRING|URI] S* ';' S*
         """
 
-        src = self._parseSCDOCDC(src)
-        while isAtRuleIdent(src, 'namespace'):
-            ctxsrc = src
-            src = stripAtRuleIdent(src)
+        pos = self._parseSCDOCDC(src, pos)
+        while isAtRuleIdent(src, 'namespace', pos):
+            ctxpos = pos
+            pos = skipAtRuleIdent(src, pos)
 
-            namespace, src = self._getStringOrURI(src)
+            namespace, pos = self._getStringOrURI(src, pos)
             if namespace is None:
-                nsPrefix, src = self._getIdent(src)
+                nsPrefix, pos = self._getIdent(src, pos)
                 if nsPrefix is None:
-                    raise self.ParseError('@namespace expected an identifier or a URI', src, ctxsrc)
-                namespace, src = self._getStringOrURI(src.lstrip())
+                    raise self.ParseError('@namespace expected an identifier or a URI', src[pos:], src[ctxpos:])
+                namespace, pos = self._getStringOrURI(src, self._skipWhitespace(src, pos))
                 if namespace is None:
-                    raise self.ParseError('@namespace expected a URI', src, ctxsrc)
+                    raise self.ParseError('@namespace expected a URI', src[pos:], src[ctxpos:])
             else:
                 nsPrefix = None
 
-            src = src.lstrip()
-            if src[:1] != ';':
-                raise self.ParseError('@namespace expected a terminating \';\'', src, ctxsrc)
-            src = src[1:].lstrip()
+            pos = self._skipWhitespace(src, pos)
+            if not src.startswith(';', pos):
+                raise self.ParseError('@namespace expected a terminating \';\'', src[pos:], src[ctxpos:])
+            pos = self._skipWhitespace(src, pos + 1)
 
             self.cssBuilder.atNamespace(nsPrefix, namespace)
 
-            src = self._parseSCDOCDC(src)
-        return src
+            pos = self._parseSCDOCDC(src, pos)
+        return pos
 
 
-    def _parseAtKeyword(self, src):
+    def _parseAtKeyword(self, src, pos):
         """[media | page | font_face | unknown_keyword]"""
-        ctxsrc = src
-        if isAtRuleIdent(src, 'media'):
-            src, result = self._parseAtMedia(src)
-        elif isAtRuleIdent(src, 'page'):
-            src, result = self._parseAtPage(src)
-        elif isAtRuleIdent(src, 'font-face'):
-            src, result = self._parseAtFontFace(src)
+        if isAtRuleIdent(src, 'media', pos):
+            pos, result = self._parseAtMedia(src, pos)
+        elif isAtRuleIdent(src, 'page', pos):
+            pos, result = self._parseAtPage(src, pos)
+        elif isAtRuleIdent(src, 'font-face', pos):
+            pos, result = self._parseAtFontFace(src, pos)
         # XXX added @import, was missing!
-        elif isAtRuleIdent(src, 'import'):
-            src, result = self._parseAtImports(src)
-        elif isAtRuleIdent(src, 'frame'):
-            src, result = self._parseAtFrame(src)
-        elif src.startswith('@'):
-            src, result = self._parseAtIdent(src)
+        elif isAtRuleIdent(src, 'import', pos):
+            pos, result = self._parseAtImports(src, pos)
+        elif isAtRuleIdent(src, 'frame', pos):
+            pos, result = self._parseAtFrame(src, pos)
+        elif src.startswith('@', pos):
+            pos, result = self._parseAtIdent(src, pos)
         else:
-            raise self.ParseError('Unknown state in atKeyword', src, ctxsrc)
-        return src, result
+            raise self.ParseError('Unknown state in atKeyword', src[pos:], src[pos:])
+        return pos, result
 
 
-    def _parseAtMedia(self, src):
+    def _parseAtMedia(self, src, pos):
         """media
         : MEDIA_SYM S* medium [ ',' S* medium ]* '{' S* ruleset* '}' S*
         ;
         """
-        ctxsrc = src
-        src = src[len('@media '):].lstrip()
+        ctxpos = pos
+        end = len(src)
+        pos = self._skipWhitespace(src, pos + len('@media '))
         mediums = []
-        while src and src[0] != '{':
-            medium, src = self._getIdent(src)
+        while pos < end and src[pos] != '{':
+            medium, pos = self._getIdent(src, pos)
             # make "and ... {" work
             if medium in (None, 'and'):
                 # default to mediatype "all"
                 if medium is None:
                     mediums.append('all')
                 # strip up to curly bracket
-                pattern = re.compile('.*({.*)')
-                match = re.match(pattern, src)
-                src = src[match.end()-1:]
+                match = self.re_media_query.match(src, pos)
+                pos = match.end() - 1
                 break
             mediums.append(medium)
-            if src[0] == ',':
-                src = src[1:].lstrip()
+            if src.startswith(',', pos):
+                pos = self._skipWhitespace(src, pos + 1)
             else:
-                src = src.lstrip()
+                pos = self._skipWhitespace(src, pos)
 
-        if not src.startswith('{'):
-            raise self.ParseError('Ruleset opening \'{\' not found', src, ctxsrc)
-        src = src[1:].lstrip()
+        if not src.startswith('{', pos):
+            raise self.ParseError('Ruleset opening \'{\' not found', src[pos:], src[ctxpos:])
+        pos = self._skipWhitespace(src, pos + 1)
 
         stylesheetElements = []
-        # while src and not src.startswith('}'):
-        #    src, ruleset = self._parseRuleset(src)
-        #    stylesheetElements.append(ruleset)
-        #    src = src.lstrip()
 
         # Containing @ where not found and parsed
-        while src and not src.startswith('}'):
-            if src.startswith('@'):
+        while pos < end and not src.startswith('}', pos):
+            if src.startswith('@', pos):
                 # @media, @page, @font-face
-                src, atResults = self._parseAtKeyword(src)
+                pos, atResults = self._parseAtKeyword(src, pos)
                 if atResults is not None:
                     stylesheetElements.extend(atResults)
             else:
                 # ruleset
-                src, ruleset = self._parseRuleset(src)
+                pos, ruleset = self._parseRuleset(src, pos)
                 stylesheetElements.append(ruleset)
-            src = src.lstrip()
+            pos = self._skipWhitespace(src, pos)
 
-        if not src.startswith('}'):
-            raise self.ParseError('Ruleset closing \'}\' not found', src, ctxsrc)
+        if not src.startswith('}', pos):
+            raise self.ParseError('Ruleset closing \'}\' not found', src[pos:], src[ctxpos:])
         else:
-            src = src[1:].lstrip()
+            pos = self._skipWhitespace(src, pos + 1)
 
         result = self.cssBuilder.atMedia(mediums, stylesheetElements)
-        return src, result
+        return pos, result
 
 
-    def _parseAtPage(self, src):
+    def _parseAtPage(self, src, pos):
         """page
         : PAGE_SYM S* IDENT? pseudo_page? S*
             '{' S* declaration [ ';' S* declaration ]* '}' S*
@@ -746,36 +759,35 @@ class CSSParser(object):
         pageBorder = None
         isLandscape = False
 
-        ctxsrc = src
-        src = src[len('@page'):].lstrip()
-        page, src = self._getIdent(src)
-        if src[:1] == ':':
-            pseudopage, src = self._getIdent(src[1:])
+        ctxpos = pos
+        end = len(src)
+        pos = self._skipWhitespace(src, pos + len('@page'))
+        page, pos = self._getIdent(src, pos)
+        if src.startswith(':', pos):
+            pseudopage, pos = self._getIdent(src, pos + 1)
             page = page + '_' + pseudopage
         else:
             pseudopage = None
 
-        # src, properties = self._parseDeclarationGroup(src.lstrip())
-
         # Containing @ where not found and parsed
         stylesheetElements = []
-        src = src.lstrip()
+        pos = self._skipWhitespace(src, pos)
         properties = []
 
         # XXX Extended for PDF use
-        if not src.startswith('{'):
-            raise self.ParseError('Ruleset opening \'{\' not found', src, ctxsrc)
+        if not src.startswith('{', pos):
+            raise self.ParseError('Ruleset opening \'{\' not found', src[pos:], src[ctxpos:])
         else:
-            src = src[1:].lstrip()
+            pos = self._skipWhitespace(src, pos + 1)
 
-        while src and not src.startswith('}'):
-            if src.startswith('@'):
+        while pos < end and not src.startswith('}', pos):
+            if src.startswith('@', pos):
                 # @media, @page, @font-face
-                src, atResults = self._parseAtKeyword(src)
+                pos, atResults = self._parseAtKeyword(src, pos)
                 if atResults is not None:
                     stylesheetElements.extend(atResults)
             else:
-                src, nproperties = self._parseDeclarationGroup(src.lstrip(), braces=False)
+                pos, nproperties = self._parseDeclarationGroup(src, self._skipWhitespace(src, pos), braces=False)
                 properties += nproperties
 
                 # Set pagesize, orientation (landscape, portrait)
@@ -819,330 +831,339 @@ class CSSParser(object):
                     if isLandscape:
                         self.c.pageSize = landscape(self.c.pageSize)
 
-            src = src.lstrip()
+            pos = self._skipWhitespace(src, pos)
 
         result = [self.cssBuilder.atPage(page, pseudopage, data, isLandscape, pageBorder)]
 
-        return src[1:].lstrip(), result
+        return self._skipWhitespace(src, pos + 1), result
 
 
-    def _parseAtFrame(self, src):
+    def _parseAtFrame(self, src, pos):
         """
         XXX Proprietary for PDF
         """
-        src = src[len('@frame '):].lstrip()
-        box, src = self._getIdent(src)
-        src, properties = self._parseDeclarationGroup(src.lstrip())
+        pos = self._skipWhitespace(src, pos + len('@frame '))
+        box, pos = self._getIdent(src, pos)
+        pos, properties = self._parseDeclarationGroup(src, self._skipWhitespace(src, pos))
         result = [self.cssBuilder.atFrame(box, properties)]
-        return src.lstrip(), result
+        return self._skipWhitespace(src, pos), result
 
 
-    def _parseAtFontFace(self, src):
-        src = src[len('@font-face'):].lstrip()
-        src, properties = self._parseDeclarationGroup(src)
+    def _parseAtFontFace(self, src, pos):
+        pos = self._skipWhitespace(src, pos + len('@font-face'))
+        pos, properties = self._parseDeclarationGroup(src, pos)
         result = [self.cssBuilder.atFontFace(properties)]
-        return src, result
+        return pos, result
 
 
-    def _parseAtIdent(self, src):
-        ctxsrc = src
-        atIdent, src = self._getIdent(src[1:])
+    def _parseAtIdent(self, src, pos):
+        ctxpos = pos
+        atIdent, pos = self._getIdent(src, pos + 1)
         if atIdent is None:
-            raise self.ParseError('At-rule expected an identifier for the rule', src, ctxsrc)
+            raise self.ParseError('At-rule expected an identifier for the rule', src[pos:], src[ctxpos:])
 
-        src, result = self.cssBuilder.atIdent(atIdent, self, src)
+        # The builder API works on the remaining source
+        rest, result = self.cssBuilder.atIdent(atIdent, self, src[pos:])
+        pos = len(src) - len(rest)
 
         if result is NotImplemented:
             # An at-rule consists of everything up to and including the next semicolon (;)
             # or the next block, whichever comes first
 
-            semiIdx = src.find(';')
+            semiIdx = src.find(';', pos)
             if semiIdx < 0:
                 semiIdx = None
-            blockIdx = src[:semiIdx].find('{')
+            blockIdx = src.find('{', pos, semiIdx)
             if blockIdx < 0:
                 blockIdx = None
 
-            if semiIdx is not None and semiIdx < blockIdx:
-                src = src[semiIdx + 1:].lstrip()
+            if semiIdx is not None and blockIdx is None:
+                pos = semiIdx + 1
             elif blockIdx is None:
                 # consume the rest of the content since we didn't find a block or a semicolon
-                src = src[-1:-1]
-            elif blockIdx is not None:
+                pos = len(src)
+            else:
                 # expecing a block...
-                src = src[blockIdx:]
+                pos = blockIdx
                 try:
                     # try to parse it as a declarations block
-                    src, declarations = self._parseDeclarationGroup(src)
+                    pos, declarations = self._parseDeclarationGroup(src, pos)
                 except self.ParseError:
                     # try to parse it as a stylesheet block
-                    src, stylesheet = self._parseStylesheet(src)
-            else:
-                raise self.ParserError('Unable to ignore @-rule block', src, ctxsrc)
+                    pos, stylesheet = self._parseStylesheet(src, pos)
 
-        return src.lstrip(), result
+        return self._skipWhitespace(src, pos), result
 
 
     # ~ ruleset - see selector and declaration groups ~~~~
 
-    def _parseRuleset(self, src):
+    def _parseRuleset(self, src, pos):
         """ruleset
         : selector [ ',' S* selector ]*
             '{' S* declaration [ ';' S* declaration ]* '}' S*
         ;
         """
-        src, selectors = self._parseSelectorGroup(src)
-        src, properties = self._parseDeclarationGroup(src.lstrip())
+        pos, selectors = self._parseSelectorGroup(src, pos)
+        pos, properties = self._parseDeclarationGroup(src, self._skipWhitespace(src, pos))
         result = self.cssBuilder.ruleset(selectors, properties)
-        return src, result
+        return pos, result
 
 
     # ~ selector parsing ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-    def _parseSelectorGroup(self, src):
+    def _parseSelectorGroup(self, src, pos):
         selectors = []
-        while src[:1] not in ('{', '}', ']', '(', ')', ';', ''):
-            src, selector = self._parseSelector(src)
+        while src[pos:pos + 1] not in ('{', '}', ']', '(', ')', ';', ''):
+            pos, selector = self._parseSelector(src, pos)
             if selector is None:
                 break
             selectors.append(selector)
-            if src.startswith(','):
-                src = src[1:].lstrip()
-        return src, selectors
+            if src.startswith(',', pos):
+                pos = self._skipWhitespace(src, pos + 1)
+        return pos, selectors
 
 
-    def _parseSelector(self, src):
+    def _parseSelector(self, src, pos):
         """selector
         : simple_selector [ combinator simple_selector ]*
         ;
         """
-        src, selector = self._parseSimpleSelector(src)
-        srcLen = len(src) # XXX
-        while src[:1] not in ('', ',', ';', '{', '}', '[', ']', '(', ')'):
+        pos, selector = self._parseSimpleSelector(src, pos)
+        end = len(src)
+        startPos = pos # XXX
+        while src[pos:pos + 1] not in ('', ',', ';', '{', '}', '[', ']', '(', ')'):
             for combiner in self.SelectorCombiners:
-                if src.startswith(combiner):
-                    src = src[len(combiner):].lstrip()
+                if src.startswith(combiner, pos):
+                    pos = self._skipWhitespace(src, pos + len(combiner))
                     break
             else:
                 combiner = ' '
-            src, selectorB = self._parseSimpleSelector(src)
+            pos, selectorB = self._parseSimpleSelector(src, pos)
 
             # XXX Fix a bug that occured here e.g. : .1 {...}
-            if len(src) >= srcLen:
-                src = src[1:]
-                while src and (src[:1] not in ('', ',', ';', '{', '}', '[', ']', '(', ')')):
-                    src = src[1:]
-                return src.lstrip(), None
+            if pos <= startPos:
+                pos = min(pos + 1, end)
+                while pos < end and src[pos] not in (',', ';', '{', '}', '[', ']', '(', ')'):
+                    pos += 1
+                return self._skipWhitespace(src, pos), None
 
             selector = self.cssBuilder.combineSelectors(selector, combiner, selectorB)
 
-        return src.lstrip(), selector
+        return self._skipWhitespace(src, pos), selector
 
 
-    def _parseSimpleSelector(self, src):
+    def _parseSimpleSelector(self, src, pos):
         """simple_selector
         : [ namespace_selector ]? element_name? [ HASH | class | attrib | pseudo ]* S*
         ;
         """
-        ctxsrc = src.lstrip()
-        nsPrefix, src = self._getMatchResult(self.re_namespace_selector, src)
-        name, src = self._getMatchResult(self.re_element_name, src)
+        ctxpos = self._skipWhitespace(src, pos)
+        nsPrefix, pos = self._getMatchResult(self.re_namespace_selector, src, pos)
+        name, pos = self._getMatchResult(self.re_element_name, src, pos)
         if name:
             pass # already *successfully* assigned
-        elif src[:1] in self.SelectorQualifiers:
+        elif src[pos:pos + 1] in self.SelectorQualifiers:
             name = '*'
         else:
-            raise self.ParseError('Selector name or qualifier expected', src, ctxsrc)
+            raise self.ParseError('Selector name or qualifier expected', src[pos:], src[ctxpos:])
 
         name = self.cssBuilder.resolveNamespacePrefix(nsPrefix, name)
         selector = self.cssBuilder.selector(name)
-        while src and src[:1] in self.SelectorQualifiers:
-            hash_, src = self._getMatchResult(self.re_hash, src)
+        while src[pos:pos + 1] in self.SelectorQualifiers:
+            hash_, pos = self._getMatchResult(self.re_hash, src, pos)
             if hash_ is not None:
                 selector.addHashId(hash_)
                 continue
 
-            class_, src = self._getMatchResult(self.re_class, src)
+            class_, pos = self._getMatchResult(self.re_class, src, pos)
             if class_ is not None:
                 selector.addClass(class_)
                 continue
 
-            if src.startswith('['):
-                src, selector = self._parseSelectorAttribute(src, selector)
-            elif src.startswith(':'):
-                src, selector = self._parseSelectorPseudo(src, selector)
+            if src.startswith('[', pos):
+                pos, selector = self._parseSelectorAttribute(src, pos, selector)
+            elif src.startswith(':', pos):
+                pos, selector = self._parseSelectorPseudo(src, pos, selector)
             else:
                 break
 
-        return src.lstrip(), selector
+        return self._skipWhitespace(src, pos), selector
 
 
-    def _parseSelectorAttribute(self, src, selector):
+    def _parseSelectorAttribute(self, src, pos, selector):
         """attrib
         : '[' S* [ namespace_selector ]? IDENT S* [ [ '=' | INCLUDES | DASHMATCH ] S*
             [ IDENT | STRING ] S* ]? ']'
         ;
         """
-        ctxsrc = src
-        if not src.startswith('['):
-            raise self.ParseError('Selector Attribute opening \'[\' not found', src, ctxsrc)
-        src = src[1:].lstrip()
+        ctxpos = pos
+        if not src.startswith('[', pos):
+            raise self.ParseError('Selector Attribute opening \'[\' not found', src[pos:], src[ctxpos:])
+        pos = self._skipWhitespace(src, pos + 1)
 
-        nsPrefix, src = self._getMatchResult(self.re_namespace_selector, src)
-        attrName, src = self._getIdent(src)
+        nsPrefix, pos = self._getMatchResult(self.re_namespace_selector, src, pos)
+        attrName, pos = self._getIdent(src, pos)
 
-        src = src.lstrip()
+        pos = self._skipWhitespace(src, pos)
 
         if attrName is None:
-            raise self.ParseError('Expected a selector attribute name', src, ctxsrc)
+            raise self.ParseError('Expected a selector attribute name', src[pos:], src[ctxpos:])
         if nsPrefix is not None:
             attrName = self.cssBuilder.resolveNamespacePrefix(nsPrefix, attrName)
 
         for op in self.AttributeOperators:
-            if src.startswith(op):
+            if src.startswith(op, pos):
                 break
         else:
             op = ''
-        src = src[len(op):].lstrip()
+        pos = self._skipWhitespace(src, pos + len(op))
 
         if op:
-            attrValue, src = self._getIdent(src)
+            attrValue, pos = self._getIdent(src, pos)
             if attrValue is None:
-                attrValue, src = self._getString(src)
+                attrValue, pos = self._getString(src, pos)
                 if attrValue is None:
-                    raise self.ParseError('Expected a selector attribute value', src, ctxsrc)
+                    raise self.ParseError('Expected a selector attribute value', src[pos:], src[ctxpos:])
         else:
             attrValue = None
 
-        if not src.startswith(']'):
-            raise self.ParseError('Selector Attribute closing \']\' not found', src, ctxsrc)
+        if not src.startswith(']', pos):
+            raise self.ParseError('Selector Attribute closing \']\' not found', src[pos:], src[ctxpos:])
         else:
-            src = src[1:]
+            pos += 1
 
         if op:
             selector.addAttributeOperation(attrName, op, attrValue)
         else:
             selector.addAttribute(attrName)
-        return src, selector
+        return pos, selector
 
 
-    def _parseSelectorPseudo(self, src, selector):
+    def _parseSelectorPseudo(self, src, pos, selector):
         """pseudo
         : ':' [ IDENT | function ]
         ;
         """
-        ctxsrc = src
-        if not src.startswith(':'):
-            raise self.ParseError('Selector Pseudo \':\' not found', src, ctxsrc)
-        src = re.search('^:{1,2}(.*)', src, re.M | re.S).group(1)
+        ctxpos = pos
+        if not src.startswith(':', pos):
+            raise self.ParseError('Selector Pseudo \':\' not found', src[pos:], src[ctxpos:])
+        pos += 2 if src.startswith('::', pos) else 1
 
-        name, src = self._getIdent(src)
+        name, pos = self._getIdent(src, pos)
         if not name:
-            raise self.ParseError('Selector Pseudo identifier not found', src, ctxsrc)
+            raise self.ParseError('Selector Pseudo identifier not found', src[pos:], src[ctxpos:])
 
-        if src.startswith('('):
+        if src.startswith('(', pos):
             # function
-            src = src[1:].lstrip()
-            src, term = self._parseExpression(src, True)
-            if not src.startswith(')'):
-                raise self.ParseError('Selector Pseudo Function closing \')\' not found', src, ctxsrc)
-            src = src[1:]
+            pos = self._skipWhitespace(src, pos + 1)
+            pos, term = self._parseExpression(src, pos, True)
+            if not src.startswith(')', pos):
+                raise self.ParseError('Selector Pseudo Function closing \')\' not found', src[pos:], src[ctxpos:])
+            pos += 1
             selector.addPseudoFunction(name, term)
         else:
             selector.addPseudo(name)
 
-        return src, selector
+        return pos, selector
 
 
     # ~ declaration and expression parsing ~~~~~~~~~~~~~~~
 
-    def _parseDeclarationGroup(self, src, braces=True):
-        ctxsrc = src
-        if src.startswith('{'):
-            src, braces = src[1:], True
+    def _parseDeclarationGroup(self, src, pos, braces=True):
+        ctxpos = pos
+        if src.startswith('{', pos):
+            pos, braces = pos + 1, True
         elif braces:
-            raise self.ParseError('Declaration group opening \'{\' not found', src, ctxsrc)
+            raise self.ParseError('Declaration group opening \'{\' not found', src[pos:], src[ctxpos:])
 
         properties = []
-        src = src.lstrip()
-        while src[:1] not in ('', ',', '{', '}', '[', ']', '(', ')', '@'): # XXX @?
-            src, single_property = self._parseDeclaration(src)
-
-            # XXX Workaround for styles like "*font: smaller"
-            if src.startswith("*"):
-                src = "-nothing-" + src[1:]
+        namePrefix = ''
+        pos = self._skipWhitespace(src, pos)
+        while namePrefix or src[pos:pos + 1] not in ('', ',', '{', '}', '[', ']', '(', ')', '@'): # XXX @?
+            pos, single_property = self._parseDeclaration(src, pos, namePrefix)
+            namePrefix = ''
+
+            # XXX Workaround for styles like "*font: smaller", which are
+            # read as "-nothing-font: smaller"
+            if src.startswith("*", pos):
+                pos += 1
+                namePrefix = "-nothing-"
                 continue
 
             if single_property is None:
-                src = src[1:].lstrip()
+                pos = self._skipWhitespace(src, pos + 1)
                 break
             properties.append(single_property)
-            if src.startswith(';'):
-                src = src[1:].lstrip()
+            if src.startswith(';', pos):
+                pos = self._skipWhitespace(src, pos + 1)
             else:
                 break
 
         if braces:
-            if not src.startswith('}'):
-                raise self.ParseError('Declaration group closing \'}\' not found', src, ctxsrc)
-            src = src[1:]
+            if not src.startswith('}', pos):
+                raise self.ParseError('Declaration group closing \'}\' not found', src[pos:], src[ctxpos:])
+            pos += 1
 
-        return src.lstrip(), properties
+        return self._skipWhitespace(src, pos), properties
 
 
-    def _parseDeclaration(self, src):
+    def _parseDeclaration(self, src, pos, namePrefix=''):
         """declaration
         : ident S* ':' S* expr prio?
         | /* empty */
         ;
         """
         # property
-        propertyName, src = self._getIdent(src)
+        if namePrefix:
+            match = self.re_nmchars.match(src, pos)
+            propertyName, pos = namePrefix + match.group(0), match.end()
+        else:
+            propertyName, pos = self._getIdent(src, pos)
 
         if propertyName is not None:
-            src = src.lstrip()
+            pos = self._skipWhitespace(src, pos)
             # S* : S*
-            if src[:1] in (':', '='):
+            if src[pos:pos + 1] in (':', '='):
                 # Note: we are being fairly flexable here...  technically, the
                 # ":" is *required*, but in the name of flexibility we
                 # suppor a null transition, as well as an "=" transition
-                src = src[1:].lstrip()
+                pos = self._skipWhitespace(src, pos + 1)
 
-            src, single_property = self._parseDeclarationProperty(src, propertyName)
+            pos, single_property = self._parseDeclarationProperty(src, pos, propertyName)
         else:
             single_property = None
 
-        return src, single_property
+        return pos, single_property
 
 
-    def _parseDeclarationProperty(self, src, propertyName):
+    def _parseDeclarationProperty(self, src, pos, propertyName):
         # expr
-        src, expr = self._parseExpression(src)
+        pos, expr = self._parseExpression(src, pos)
 
         # prio?
-        important, src = self._getMatchResult(self.re_important, src)
-        src = src.lstrip()
+        important, pos = self._getMatchResult(self.re_important, src, pos)
+        pos = self._skipWhitespace(src, pos)
 
         single_property = self.cssBuilder.property(propertyName, expr, important)
-        return src, single_property
+        return pos, single_property
 
 
-    def _parseExpression(self, src, returnList=False):
+    def _parseExpression(self, src, pos, returnList=False):
         """
         expr
         : term [ operator term ]*
         ;
         """
-        src, term = self._parseExpressionTerm(src)
+        pos, term = self._parseExpressionTerm(src, pos)
         operator = None
-        while src[:1] not in ('', ';', '{', '}', '[', ']', ')'):
+        while src[pos:pos + 1] not in ('', ';', '{', '}', '[', ']', ')'):
             for operator in self.ExpressionOperators:
-                if src.startswith(operator):
-                    src = src[len(operator):]
+                if src.startswith(operator, pos):
+                    pos += len(operator)
                     break
             else:
                 operator = ' '
-            src, term2 = self._parseExpressionTerm(src.lstrip())
+            pos, term2 = self._parseExpressionTerm(src, self._skipWhitespace(src, pos))
             if term2 is NotImplemented:
                 break
             else:
@@ -1150,12 +1171,12 @@ class CSSParser(object):
 
         if operator is None and returnList:
             term = self.cssBuilder.combineTerms(term, None, None)
-            return src, term
+            return pos, term
         else:
-            return src, term
+            return pos, term
 
 
-    def _parseExpressionTerm(self, src):
+    def _parseExpressionTerm(self, src, pos):
         """term
         : unary_operator?
             [ NUMBER S* | PERCENTAGE S* | LENGTH S* | EMS S* | EXS S* | ANGLE S* |
@@ -1163,75 +1184,84 @@ class CSSParser(object):
         | STRING S* | IDENT S* | URI S* | RGB S* | UNICODERANGE S* | hexcolor
         ;
         """
-        ctxsrc = src
+        ctxpos = pos
 
-        result, src = self._getMatchResult(self.re_num, src)
+        result, pos = self._getMatchResult(self.re_num, src, pos)
         if result is not None:
-            units, src = self._getMatchResult(self.re_unit, src)
+            units, pos = self._getMatchResult(self.re_unit, src, pos)
             term = self.cssBuilder.termNumber(result, units)
-            return src.lstrip(), term
+            return self._skipWhitespace(src, pos), term
 
-        result, src = self._getString(src, self.re_uri)
+        result, pos = self._getString(src, pos, self.re_uri)
         if result is not None:
             # XXX URL!!!!
             term = self.cssBuilder.termURI(result)
-            return src.lstrip(), term
+            return self._skipWhitespace(src, pos), term
 
-        result, src = self._getString(src)
+        result, pos = self._getString(src, pos)
         if result is not None:
             term = self.cssBuilder.termString(result)
-            return src.lstrip(), term
+            return self._skipWhitespace(src, pos), term
 
-        result, src = self._getMatchResult(self.re_functionterm, src)
+        result, pos = self._getMatchResult(self.re_functionterm, src, pos)
         if result is not None:
-            src, params = self._parseExpression(src, True)
-            if src[0] != ')':
-                raise self.ParseError('Terminal function expression expected closing \')\'', src, ctxsrc)
-            src = src[1:].lstrip()
+            pos, params = self._parseExpression(src, pos, True)
+            if not src.startswith(')', pos):
+                raise self.ParseError('Terminal function expression expected closing \')\'', src[pos:], src[ctxpos:])
+            pos = self._skipWhitespace(src, pos + 1)
             term = self.cssBuilder.termFunction(result, params)
-            return src, term
+            return pos, term
 
-        result, src = self._getMatchResult(self.re_rgbcolor, src)
+        result, pos = self._getMatchResult(self.re_rgbcolor, src, pos)
         if result is not None:
             term = self.cssBuilder.termRGB(result)
-            return src.lstrip(), term
+            return self._skipWhitespace(src, pos), term
 
-        result, src = self._getMatchResult(self.re_unicoderange, src)
+        result, pos = self._getMatchResult(self.re_unicoderange, src, pos)
         if result is not None:
             term = self.cssBuilder.termUnicodeRange(result)
-            return src.lstrip(), term
+            return self._skipWhitespace(src, pos), term
 
-        nsPrefix, src = self._getMatchResult(self.re_namespace_selector, src)
-        result, src = self._getIdent(src)
+        nsPrefix, pos = self._getMatchResult(self.re_namespace_selector, src, pos)
+        result, pos = self._getIdent(src, pos)
         if result is not None:
             if nsPrefix is not None:
                 result = self.cssBuilder.resolveNamespacePrefix(nsPrefix, result)
             term = self.cssBuilder.termIdent(result)
-            return src.lstrip(), term
+            return self._skipWhitespace(src, pos), term
 
-        result, src = self._getMatchResult(self.re_unicodeid, src)
+        result, pos = self._getMatchResult(self.re_unicodeid, src, pos)
         if result is not None:
             term = self.cssBuilder.termIdent(result)
-            return src.lstrip(), term
+            return self._skipWhitespace(src, pos), term
 
-        result, src = self._getMatchResult(self.re_unicodestr, src)
+        result, pos = self._getMatchResult(self.re_unicodestr, src, pos)
         if result is not None:
             term = self.cssBuilder.termString(result)
-            return src.lstrip(), term
+            return self._skipWhitespace(src, pos), term
 
-        return self.cssBuilder.termUnknown(src)
+        # The builder API works on the remaining source, only hand it the
+        # rest of the current declaration
+        match = self.re_declaration_end.search(src, pos)
+        end = match.start() if match else len(src)
+        rest, term = self.cssBuilder.termUnknown(src[pos:end])
+        return end - len(rest), term
 
 
     # ~ utility methods ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-    def _getIdent(self, src, default=None):
-        return self._getMatchResult(self.re_ident, src, default)
+    def _skipWhitespace(self, src, pos):
+        return self.re_whitespace.match(src, pos).end()
 
 
-    def _getString(self, src, rexpression=None, default=None):
+    def _getIdent(self, src, pos, default=None):
+        return self._getMatchResult(self.re_ident, src, pos, default)
+
+
+    def _getString(self, src, pos, rexpression=None, default=None):
         if rexpression is None:
             rexpression = self.re_string
-        result = rexpression.match(src)
+        result = rexpression.match(src, pos)
         if result:
             strres = tuple(filter(None, result.groups()))
             if strres:
@@ -1241,22 +1271,21 @@ class CSSParser(object):
                     strres = result.groups()[0]
             else:
                 strres = ''
-            return strres, src[result.end():]
+            return strres, result.end()
         else:
-            return default, src
+            return default, pos
 
 
-    def _getStringOrURI(self, src):
-        result, src = self._getString(src, self.re_uri)
+    def _getStringOrURI(self, src, pos):
+        result, pos = self._getString(src, pos, self.re_uri)
         if result is None:
-            result, src = self._getString(src)
-        return result, src
+            result, pos = self._getString(src, pos)
+        return result, pos
 
 
-    def _getMatchResult(self, rexpression, src, default=None, group=1):
-        result = rexpression.match(src)
+    def _getMatchResult(self, rexpression, src, pos, default=None, group=1):
+        result = rexpression.match(src, pos)
         if result:
-            return result.group(group), src[result.end():]
+            return result.group(group), result.end()
         else:
-            return default, src
-
+            return default, pos